@@ -1,8 +1,8 @@
 import cv2
 import numpy as np
-import pytesseract
 import speech_recognition as sr
 from ultralytics import YOLO
+import asyncio
 import base64
 import io
 import os
@@ -13,9 +13,13 @@ from typing import List, Dict, Optional, Tuple
 from fastapi import UploadFile
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from .ocr import enhance_image_for_ocr, ocr_document
+from .priority import analyze_repair_priority, determine_repair_priority
+from .metrics import observe_stage, openai_http_client
+from .usage import BUDGET_ECONOMY, BudgetExceeded, budgeted_call, economy_image, track_usage
 
 load_dotenv()
-_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
 
 # Caregar modelo YOLO para detecção de objetos (será baixado automaticamente)
 # Usaremos YOLOv8n (nano) para ser mais rápido
@@ -126,17 +130,20 @@ async def enhanced_image_analysis(file: UploadFile, item_type: str = "geral") ->
         prompt = SPECIALIZED_PROMPTS.get(item_type.lower(), "Descreva detalhadamente o estado deste item imobiliário.")
         ai_analysis = await analyze_image_with_specialized_prompt(file, prompt)
         
-        # Determinar prioridade de reparo
-        priority = determine_repair_priority(ai_analysis)
+        # Determinar prioridade de reparo (com os trechos que a justificam)
+        priority = analyze_repair_priority(ai_analysis)
         
         return {
             "ai_analysis": ai_analysis,
             "detected_objects": detected_objects,
             "item_type": item_type,
-            "repair_priority": priority,
+            "repair_priority": priority["priority"],
+            "priority_evidence": priority["evidence"],
             "specialized_analysis": True
         }
         
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"Erro na análise aprimorada: {e}")
         # Fallback para análise básica
@@ -160,7 +167,8 @@ def detect_objects_in_image(image_data: bytes) -> List[Dict]:
         image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         # Detectar objetos
-        results = yolo_model(image)
+        with observe_stage('yolo'):
+            results = yolo_model(image)
         
         detected = []
         for r in results:
@@ -192,71 +200,56 @@ async def analyze_image_with_specialized_prompt(file: UploadFile, prompt: str) -
         # Resetar posição do arquivo
         await file.seek(0)
         data = await file.read()
-        b64 = base64.b64encode(data).decode('utf-8')
-        
-        # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
-        response = await _client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": f"Você é um especialista em vistoria imobiliária. {prompt}"
-                        },
+        text = f"Você é um especialista em vistoria imobiliária. {prompt}"
+        
+        async def call(mode: str) -> str:
+            image, mime = (data, file.content_type or 'image/jpeg')
+            if mode == BUDGET_ECONOMY:
+                image, mime = economy_image(image, mime)
+            image_url = {"url": f"data:{mime};base64,{base64.b64encode(image).decode('utf-8')}"}
+            if mode == BUDGET_ECONOMY:
+                image_url["detail"] = "low"
+            # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
+            async with track_usage('analyze_image_with_specialized_prompt', "gpt-4o-mini-2024-07-18", mode) as tracked:
+                response = await _client.chat.completions.create(
+                    model="gpt-4o-mini-2024-07-18",
+                    messages=[
                         {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{file.content_type or 'image/jpeg'};base64,{b64}"
-                            }
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text", 
+                                    "text": text
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": image_url
+                                }
+                            ]
                         }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
-        return response.choices[0].message.content or ""
+                    ],
+                    max_tokens=500
+                )
+                tracked.record(response)
+            return response.choices[0].message.content or ""
+        
+        return await budgeted_call(
+            'analyze_image_with_specialized_prompt', "gpt-4o-mini-2024-07-18", text.encode() + data, call
+        ) or ""
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"Erro na análise de imagem: {e}")
         return "Erro na análise da imagem"
 
-def determine_repair_priority(analysis: str) -> str:
-    """Determina prioridade de reparo baseado na análise"""
-    analysis_lower = analysis.lower()
-    
-    # Palavras-chave para diferentes prioridades
-    critical_keywords = ['vazamento', 'infiltração', 'rachadura estrutural', 'perigo', 'risco', 'quebrado', 'não funciona']
-    high_keywords = ['danificado', 'substituição', 'troca necessária', 'reparo urgente', 'deteriorado']
-    medium_keywords = ['desgaste', 'manchas', 'riscos', 'ajuste necessário', 'limpeza profunda']
-    
-    for keyword in critical_keywords:
-        if keyword in analysis_lower:
-            return 'critical'
-    
-    for keyword in high_keywords:
-        if keyword in analysis_lower:
-            return 'high'
-    
-    for keyword in medium_keywords:
-        if keyword in analysis_lower:
-            return 'medium'
-    
-    return 'low'
-
 async def extract_text_from_document(file: UploadFile) -> Dict:
     """Extrai texto de documentos usando OCR"""
     try:
         image_data = await file.read()
         
-        # Converter para imagem PIL
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Melhorar qualidade da imagem para OCR
-        image = enhance_image_for_ocr(image)
-        
-        # Extrair texto usando Tesseract
-        text = pytesseract.image_to_string(image, lang='por')
+        # Dividir em páginas, pré-processar e rodar o Tesseract em paralelo
+        ocr_result = await asyncio.to_thread(ocr_document, image_data)
+        text = ocr_result["text"]
         
         # Tentar extrair informações específicas
         extracted_info = extract_document_info(text)
@@ -264,6 +257,8 @@ async def extract_text_from_document(file: UploadFile) -> Dict:
         return {
             "raw_text": text,
             "extracted_info": extracted_info,
+            "page_count": ocr_result["page_count"],
+            "cached_pages": ocr_result["cached_pages"],
             "success": True
         }
         
@@ -276,52 +271,29 @@ async def extract_text_from_document(file: UploadFile) -> Dict:
             "error": str(e)
         }
 
-def enhance_image_for_ocr(image: Image.Image) -> Image.Image:
-    """Melhora qualidade da imagem para OCR"""
-    try:
-        # Converter para escala de cinza
-        if image.mode != 'L':
-            image = image.convert('L')
-        
-        # Converter para array numpy
-        img_array = np.array(image)
-        
-        # Aplicar threshold para binarização
-        _, thresh = cv2.threshold(img_array, 127, 255, cv2.THRESH_BINARY)
-        
-        # Remover ruído
-        kernel = np.ones((1,1), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
-        
-        # Converter de volta para PIL
-        enhanced = Image.fromarray(cleaned)
-        return enhanced
-        
-    except Exception as e:
-        print(f"Erro no enhancement da imagem: {e}")
-        return image
+# Campos de documentos numa única expressão: o texto do OCR é percorrido uma vez.
+# Em trechos sobrepostos vale o campo que aparece primeiro na alternância
+# (um CPF não é relatado também como RG, nem um telefone como CEP). O lookahead
+# descarta de uma vez as posições que não podem iniciar um campo numérico, e o
+# grupo _local (lookahead + referência, sem retrocesso) evita reexaminar cada
+# palavra letra a letra em busca de um e-mail.
+DOCUMENT_FIELDS_RE = re.compile(r"""
+    (?=[\d(])(?:
+        (?P<cpf>\d{3}\.?\d{3}\.?\d{3}-?\d{2})
+      | (?P<rg>\d{1,2}\.?\d{3}\.?\d{3}-?[0-9X])
+      | (?P<telefone>\(?\d{2}\)?\s*\d{4,5}-?\d{4})
+      | (?P<cep>\d{5}-?\d{3}))
+  | (?P<email>(?=(?P<_local>[a-zA-Z0-9._%+-]+))(?P=_local)@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})
+  | (?:NOME|Nome):\s*(?P<nome>[A-ZÁÊÂÔÇÕ][a-záêâôçõ\s]+)
+""", re.VERBOSE)
 
 def extract_document_info(text: str) -> Dict:
     """Extrai informações específicas de documentos"""
-    import re
-    
     info = {}
     
-    # Padrões para extrair informações
-    patterns = {
-        'cpf': r'\d{3}\.?\d{3}\.?\d{3}-?\d{2}',
-        'rg': r'\d{1,2}\.?\d{3}\.?\d{3}-?[0-9X]',
-        'telefone': r'\(?(\d{2})\)?\s*\d{4,5}-?\d{4}',
-        'email': r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
-        'cep': r'\d{5}-?\d{3}',
-        'nome': r'(?:NOME|Nome):\s*([A-ZÁÊÂÔÇÕ][a-záêâôçõ\s]+)'
-    }
-    
-    for field, pattern in patterns.items():
-        matches = re.findall(pattern, text)
-        if matches:
-            info[field] = matches
+    for match in DOCUMENT_FIELDS_RE.finditer(text):
+        field = match.lastgroup
+        info.setdefault(field, []).append(match.group(field))
     
     return info
 
@@ -341,6 +313,8 @@ async def transcribe_audio_enhanced(file: UploadFile) -> Dict:
             "enhanced": True
         }
         
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"Erro na transcrição aprimorada: {e}")
         return {
@@ -350,72 +324,80 @@ async def transcribe_audio_enhanced(file: UploadFile) -> Dict:
             "error": str(e)
         }
 
+# Comandos de voz numa única expressão com grupos nomeados, compilada uma vez.
+# "X está Y" é ancorado em "está"; o item (X) é recuperado depois, a partir das
+# últimas palavras da frase, o que mantém a varredura linear em transcrições longas.
+VOICE_COMMANDS_RE = re.compile(r"""
+    marcar?\s+(?P<marcar_item>[^.,;!?\n]+?)\s+como\s+(?P<marcar_status>ok|danificado|sujo|ausente)
+  | \s+está\s+(?P<esta_status>ok|danificado|sujo|ausente)
+  | (?P<proximo_comodo>próximo\s+cômodo|próxima\s+sala|avançar)
+  | (?:observação|anotar|nota):\s*(?P<nota>[^.!?\n]+)
+""", re.VERBOSE)
+CLAUSE_BOUNDARY_RE = re.compile(r'[.,;!?\n]')
+STATUS_ITEM_MAX_WORDS = 6
+
+VOICE_COMMAND_ACTIONS = {
+    'marcar_status': 'set_status',
+    'proximo_comodo': 'next_room',
+    'adicionar_observacao': 'add_note'
+}
+
+def _status_item(text: str, start: int, end: int) -> str:
+    """Últimas palavras da frase antes de "está" (item do comando)"""
+    clause = CLAUSE_BOUNDARY_RE.split(text[start:end])[-1]
+    return ' '.join(clause.split()[-STATUS_ITEM_MAX_WORDS:])
+
 def detect_voice_commands(text: str) -> List[Dict]:
     """Detecta comandos de voz no texto transcrito"""
-    commands = []
+    found = {}
     text_lower = text.lower()
+    previous_end = 0
     
-    # Padrões de comandos
-    command_patterns = {
-        'marcar_status': {
-            'patterns': [r'marcar?\s+(.+?)\s+como\s+(ok|danificado|sujo|ausente)', 
-                        r'(.+?)\s+está\s+(ok|danificado|sujo|ausente)'],
-            'action': 'set_status'
-        },
-        'proximo_comodo': {
-            'patterns': [r'próximo\s+cômodo', r'próxima\s+sala', r'avançar'],
-            'action': 'next_room'
-        },
-        'adicionar_observacao': {
-            'patterns': [r'observação:\s*(.+)', r'anotar:\s*(.+)', r'nota:\s*(.+)'],
-            'action': 'add_note'
-        }
-    }
-    
-    for command_type, config in command_patterns.items():
-        for pattern in config['patterns']:
-            matches = re.findall(pattern, text_lower)
-            if matches:
-                commands.append({
-                    'type': command_type,
-                    'action': config['action'],
-                    'matches': matches
-                })
+    for match in VOICE_COMMANDS_RE.finditer(text_lower):
+        group = match.lastgroup
+        if group == 'marcar_status':
+            found.setdefault('marcar_status', []).append((match.group('marcar_item').strip(), match.group(group)))
+        elif group == 'esta_status':
+            item = _status_item(text_lower, previous_end, match.start())
+            if item:
+                found.setdefault('marcar_status', []).append((item, match.group(group)))
+        elif group == 'proximo_comodo':
+            found.setdefault('proximo_comodo', []).append(match.group(group))
+        else:
+            found.setdefault('adicionar_observacao', []).append(match.group('nota'))
+        previous_end = match.end()
     
-    return commands
+    return [
+        {'type': command_type, 'action': action, 'matches': found[command_type]}
+        for command_type, action in VOICE_COMMAND_ACTIONS.items() if command_type in found
+    ]
 
 async def calculate_repair_costs(inspection_items: List[Dict], region: str = "RJ") -> Dict:
     """Calcula custos estimados de reparo"""
-    from .database import SessionLocal, RepairCostTable
+    from .reference_cache import repair_cost_lookup
     
-    db = SessionLocal()
+    # Tabela de custos da região em memória (uma carga, não uma consulta por item)
+    costs = repair_cost_lookup(region)
     total_cost = 0
     detailed_costs = []
     
-    try:
-        for item in inspection_items:
-            if item.get('status') in ['danificado', 'ausente']:
-                # Buscar custo na tabela
-                cost_data = db.query(RepairCostTable).filter(
-                    RepairCostTable.region == region,
-                    RepairCostTable.item_type == item.get('item', '').lower()
-                ).first()
+    for item in inspection_items:
+        if item.get('status') in ['danificado', 'ausente']:
+            # Buscar custo na tabela
+            cost_data = costs.get(item.get('item', '').lower())
+            
+            if cost_data:
+                item_cost = cost_data['cost_per_unit']
+                total_cost += item_cost
                 
-                if cost_data:
-                    item_cost = cost_data.cost_per_unit
-                    total_cost += item_cost
-                    
-                    detailed_costs.append({
-                        'item': item.get('item'),
-                        'room': item.get('room'),
-                        'repair_type': cost_data.repair_type,
-                        'cost': item_cost,
-                        'unit': cost_data.unit,
-                        'description': cost_data.description
-                    })
-    
-    finally:
-        db.close()
+                detailed_costs.append({
+                    'item': item.get('item'),
+                    'room': item.get('room'),
+                    'repair_type': cost_data['repair_type'],
+                    'cost': item_cost,
+                    'unit': cost_data['unit'],
+                    'description': cost_data['description']
+                })
     
     return {
         'total_cost': total_cost,
@@ -425,8 +407,11 @@ async def calculate_repair_costs(inspection_items: List[Dict], region: str = "RJ
     }
 
 # Função auxiliar para detectar itens em uma única foto usando GPT Vision
-async def detect_items_in_single_image(photo: UploadFile) -> List[str]:
-    """Detecta itens em uma única foto usando GPT Vision"""
+async def detect_items_in_single_image(photo: UploadFile, optional: bool = False) -> List[str]:
+    """Detecta itens em uma única foto usando GPT Vision.
+
+    optional: detecção secundária, pulada (lista vazia) quando o orçamento da OpenAI está no fim.
+    """
     DETECTION_PROMPT = """Você é um especialista em vistoria imobiliária. Analise esta imagem cuidadosamente e identifique TODOS os itens físicos que devem ser verificados em uma vistoria.
 
 Categorias de itens a detectar:
@@ -481,37 +466,47 @@ Retorne SOMENTE o JSON array, sem explicações, sem markdown, sem texto adicion
         elif not isinstance(photo_data, bytes):
             photo_data = bytes(photo_data)
         
-        # Converter para base64
-        b64_image = base64.b64encode(photo_data).decode('utf-8')
-        
-        # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
-        print(f"Processando imagem com gpt-4o-mini-2024-07-18...")
-        response = await _client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": DETECTION_PROMPT
-                        },
+        async def call(mode: str) -> str:
+            image, mime = (photo_data, mime_type)
+            if mode == BUDGET_ECONOMY:
+                image, mime = economy_image(image, mime)
+            image_url = {"url": f"data:{mime};base64,{base64.b64encode(image).decode('utf-8')}"}
+            if mode == BUDGET_ECONOMY:
+                image_url["detail"] = "low"
+            # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
+            print(f"Processando imagem com gpt-4o-mini-2024-07-18...")
+            async with track_usage('detect_items_in_single_image', "gpt-4o-mini-2024-07-18", mode) as tracked:
+                response = await _client.chat.completions.create(
+                    model="gpt-4o-mini-2024-07-18",
+                    messages=[
                         {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{b64_image}"
-                            }
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": DETECTION_PROMPT
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": image_url
+                                }
+                            ]
                         }
-                    ]
-                }
-            ],
-            max_tokens=500,
-            temperature=0.3
+                    ],
+                    max_tokens=500,
+                    temperature=0.3
+                )
+                tracked.record(response)
+            print(f"✅ Resposta recebida do modelo!")
+            return response.choices[0].message.content or ""
+        
+        response_text = await budgeted_call(
+            'detect_items_in_single_image', "gpt-4o-mini-2024-07-18", photo_data, call, optional=optional
         )
-        print(f"✅ Resposta recebida do modelo!")
-        
-        # Extrair resposta
-        response_text = response.choices[0].message.content.strip()
+        if response_text is None:
+            # Detecção secundária pulada para economizar o orçamento
+            return []
+        response_text = response_text.strip()
         
         # Limpar resposta (remover markdown code blocks se houver)
         response_text = re.sub(r'```json\s*', '', response_text)
@@ -534,6 +529,8 @@ Retorne SOMENTE o JSON array, sem explicações, sem markdown, sem texto adicion
         
         return []
         
+    except BudgetExceeded:
+        raise
     except Exception as e:
         import traceback
         print(f"❌ Erro na detecção de itens em foto única: {e}")
@@ -596,6 +593,8 @@ Retorne SOMENTE o JSON array, sem explicações, sem markdown, sem texto adicion
             'method': 'gpt-4-vision'
         }
         
+    except BudgetExceeded:
+        raise
     except Exception as e:
         import traceback
         error_detail = str(e)
@@ -1,9 +1,19 @@
-from celery import Celery
-from typing import List, Dict
+from celery import Celery, chain, chord, group
+from celery.signals import task_prerun, task_postrun
+from kombu import Queue
+from typing import List, Dict, Optional
 import os
 import asyncio
+import uuid
+from sqlalchemy import bindparam, update
 from .ai_services import enhanced_image_analysis, extract_text_from_document, calculate_repair_costs
-from .database import SessionLocal, ChecklistItem, InspectionFile, Inspection
+from .database import SessionLocal, ChecklistItem, InspectionFile, Inspection, ProcessingPipeline, bump_inspection_versions
+from .comparison import compare_inspections, get_comparison_report
+from .task_backend import TASK_BACKEND, enqueue, get_result, mark_broker_unavailable, run_local_pipeline, use_celery
+from .progress import publish_progress
+from .media import file_media_url
+from .ocr import ocr_document
+from .phash import register_photo
 
 # Configurar Celery
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -15,95 +25,160 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="America/Sao_Paulo",
     enable_utc=True,
+    # Resultados expiram no Redis (padrão: 1 dia); o conteúdo completo fica no banco
+    result_expires=int(os.getenv("CELERY_RESULT_EXPIRES", "86400")),
+    result_compression=os.getenv("CELERY_RESULT_COMPRESSION", "gzip") or None,
+    task_compression=os.getenv("CELERY_TASK_COMPRESSION", "gzip") or None,
+    # Filas por tipo de carga (ver docs/DEPLOYMENT.md, "Workers Celery"):
+    #   cpu   - OCR, pesado em CPU
+    #   io    - análise de imagem e áudio, limitada por chamadas à API da OpenAI
+    #   quick - custos e comparações, consultas curtas ao banco
+    task_queues=(Queue("cpu"), Queue("io"), Queue("quick")),
+    task_default_queue="quick",
+    task_routes={
+        "*.process_ocr_documents": {"queue": "cpu"},
+        "*.process_image_batch": {"queue": "io"},
+        "*.process_audio_batch": {"queue": "io"},
+        "*.calculate_inspection_costs": {"queue": "quick"},
+        "*.generate_comparison_report": {"queue": "quick"},
+        "*.generate_inspection_report": {"queue": "cpu"},
+        "*.reprioritize_checklist_items_task": {"queue": "cpu"},
+    },
+    # Prioridade dentro da fila (no Redis, 0 é a mais alta)
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
+    task_default_priority=5,
+    # Tasks longas: cada processo reserva uma por vez e só confirma ao terminar
+    worker_prefetch_multiplier=int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1")),
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
 )
 
+# Prioridades usadas ao enfileirar (Redis: menor número sai primeiro)
+PRIORITY_INTERACTIVE = 0  # usuário aguardando a resposta
+PRIORITY_BATCH = 7        # processamento em lote
+
+# Arquivos por task na etapa de análise de mídia do pipeline
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "10"))
+
+def _task_event(task, task_id: str, args, state: str) -> None:
+    """Publica a mudança de estado de uma task do Celery no canal da vistoria"""
+    if task is None or task.app is not celery_app:
+        return
+    inspection_id = args[0] if args and isinstance(args[0], int) else None
+    publish_progress(inspection_id, {
+        'type': 'task', 'task_id': task_id, 'task': task.name.rsplit('.', 1)[-1], 'state': state
+    })
+
+@task_prerun.connect
+def _on_task_prerun(sender=None, task_id=None, args=None, **kwargs):
+    _task_event(sender, task_id, args, 'STARTED')
+
+@task_postrun.connect
+def _on_task_postrun(sender=None, task_id=None, args=None, state=None, **kwargs):
+    _task_event(sender, task_id, args, state)
+
+def _file_event(inspection_id: int, file_type: str, file_id: int, status: str, done: int, total: int) -> None:
+    """Progresso por arquivo dentro de uma task de batch"""
+    publish_progress(inspection_id, {
+        'type': 'file', 'file_type': file_type, 'file_id': file_id,
+        'status': status, 'done': done, 'total': total
+    })
+
+# Máximo de erros individuais devolvidos no resultado da task (o resto só é contado)
+MAX_REPORTED_ERRORS = 20
+
+def _files_to_process(db, inspection_id: int, file_type: str, file_ids: Optional[List[int]]):
+    """Arquivos da vistoria a processar: os IDs informados ou todos do tipo"""
+    query = db.query(InspectionFile).filter(
+        InspectionFile.inspection_id == inspection_id,
+        InspectionFile.file_type == file_type
+    )
+    if file_ids is not None:
+        query = query.filter(InspectionFile.id.in_(file_ids))
+    return query.order_by(InspectionFile.id).all()
+
+def _batch_summary(inspection_id: int, file_type: str, processed: int, errors: List[Dict], skipped: int = 0) -> Dict:
+    """Resultado compacto das tasks de arquivos; os dados ficam em InspectionFile"""
+    return {
+        'inspection_id': inspection_id,
+        'processed_files': processed,
+        'skipped_duplicates': skipped,
+        'failed_files': len(errors),
+        'errors': errors[:MAX_REPORTED_ERRORS],
+        'result_ref': {'type': 'inspection_files', 'inspection_id': inspection_id, 'file_type': file_type}
+    }
+
 @celery_app.task
-def process_image_batch(file_paths: List[str], inspection_id: int) -> Dict:
-    """Processa múltiplas imagens em background"""
-    results = []
+def process_image_batch(inspection_id: int, file_ids: Optional[List[int]] = None) -> Dict:
+    """Processa imagens da vistoria em background"""
+    processed = 0
+    skipped = 0
+    errors = []
     
     db = SessionLocal()
     try:
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                # Simular UploadFile para a função de análise
-                with open(file_path, 'rb') as f:
-                    # Análise básica por enquanto - em produção seria mais complexo
-                    file_data = f.read()
-                    
-                    # Salvar resultado no banco
-                    file_record = db.query(InspectionFile).filter(
-                        InspectionFile.file_path == file_path
-                    ).first()
-                    
-                    if file_record:
-                        # Atualizar com análise básica
-                        file_record.ai_analysis = f"Processado em background - arquivo {len(file_data)} bytes"
-                        db.commit()
-                        
-                        results.append({
-                            'file_path': file_path,
-                            'status': 'processed',
-                            'file_size': len(file_data)
-                        })
+        files = _files_to_process(db, inspection_id, 'photo', file_ids)
+        for file_record in files:
+            if not os.path.exists(file_record.file_path):
+                errors.append({'file_id': file_record.id, 'error': 'arquivo não encontrado'})
+                _file_event(inspection_id, 'photo', file_record.id, 'failed', processed + skipped + len(errors), len(files))
+                continue
+            
+            # Fotos enviadas antes do hash perceptual
+            if file_record.phash is None:
+                register_photo(db, file_record)
+            
+            if file_record.duplicate_of_id:
+                # Quase-duplicata: não é analisada de novo (a análise é a da original)
+                db.commit()
+                skipped += 1
+                _file_event(inspection_id, 'photo', file_record.id, 'skipped', processed + skipped + len(errors), len(files))
+                continue
+            
+            # Análise básica por enquanto - em produção seria mais complexo
+            file_size = os.path.getsize(file_record.file_path)
+            file_record.ai_analysis = f"Processado em background - arquivo {file_size} bytes"
+            db.commit()
+            processed += 1
+            _file_event(inspection_id, file_record.file_type, file_record.id, 'processed', processed + skipped + len(errors), len(files))
     
     except Exception as e:
-        results.append({
-            'error': str(e),
-            'status': 'failed'
-        })
+        errors.append({'error': str(e)})
     
     finally:
         db.close()
     
-    return {
-        'inspection_id': inspection_id,
-        'processed_files': len(results),
-        'results': results
-    }
+    return _batch_summary(inspection_id, 'photo', processed, errors, skipped)
 
 @celery_app.task
-def process_audio_batch(file_paths: List[str], inspection_id: int) -> Dict:
-    """Processa múltiplos áudios em background"""
-    results = []
+def process_audio_batch(inspection_id: int, file_ids: Optional[List[int]] = None) -> Dict:
+    """Processa áudios da vistoria em background"""
+    processed = 0
+    errors = []
     
     db = SessionLocal()
     try:
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                # Simular processamento de áudio
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                    
-                    file_record = db.query(InspectionFile).filter(
-                        InspectionFile.file_path == file_path
-                    ).first()
-                    
-                    if file_record:
-                        # Simular transcrição
-                        file_record.transcription = f"Transcrição processada em background - {len(file_data)} bytes"
-                        db.commit()
-                        
-                        results.append({
-                            'file_path': file_path,
-                            'status': 'transcribed',
-                            'file_size': len(file_data)
-                        })
+        files = _files_to_process(db, inspection_id, 'audio', file_ids)
+        for file_record in files:
+            if not os.path.exists(file_record.file_path):
+                errors.append({'file_id': file_record.id, 'error': 'arquivo não encontrado'})
+                _file_event(inspection_id, 'audio', file_record.id, 'failed', processed + len(errors), len(files))
+                continue
+            
+            # Simular transcrição
+            file_size = os.path.getsize(file_record.file_path)
+            file_record.transcription = f"Transcrição processada em background - {file_size} bytes"
+            db.commit()
+            processed += 1
+            _file_event(inspection_id, file_record.file_type, file_record.id, 'processed', processed + len(errors), len(files))
     
     except Exception as e:
-        results.append({
-            'error': str(e),
-            'status': 'failed'
-        })
+        errors.append({'error': str(e)})
     
     finally:
         db.close()
     
-    return {
-        'inspection_id': inspection_id,
-        'processed_files': len(results),
-        'results': results
-    }
+    return _batch_summary(inspection_id, 'audio', processed, errors)
 
 @celery_app.task
 def calculate_inspection_costs(inspection_id: int, region: str = "RJ") -> Dict:
@@ -117,7 +192,7 @@ def calculate_inspection_costs(inspection_id: int, region: str = "RJ") -> Dict:
         ).all()
         
         total_cost = 0
-        detailed_costs = []
+        items_processed = 0
         
         # Cálculos simplificados para demonstração
         cost_map = {
@@ -134,13 +209,7 @@ def calculate_inspection_costs(inspection_id: int, region: str = "RJ") -> Dict:
                 
                 item.repair_cost_estimate = item_cost
                 total_cost += item_cost
-                
-                detailed_costs.append({
-                    'item': item.item,
-                    'room': item.room,
-                    'cost': item_cost,
-                    'status': item.status
-                })
+                items_processed += 1
         
         # Atualizar custo total da vistoria
         inspection = db.query(Inspection).filter(Inspection.id == inspection_id).first()
@@ -149,11 +218,12 @@ def calculate_inspection_costs(inspection_id: int, region: str = "RJ") -> Dict:
         
         db.commit()
         
+        # Detalhamento fica em ChecklistItem.repair_cost_estimate
         return {
             'inspection_id': inspection_id,
             'total_cost': total_cost,
-            'detailed_costs': detailed_costs,
-            'items_processed': len(detailed_costs)
+            'items_processed': items_processed,
+            'result_ref': {'type': 'inspection_costs', 'inspection_id': inspection_id}
         }
     
     except Exception as e:
@@ -168,116 +238,123 @@ def calculate_inspection_costs(inspection_id: int, region: str = "RJ") -> Dict:
         db.close()
 
 @celery_app.task
-def process_ocr_documents(file_paths: List[str], inspection_id: int) -> Dict:
-    """Processa OCR de documentos em background"""
-    results = []
+def process_ocr_documents(inspection_id: int, file_ids: Optional[List[int]] = None) -> Dict:
+    """Processa OCR de documentos da vistoria em background"""
+    processed = 0
+    errors = []
     db = SessionLocal()
     
     try:
-        for file_path in file_paths:
-            if os.path.exists(file_path):
-                # Simular processamento OCR
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                    
-                    file_record = db.query(InspectionFile).filter(
-                        InspectionFile.file_path == file_path
-                    ).first()
-                    
-                    if file_record:
-                        # Simular texto extraído
-                        extracted_text = f"Texto extraído via OCR - documento {len(file_data)} bytes"
-                        file_record.ocr_text = extracted_text
-                        db.commit()
-                        
-                        results.append({
-                            'file_path': file_path,
-                            'status': 'ocr_completed',
-                            'text_length': len(extracted_text)
-                        })
+        files = _files_to_process(db, inspection_id, 'document', file_ids)
+        updates = []
+        for file_record in files:
+            try:
+                with open(file_record.file_path, 'rb') as document:
+                    ocr_result = ocr_document(document.read())
+            except Exception as e:
+                errors.append({'file_id': file_record.id, 'error': str(e)})
+                _file_event(inspection_id, 'document', file_record.id, 'failed', processed + len(errors), len(files))
+                continue
+            
+            updates.append({'_id': file_record.id, 'ocr_text': ocr_result['text']})
+            processed += 1
+            _file_event(inspection_id, file_record.file_type, file_record.id, 'processed', processed + len(errors), len(files))
+        
+        # Uma única escrita para o lote (o update em Core não passa pelo before_flush)
+        if updates:
+            connection = db.connection()
+            connection.execute(
+                update(InspectionFile).where(InspectionFile.id == bindparam('_id')).values(ocr_text=bindparam('ocr_text')),
+                updates
+            )
+            bump_inspection_versions(connection, [inspection_id])
+            db.commit()
     
     except Exception as e:
-        results.append({
-            'error': str(e),
-            'status': 'failed'
-        })
+        db.rollback()
+        errors.append({'error': str(e)})
     
     finally:
         db.close()
     
-    return {
-        'inspection_id': inspection_id,
-        'processed_files': len(results),
-        'results': results
-    }
+    return _batch_summary(inspection_id, 'document', processed, errors)
 
 @celery_app.task
-def generate_comparison_report(entrada_inspection_id: int, saida_inspection_id: int) -> Dict:
+def generate_comparison_report(entrada_inspection_id: int, saida_inspection_id: int, region: str = "RJ") -> Dict:
     """Gera relatório de comparação entre entrada e saída"""
     db = SessionLocal()
     
     try:
-        # Buscar itens das duas vistorias
-        entrada_items = db.query(ChecklistItem).filter(
-            ChecklistItem.inspection_id == entrada_inspection_id
-        ).all()
-        
-        saida_items = db.query(ChecklistItem).filter(
-            ChecklistItem.inspection_id == saida_inspection_id
-        ).all()
-        
-        # Criar mapeamento dos itens por cômodo e item
-        entrada_map = {f"{item.room}_{item.item}": item for item in entrada_items}
-        saida_map = {f"{item.room}_{item.item}": item for item in saida_items}
-        
-        changes = []
-        deteriorated = []
-        improved = []
-        new_damages = []
-        
-        for key in entrada_map:
-            entrada_item = entrada_map[key]
-            saida_item = saida_map.get(key)
-            
-            if saida_item:
-                if entrada_item.status != saida_item.status:
-                    change = {
-                        'room': entrada_item.room,
-                        'item': entrada_item.item,
-                        'from_status': entrada_item.status,
-                        'to_status': saida_item.status
-                    }
-                    changes.append(change)
-                    
-                    # Categorizar mudança
-                    if entrada_item.status == 'ok' and saida_item.status in ['danificado', 'sujo']:
-                        deteriorated.append(change)
-                    elif entrada_item.status in ['danificado', 'sujo'] and saida_item.status == 'ok':
-                        improved.append(change)
-                    elif saida_item.status == 'danificado' and entrada_item.status != 'danificado':
-                        new_damages.append(change)
-        
-        # Calcular custos das mudanças
-        deterioration_cost = len(deteriorated) * 100  # Custo médio estimado
-        
-        comparison_result = {
+        result = compare_inspections(db, entrada_inspection_id, saida_inspection_id, region)
+        # O relatório completo fica em comparison_reports; no Redis vai só o resumo
+        return {
             'entrada_inspection_id': entrada_inspection_id,
             'saida_inspection_id': saida_inspection_id,
-            'total_changes': len(changes),
-            'deteriorated_items': len(deteriorated),
-            'improved_items': len(improved),
-            'new_damages': len(new_damages),
-            'estimated_deterioration_cost': deterioration_cost,
-            'changes': changes,
-            'deteriorated': deteriorated,
-            'improved': improved,
-            'new_damages': new_damages
+            'total_changes': result['total_changes'],
+            'estimated_deterioration_cost': result['estimated_deterioration_cost'],
+            'result_ref': {'type': 'comparison_report', 'id': result['report_id']}
         }
+    
+    except Exception as e:
+        return {
+            'error': str(e),
+            'status': 'failed'
+        }
+    
+    finally:
+        db.close()
+
+@celery_app.task
+def reprioritize_checklist_items_task(inspection_id: Optional[int] = None, dry_run: bool = False) -> Dict:
+    """Recalcula a prioridade dos itens com as regras atuais (ver reprioritize.py)"""
+    from .reprioritize import reprioritize_checklist_items
+    return reprioritize_checklist_items(inspection_id=inspection_id, dry_run=dry_run)
+
+@celery_app.task
+def generate_inspection_report(inspection_id: int) -> Dict:
+    """Gera o PDF da vistoria a partir dos dados gravados no banco"""
+    from .pdf import build_report_pdf
+    from .schemas import ReportRequest
+    db = SessionLocal()
+    
+    try:
+        inspection = db.query(Inspection).filter(Inspection.id == inspection_id).first()
+        if not inspection:
+            return {'inspection_id': inspection_id, 'error': 'Vistoria não encontrada', 'status': 'failed'}
         
-        return comparison_result
+        items = db.query(ChecklistItem).filter(ChecklistItem.inspection_id == inspection_id).all()
+        files = db.query(InspectionFile).filter(InspectionFile.inspection_id == inspection_id).all()
+        files_by_item = {}
+        for f in files:
+            files_by_item.setdefault(f.checklist_item_id, []).append(f)
+        
+        payload = ReportRequest(
+            propertyAddress=inspection.property_address,
+            landlordName=inspection.landlord_name,
+            tenantName=inspection.tenant_name,
+            checklist=[
+                {
+                    'room': item.room,
+                    'item': item.item,
+                    'status': item.status,
+                    'notes': item.notes,
+                    'photos': [f.file_path for f in files_by_item.get(item.id, []) if f.file_type == 'photo'],
+                    'audioTranscripts': [f.transcription for f in files_by_item.get(item.id, []) if f.transcription]
+                }
+                for item in items
+            ],
+            landlordSignature=inspection.landlord_signature,
+            tenantSignature=inspection.tenant_signature,
+            logoPath=inspection.logo_path,
+            inspectionDate=inspection.inspection_date,
+            inspectionType=inspection.inspection_type or 'entrada'
+        )
+        pdf_path = asyncio.run(build_report_pdf(payload))
+        return {'inspection_id': inspection_id, 'report_path': pdf_path}
     
     except Exception as e:
         return {
+            'inspection_id': inspection_id,
             'error': str(e),
             'status': 'failed'
         }
@@ -285,36 +362,182 @@ def generate_comparison_report(entrada_inspection_id: int, saida_inspection_id:
     finally:
         db.close()
 
+def _resolve_file_ids(db, inspection_id: int, file_type: str, file_paths: List[str]) -> List[int]:
+    """Converte caminhos enviados pelo cliente em IDs de InspectionFile"""
+    rows = db.query(InspectionFile.id).filter(
+        InspectionFile.inspection_id == inspection_id,
+        InspectionFile.file_type == file_type,
+        InspectionFile.file_path.in_(file_paths)
+    ).all()
+    return [row.id for row in rows]
+
+def _chunks(values: List[int], size: int) -> List[List[int]]:
+    return [values[i:i + size] for i in range(0, len(values), max(size, 1))]
+
+def _signature(task, *args):
+    """Assinatura imutável com ID próprio, para registrar antes de enfileirar"""
+    return task.si(*args).set(task_id=str(uuid.uuid4()), priority=PRIORITY_BATCH)
+
 # Função auxiliar para iniciar tasks
-def start_batch_processing(inspection_id: int, image_files: List[str] = None, 
-                          audio_files: List[str] = None, document_files: List[str] = None):
-    """Inicia processamento em batch de arquivos"""
-    task_results = {}
-    
-    if image_files:
-        result = process_image_batch.delay(image_files, inspection_id)
-        task_results['images'] = result.id
+def start_batch_processing(inspection_id: int, image_files: List[str] = None,
+                          audio_files: List[str] = None, document_files: List[str] = None,
+                          region: str = "RJ") -> Dict:
+    """Inicia o pipeline de processamento da vistoria.
+
+    Análise de mídia em paralelo (um group com tasks de até BATCH_CHUNK_SIZE
+    arquivos) -> cálculo de custos -> geração do relatório, como um chord
+    seguido de chain. Sem listas, processa todos os arquivos da vistoria.
+    Retorna o ID de acompanhamento (get_pipeline_status) e os IDs das tasks.
+    """
+    process_all = not (image_files or audio_files or document_files)
+    batches = (
+        ('photo', image_files, process_image_batch),
+        ('audio', audio_files, process_audio_batch),
+        ('document', document_files, process_ocr_documents),
+    )
     
-    if audio_files:
-        result = process_audio_batch.delay(audio_files, inspection_id)
-        task_results['audios'] = result.id
+    db = SessionLocal()
+    try:
+        media = []
+        for file_type, file_paths, task in batches:
+            if file_paths:
+                file_ids = _resolve_file_ids(db, inspection_id, file_type, file_paths)
+            elif process_all:
+                file_ids = [row.id for row in db.query(InspectionFile.id).filter(
+                    InspectionFile.inspection_id == inspection_id,
+                    InspectionFile.file_type == file_type
+                ).order_by(InspectionFile.id)]
+            else:
+                file_ids = []
+            media.extend(_signature(task, inspection_id, chunk) for chunk in _chunks(file_ids, BATCH_CHUNK_SIZE))
+        
+        costs = _signature(calculate_inspection_costs, inspection_id, region)
+        report = _signature(generate_inspection_report, inspection_id)
+        
+        stages = {
+            'media': [sig.id for sig in media],
+            'costs': [costs.id],
+            'report': [report.id]
+        }
+        pipeline = ProcessingPipeline(id=uuid.uuid4().hex, inspection_id=inspection_id, stages=stages)
+        db.add(pipeline)
+        db.commit()
+        
+        _run_pipeline(media, costs, report)
+        return {'pipeline_id': pipeline.id, 'stages': stages}
+    finally:
+        db.close()
+
+def _run_pipeline(media: list, costs, report) -> None:
+    """Dispara o pipeline no Celery ou, sem broker, no executor local"""
+    if use_celery(celery_app):
+        # chord com header vazio nunca dispara o callback
+        workflow = chain(chord(group(media), costs), report) if media else chain(costs, report)
+        try:
+            workflow.apply_async()
+            return
+        except Exception as e:
+            if TASK_BACKEND == "celery":
+                raise
+            print(f"Falha ao enfileirar no Celery, executando localmente: {e}")
+            mark_broker_unavailable()
     
-    if document_files:
-        result = process_ocr_documents.delay(document_files, inspection_id)
-        task_results['documents'] = result.id
+    stages = [media, [costs], [report]]
+    run_local_pipeline([
+        [(celery_app.tasks[sig.task], tuple(sig.args), sig.id) for sig in stage]
+        for stage in stages if stage
+    ])
+
+def _aggregate_state(states: List[str]) -> str:
+    """Estado de uma etapa a partir dos estados das suas tasks"""
+    if not states:
+        return 'SKIPPED'
+    if any(state == 'FAILURE' for state in states):
+        return 'FAILURE'
+    if all(state == 'SUCCESS' for state in states):
+        return 'SUCCESS'
+    if all(state == 'PENDING' for state in states):
+        return 'PENDING'
+    return 'STARTED'
+
+def get_pipeline_status(pipeline_id: str) -> Optional[Dict]:
+    """Status agregado do pipeline de uma vistoria (None se o ID não existe)"""
+    db = SessionLocal()
+    try:
+        pipeline = db.query(ProcessingPipeline).filter(ProcessingPipeline.id == pipeline_id).first()
+        if not pipeline:
+            return None
+        inspection_id, stages = pipeline.inspection_id, pipeline.stages
+    finally:
+        db.close()
     
-    # Sempre calcular custos
-    cost_result = calculate_inspection_costs.delay(inspection_id)
-    task_results['costs'] = cost_result.id
+    stage_status = {}
+    for stage, task_ids in stages.items():
+        states = [get_result(celery_app, task_id).state for task_id in task_ids]
+        stage_status[stage] = {
+            'status': _aggregate_state(states),
+            'total': len(states),
+            'completed': sum(1 for state in states if state == 'SUCCESS'),
+            'failed': sum(1 for state in states if state == 'FAILURE')
+        }
     
-    return task_results
+    stage_states = [info['status'] for info in stage_status.values() if info['status'] != 'SKIPPED']
+    report_ids = stages.get('report', [])
+    report = get_result(celery_app, report_ids[0]) if report_ids else None
+    return {
+        'pipeline_id': pipeline_id,
+        'inspection_id': inspection_id,
+        'status': _aggregate_state(stage_states),
+        'stages': stage_status,
+        'result': report.result if report is not None and report.successful() else None
+    }
+
+def _load_result_ref(result_ref: Dict):
+    """Carrega do banco o resultado completo referenciado por uma task"""
+    db = SessionLocal()
+    try:
+        if result_ref.get('type') == 'comparison_report':
+            return get_comparison_report(db, result_ref['id'])
+        
+        if result_ref.get('type') == 'inspection_costs':
+            items = db.query(ChecklistItem).filter(
+                ChecklistItem.inspection_id == result_ref['inspection_id'],
+                ChecklistItem.repair_cost_estimate > 0
+            ).all()
+            return {'detailed_costs': [
+                {'item': item.item, 'room': item.room, 'cost': item.repair_cost_estimate, 'status': item.status}
+                for item in items
+            ]}
+        
+        if result_ref.get('type') == 'inspection_files':
+            files = db.query(InspectionFile).filter(
+                InspectionFile.inspection_id == result_ref['inspection_id'],
+                InspectionFile.file_type == result_ref['file_type']
+            ).all()
+            return {'results': [
+                {
+                    'file_id': f.id,
+                    'file_path': f.file_path,
+                    'media_url': file_media_url(f.id),
+                    'ai_analysis': f.ai_analysis,
+                    'transcription': f.transcription,
+                    'ocr_text': f.ocr_text
+                }
+                for f in files
+            ]}
+    finally:
+        db.close()
+    return None
 
 # Função para verificar status das tasks
-def get_task_status(task_id: str):
-    """Verifica status de uma task"""
-    result = celery_app.AsyncResult(task_id)
+def get_task_status(task_id: str, expand: bool = False):
+    """Verifica status de uma task (expand=True carrega o resultado completo do banco)"""
+    result = get_result(celery_app, task_id)
+    payload = result.result if result.ready() else None
+    if expand and isinstance(payload, dict) and payload.get('result_ref'):
+        payload = dict(payload, details=_load_result_ref(payload['result_ref']))
     return {
         'task_id': task_id,
         'status': result.status,
-        'result': result.result if result.ready() else None
-    }
\ No newline at end of file
+        'result': payload
+    }
@@ -0,0 +1,162 @@
+from typing import Dict, Optional
+from sqlalchemy import and_, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .database import ChecklistItem, ComparisonReport, Inspection, RepairCostTable
+
+# Custo usado quando o item não está na tabela de preços da região
+DEFAULT_REPAIR_COST = 100.0
+DAMAGED_STATUSES = ('danificado', 'sujo')
+# Status de saída que geram custo de reparo (mesmo critério de calculate_repair_costs)
+COSTED_STATUSES = ('danificado', 'ausente')
+
+def _diff_query(entrada_id: int, saida_id: int):
+    """Diferença entre os checklists em uma única consulta.
+
+    Equivale a um FULL OUTER JOIN por (cômodo, item), escrito como dois LEFT JOIN
+    unidos para funcionar também em SQLite antigo. Só retorna linhas que mudaram:
+    status diferente, item só na entrada (removido) ou só na saída (adicionado).
+    """
+    items = ChecklistItem.__table__
+    entrada = select(items.c.room, items.c.item, items.c.status).where(items.c.inspection_id == entrada_id).subquery('entrada')
+    saida = select(items.c.room, items.c.item, items.c.status).where(items.c.inspection_id == saida_id).subquery('saida')
+    same_item = and_(entrada.c.room == saida.c.room, entrada.c.item == saida.c.item)
+    
+    from_entrada = (
+        select(entrada.c.room, entrada.c.item,
+               entrada.c.status.label('from_status'), saida.c.status.label('to_status'))
+        .select_from(entrada.outerjoin(saida, same_item))
+        .where(entrada.c.status.is_distinct_from(saida.c.status))
+    )
+    only_saida = (
+        select(saida.c.room, saida.c.item,
+               literal(None).label('from_status'), saida.c.status.label('to_status'))
+        .select_from(saida.outerjoin(entrada, same_item))
+        .where(entrada.c.item.is_(None))
+    )
+    return union_all(from_entrada, only_saida)
+
+def _classify(from_status: Optional[str], to_status: Optional[str]) -> str:
+    """Classifica a mudança de um item entre entrada e saída"""
+    if from_status is None:
+        return 'added'
+    if to_status is None:
+        return 'removed'
+    if from_status == 'ok' and to_status in DAMAGED_STATUSES:
+        return 'deteriorated'
+    if from_status in DAMAGED_STATUSES and to_status == 'ok':
+        return 'improved'
+    if to_status == 'danificado':
+        return 'new_damage'
+    return 'changed'
+
+def build_comparison(db: Session, entrada_id: int, saida_id: int, region: str = "RJ") -> Dict:
+    """Compara as vistorias e precifica as mudanças pela RepairCostTable"""
+    costs = {}
+    for item_type, repair_type, cost in db.query(
+        RepairCostTable.item_type, RepairCostTable.repair_type, RepairCostTable.cost_per_unit
+    ).filter(RepairCostTable.region == region):
+        # Mesmo critério de calculate_repair_costs: primeira entrada por item
+        costs.setdefault(item_type.lower(), (repair_type, cost))
+    
+    groups = {kind: [] for kind in ('deteriorated', 'improved', 'new_damage', 'added', 'removed', 'changed')}
+    changes = []
+    total_cost = 0.0
+    for room, item, from_status, to_status in db.execute(_diff_query(entrada_id, saida_id)):
+        kind = _classify(from_status, to_status)
+        change = {
+            'room': room,
+            'item': item,
+            'from_status': from_status,
+            'to_status': to_status,
+            'change': kind
+        }
+        # Custo de reparo para o que piorou ou sumiu; itens novos na saída não entram
+        if kind in ('deteriorated', 'removed') or (kind != 'added' and to_status in COSTED_STATUSES):
+            repair_type, cost = costs.get(item.lower(), (None, DEFAULT_REPAIR_COST))
+            change['repair_type'] = repair_type
+            change['cost'] = cost
+            change['priced'] = repair_type is not None
+            total_cost += cost
+        changes.append(change)
+        groups[kind].append(change)
+    
+    return {
+        'entrada_inspection_id': entrada_id,
+        'saida_inspection_id': saida_id,
+        'region': region,
+        'total_changes': len(changes),
+        'deteriorated_items': len(groups['deteriorated']),
+        'improved_items': len(groups['improved']),
+        'new_damage_items': len(groups['new_damage']),
+        'added_items': len(groups['added']),
+        'removed_items': len(groups['removed']),
+        'estimated_deterioration_cost': total_cost,
+        'currency': 'BRL',
+        'changes': changes,
+        'deteriorated': groups['deteriorated'],
+        'improved': groups['improved'],
+        'new_damages': groups['new_damage'],
+        'added': groups['added'],
+        'removed': groups['removed']
+    }
+
+def get_inspection_versions(db: Session, entrada_id: int, saida_id: int) -> Dict[int, int]:
+    """Versões atuais das duas vistorias (ausentes não aparecem no dicionário)"""
+    return dict(db.query(Inspection.id, Inspection.version).filter(Inspection.id.in_([entrada_id, saida_id])))
+
+def _find_report(db: Session, entrada_id: int, saida_id: int, region: str) -> Optional[ComparisonReport]:
+    return db.query(ComparisonReport).filter(
+        ComparisonReport.entrada_inspection_id == entrada_id,
+        ComparisonReport.saida_inspection_id == saida_id,
+        ComparisonReport.region == region
+    ).first()
+
+def get_cached_comparison(db: Session, entrada_id: int, saida_id: int, region: str = "RJ",
+                          versions: Optional[Dict[int, int]] = None) -> Optional[Dict]:
+    """Comparação em cache, se nenhuma das vistorias mudou desde que foi gerada"""
+    versions = versions if versions is not None else get_inspection_versions(db, entrada_id, saida_id)
+    cached = _find_report(db, entrada_id, saida_id, region)
+    if (cached and cached.entrada_version == versions.get(entrada_id)
+            and cached.saida_version == versions.get(saida_id)):
+        return dict(cached.result, report_id=cached.id)
+    return None
+
+def get_comparison_report(db: Session, report_id: int) -> Optional[Dict]:
+    """Resultado gravado de uma comparação (referenciado pelo resultado da task)"""
+    record = db.query(ComparisonReport).filter(ComparisonReport.id == report_id).first()
+    return dict(record.result, report_id=record.id) if record else None
+
+def compare_inspections(db: Session, entrada_id: int, saida_id: int, region: str = "RJ") -> Dict:
+    """Comparação entrada x saída com cache por par de vistorias.
+
+    O cache fica no banco (compartilhado entre API e workers) e é invalidado
+    pela coluna Inspection.version. Alterações na tabela de custos não
+    invalidam o cache.
+    """
+    versions = get_inspection_versions(db, entrada_id, saida_id)
+    missing = [i for i in (entrada_id, saida_id) if i not in versions]
+    if missing:
+        raise LookupError(f"Vistoria não encontrada: {missing[0]}")
+    
+    cached = get_cached_comparison(db, entrada_id, saida_id, region, versions)
+    if cached is not None:
+        return dict(cached, cached=True)
+    
+    result = build_comparison(db, entrada_id, saida_id, region)
+    record = _find_report(db, entrada_id, saida_id, region)
+    if record is None:
+        record = ComparisonReport(entrada_inspection_id=entrada_id, saida_inspection_id=saida_id, region=region)
+        db.add(record)
+    record.entrada_version = versions[entrada_id]
+    record.saida_version = versions[saida_id]
+    record.result = result
+    try:
+        db.commit()
+        report_id = record.id
+    except IntegrityError:
+        # Outro processo gravou o mesmo par ao mesmo tempo; o resultado é equivalente
+        db.rollback()
+        existing = _find_report(db, entrada_id, saida_id, region)
+        report_id = existing.id if existing else None
+    return dict(result, cached=False, report_id=report_id)
@@ -0,0 +1,135 @@
+from typing import Dict, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+from .database import ChecklistItem, bump_inspection_versions
+from .schemas import ChecklistItemWrite, ChecklistBulkItemResult
+
+# Colunas de ChecklistItem gravadas a partir de ChecklistItemWrite
+CHECKLIST_WRITE_COLUMNS = ('room', 'item', 'status', 'notes', 'ai_analysis', 'repair_cost_estimate', 'priority')
+
+def _dialect_insert(db: Session):
+    """insert() com suporte a ON CONFLICT para o dialeto atual, se houver"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert
+    return None
+
+def validate_checklist_items(raw_items: List[dict]) -> Tuple[Dict[int, ChecklistItemWrite], List[ChecklistBulkItemResult]]:
+    """Valida cada item do lote individualmente.
+
+    Retorna os itens válidos por posição e os resultados dos inválidos. Se o
+    mesmo (cômodo, item) aparece mais de uma vez, vale a última ocorrência.
+    """
+    valid: Dict[int, ChecklistItemWrite] = {}
+    results: List[ChecklistBulkItemResult] = []
+    last_index_by_key: Dict[Tuple[str, str], int] = {}
+    
+    for index, raw in enumerate(raw_items):
+        try:
+            item = ChecklistItemWrite.model_validate(raw)
+        except ValidationError as e:
+            errors = [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+            results.append(ChecklistBulkItemResult(index=index, status='invalid', errors=errors))
+            continue
+        
+        key = (item.room, item.item)
+        previous = last_index_by_key.get(key)
+        if previous is not None:
+            del valid[previous]
+            results.append(ChecklistBulkItemResult(
+                index=previous, status='duplicate',
+                errors=[f"substituído pelo item {index} (mesmo cômodo e item)"]
+            ))
+        last_index_by_key[key] = index
+        valid[index] = item
+    
+    return valid, results
+
+def upsert_checklist_items(db: Session, inspection_id: int, raw_items: List[dict]) -> List[ChecklistBulkItemResult]:
+    """Grava um lote de itens do checklist em uma única transação.
+
+    Usa INSERT ... ON CONFLICT (inspection_id, room, item) DO UPDATE com
+    executemany no SQLite/PostgreSQL; nos demais bancos separa inserções e
+    atualizações em executemany. Itens já existentes só têm alterados os
+    campos enviados pelo cliente: os itens são agrupados pelo conjunto de
+    campos enviados, com uma gravação por grupo (em geral um só).
+    """
+    valid, results = validate_checklist_items(raw_items)
+    if not valid:
+        return sorted(results, key=lambda r: r.index)
+    
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for item in valid.values():
+        row = {column: getattr(item, column) for column in CHECKLIST_WRITE_COLUMNS}
+        row['inspection_id'] = inspection_id
+        # Campos omitidos pelo cliente ficam com o padrão do modelo na inserção
+        row['repair_cost_estimate'] = row['repair_cost_estimate'] or 0.0
+        row['priority'] = row['priority'] or 'low'
+        sent = tuple(column for column in CHECKLIST_WRITE_COLUMNS
+                     if column in item.model_fields_set and column not in ('room', 'item'))
+        groups.setdefault(sent, []).append(row)
+    
+    try:
+        # Incrementar a versão antes de ler as chaves trava a vistoria (lock da
+        # linha no PostgreSQL, lock de escrita no SQLite) até o commit: outra
+        # gravação de itens da mesma vistoria espera, e created/updated saem
+        # desta leitura sem corrida
+        bump_inspection_versions(db.connection(), [inspection_id])
+        existing = {
+            (room, item): item_id
+            for item_id, room, item in db.query(ChecklistItem.id, ChecklistItem.room, ChecklistItem.item)
+            .filter(ChecklistItem.inspection_id == inspection_id)
+        }
+        
+        dialect_insert = _dialect_insert(db)
+        for sent, rows in groups.items():
+            if dialect_insert is not None:
+                stmt = dialect_insert(ChecklistItem)
+                if sent:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['inspection_id', 'room', 'item'],
+                        set_={column: stmt.excluded[column] for column in sent}
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=['inspection_id', 'room', 'item'])
+                db.execute(stmt, rows)
+                continue
+            
+            new_rows = [r for r in rows if (r['room'], r['item']) not in existing]
+            changed_rows = [
+                dict({column: r[column] for column in sent}, _id=existing[(r['room'], r['item'])])
+                for r in rows if (r['room'], r['item']) in existing
+            ]
+            if new_rows:
+                db.execute(insert(ChecklistItem), new_rows)
+            if changed_rows and sent:
+                db.execute(
+                    update(ChecklistItem.__table__)
+                    .where(ChecklistItem.__table__.c.id == bindparam('_id'))
+                    .values({column: bindparam(column) for column in sent}),
+                    changed_rows
+                )
+        
+        ids = {
+            (room, item): item_id
+            for item_id, room, item in db.query(ChecklistItem.id, ChecklistItem.room, ChecklistItem.item)
+            .filter(ChecklistItem.inspection_id == inspection_id)
+        }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    for index, item in valid.items():
+        key = (item.room, item.item)
+        results.append(ChecklistBulkItemResult(
+            index=index,
+            status='updated' if key in existing else 'created',
+            id=ids.get(key)
+        ))
+    return sorted(results, key=lambda r: r.index)
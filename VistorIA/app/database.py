@@ -1,8 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, JSON, Boolean, ForeignKey
+from sqlalchemy import (
+    bindparam, create_engine, delete, event, inspect, insert, select, text, Column, Integer, String, DateTime, Float, Text, JSON,
+    BigInteger, Boolean, ForeignKey, Index, UniqueConstraint
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import sqlite
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+import hashlib
+import json
 import os
+import tempfile
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./vistoria.db")
@@ -11,6 +22,14 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# No SQLite, func.now() grava "YYYY-MM-DD HH:MM:SS" (sem microssegundos) e o
+# SQLAlchemy grava datetimes com microssegundos; como o SQLite compara texto,
+# os dois formatos precisam ser iguais para filtros e cursores por data.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 # Database Models
 class Inspection(Base):
     """Vistoria principal"""
@@ -28,11 +47,19 @@ class Inspection(Base):
     tenant_signature = Column(Text, nullable=True)  # base64
     logo_path = Column(String, nullable=True)
     total_cost_estimate = Column(Float, default=0.0)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(Timestamp, default=func.now())
+    version = Column(Integer, default=1, server_default="1", nullable=False)  # incrementado a cada alteração
     
     # Relacionamentos
     checklist_items = relationship("ChecklistItem", back_populates="inspection")
     files = relationship("InspectionFile", back_populates="inspection")
+    
+    # Índices para paginação por cursor (created_at, id) e filtros da listagem
+    __table_args__ = (
+        Index("ix_inspections_created_at_id", "created_at", "id"),
+        Index("ix_inspections_status", "status"),
+        Index("ix_inspections_inspection_type", "inspection_type"),
+    )
 
 class Template(Base):
     """Templates de checklist personalizáveis"""
@@ -64,6 +91,11 @@ class ChecklistItem(Base):
     # Relacionamentos
     inspection = relationship("Inspection", back_populates="checklist_items")
     files = relationship("InspectionFile", back_populates="checklist_item")
+    
+    # Um item por (vistoria, cômodo, item): chave usada pelo upsert em lote
+    __table_args__ = (
+        Index("uq_checklist_items_inspection_room_item", "inspection_id", "room", "item", unique=True),
+    )
 
 class InspectionFile(Base):
     """Arquivos da vistoria (fotos, áudios)"""
@@ -79,12 +111,29 @@ class InspectionFile(Base):
     transcription = Column(Text, nullable=True)  # Para arquivos de áudio
     ocr_text = Column(Text, nullable=True)  # Para documentos com OCR
     detected_objects = Column(JSON, nullable=True)  # Para reconhecimento de objetos
+    sha256 = Column(String, nullable=True)  # hash do conteúdo (uploads retomáveis)
+    size_bytes = Column(BigInteger, nullable=True)
+    phash = Column(BigInteger, nullable=True)  # dHash de 64 bits das fotos (app/phash.py)
+    duplicate_of_id = Column(Integer, ForeignKey("inspection_files.id"), nullable=True)  # foto quase idêntica anterior
     uploaded_at = Column(DateTime, default=func.now())
     
     # Relacionamentos
     inspection = relationship("Inspection", back_populates="files")
     checklist_item = relationship("ChecklistItem", back_populates="files")
 
+class InspectionFileHashBand(Base):
+    """Faixa de 8 bits do dHash de uma foto, para a busca de quase-duplicatas (app/phash.py)"""
+    __tablename__ = "inspection_file_hash_bands"
+    
+    file_id = Column(Integer, ForeignKey("inspection_files.id"), primary_key=True)
+    band = Column(Integer, primary_key=True)  # 0-7
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=False)
+    value = Column(Integer, nullable=False)  # 0-255
+    
+    __table_args__ = (
+        Index("ix_inspection_file_hash_bands_lookup", "inspection_id", "band", "value"),
+    )
+
 class RepairCostTable(Base):
     """Tabela de preços para cálculo de orçamentos"""
     __tablename__ = "repair_costs"
@@ -98,9 +147,219 @@ class RepairCostTable(Base):
     description = Column(String, nullable=True)
     updated_at = Column(DateTime, default=func.now())
 
+class ComparisonReport(Base):
+    """Resultado de comparação entrada x saída, válido para as versões registradas"""
+    __tablename__ = "comparison_reports"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    entrada_inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=False)
+    saida_inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=False)
+    region = Column(String, nullable=False)
+    entrada_version = Column(Integer, nullable=False)
+    saida_version = Column(Integer, nullable=False)
+    result = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("entrada_inspection_id", "saida_inspection_id", "region", name="uq_comparison_reports_pair"),
+    )
+
+class ProcessingPipeline(Base):
+    """Processamento em lote de uma vistoria: IDs das tasks de cada etapa"""
+    __tablename__ = "processing_pipelines"
+    
+    id = Column(String, primary_key=True)  # ID de acompanhamento devolvido ao cliente
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=False, index=True)
+    stages = Column(JSON, nullable=False)  # {"media": [...], "costs": [...], "report": [...]}
+    created_at = Column(DateTime, default=func.now())
+
+class OcrPageCache(Base):
+    """Texto reconhecido por página, indexado pelo hash do conteúdo da página"""
+    __tablename__ = "ocr_page_cache"
+    
+    content_hash = Column(String, primary_key=True)  # sha256 da página + idioma + versão do pré-processamento
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+class OpenAIUsage(Base):
+    """Consumo de uma chamada à OpenAI (agregado por vistoria, endpoint e modelo em app/usage.py)"""
+    __tablename__ = "openai_usage"
+    
+    id = Column(Integer, primary_key=True)
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=True, index=True)
+    endpoint = Column(String, nullable=True)  # template da rota (/api/vision)
+    function = Column(String, nullable=False)  # analyze_image, transcribe_audio...
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    audio_seconds = Column(Float, default=0.0)
+    cost_usd = Column(Float, default=0.0)  # estimado pela tabela de preços
+    budget_mode = Column(String, default="normal")  # normal, economy
+    created_at = Column(Timestamp, default=func.now(), index=True)
+
+class OpenAIResponseCache(Base):
+    """Resposta da OpenAI indexada pelo hash da entrada (função, modelo, prompt e mídia)"""
+    __tablename__ = "openai_response_cache"
+    
+    content_hash = Column(String, primary_key=True)
+    function = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now(), index=True)  # expiração (OPENAI_RESPONSE_CACHE_TTL_HOURS)
+
+class OpenAICallLease(Base):
+    """Lease de uma chamada à OpenAI em andamento (single-flight entre workers, app/singleflight.py)"""
+    __tablename__ = "openai_call_leases"
+    
+    key = Column(String, primary_key=True)  # mesma chave do cache de respostas
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    result = Column(Text, nullable=True)  # resposta publicada pelo dono ao terminar
+
+class AppMeta(Base):
+    """Metadados do banco (versão do esquema e dos dados padrão já aplicados)"""
+    __tablename__ = "app_meta"
+    
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+class UploadSession(Base):
+    """Upload retomável em andamento (app/uploads.py): quantos bytes já chegaram"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=False, index=True)
+    checklist_item_id = Column(Integer, ForeignKey("checklist_items.id"), nullable=True)
+    file_type = Column(String, nullable=False)  # photo, audio, video, document
+    original_filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+    sha256 = Column(String, nullable=True)  # hash informado pelo cliente, conferido na finalização
+    file_id = Column(Integer, ForeignKey("inspection_files.id"), nullable=True)  # preenchido ao finalizar
+    claimed_by = Column(String, nullable=True)  # requisição que está gravando (PATCH/finalização), entre workers
+    claimed_at = Column(DateTime, nullable=True)  # renovado durante o envio; vencido, outro pode assumir
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), index=True)
+
+class TaskResult(Base):
+    """Status e resultado das tasks executadas sem Celery (backend local)"""
+    __tablename__ = "task_results"
+    
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    state = Column(String, nullable=False, default="PENDING")  # PENDING, STARTED, SUCCESS, FAILURE
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
+    finished_at = Column(DateTime, nullable=True)
+
+def bump_inspection_versions(connection, inspection_ids) -> None:
+    """Incrementa a versão das vistorias (invalida caches derivados delas)"""
+    inspection_ids = {i for i in inspection_ids if i is not None}
+    if inspection_ids:
+        table = Inspection.__table__
+        connection.execute(
+            table.update().where(table.c.id.in_(inspection_ids)).values(version=table.c.version + 1)
+        )
+
+@event.listens_for(SessionLocal, "before_flush")
+def _bump_versions_on_flush(session, flush_context, instances):
+    """Alterações de itens e arquivos via ORM contam como alteração da vistoria"""
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (ChecklistItem, InspectionFile)):
+            if obj in session.new or obj in session.deleted or session.is_modified(obj):
+                changed.add(obj.inspection_id)
+        elif isinstance(obj, Inspection) and obj in session.dirty and session.is_modified(obj):
+            obj.version = (obj.version or 0) + 1
+    if changed:
+        bump_inspection_versions(session.connection(), changed)
+
+def _add_missing_columns():
+    """Adiciona colunas novas a tabelas já existentes (create_all só cria tabelas)"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' NOT NULL DEFAULT {column.server_default.arg}' if not column.nullable else f' DEFAULT {column.server_default.arg}'
+                conn.execute(text(ddl))
+
+def _backfill_inspection_created_at():
+    """Preenche created_at das vistorias antigas (NULL) com a data da vistoria.
+
+    A listagem por cursor (app/pagination.py) ignora linhas sem created_at.
+    """
+    table = Inspection.__table__
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(table.c.id, table.c.inspection_date).where(table.c.created_at.is_(None))
+        ).all()
+        if rows:
+            conn.execute(
+                table.update().where(table.c.id == bindparam('_id')).values(created_at=bindparam('_created_at')),
+                [{'_id': row.id, '_created_at': row.inspection_date or datetime.utcnow()} for row in rows]
+            )
+
+def _dedupe_checklist_items():
+    """Remove itens repetidos por (vistoria, cômodo, item), mantendo o mais recente.
+
+    Bancos anteriores ao índice único uq_checklist_items_inspection_room_item
+    podem ter repetições, que impediriam a criação do índice. Arquivos e uploads
+    ligados aos itens removidos passam a apontar para o item mantido.
+    """
+    if any(index['name'] == 'uq_checklist_items_inspection_room_item'
+           for index in inspect(engine).get_indexes(ChecklistItem.__tablename__)):
+        return
+    items = ChecklistItem.__table__
+    key = (items.c.inspection_id, items.c.room, items.c.item)
+    with engine.begin() as conn:
+        repeated = (
+            select(*key, func.max(items.c.id).label('keep_id'))
+            .where(items.c.inspection_id.isnot(None))
+            .group_by(*key)
+            .having(func.count() > 1)
+            .subquery()
+        )
+        rows = conn.execute(
+            select(items.c.id, items.c.inspection_id, repeated.c.keep_id)
+            .join(repeated, (items.c.inspection_id == repeated.c.inspection_id)
+                  & (items.c.room == repeated.c.room) & (items.c.item == repeated.c.item))
+            .where(items.c.id != repeated.c.keep_id)
+        ).all()
+        if not rows:
+            return
+        moves = [{'_old': row.id, '_keep': row.keep_id} for row in rows]
+        for table in (InspectionFile.__table__, UploadSession.__table__):
+            conn.execute(
+                table.update().where(table.c.checklist_item_id == bindparam('_old'))
+                .values(checklist_item_id=bindparam('_keep')),
+                moves
+            )
+        conn.execute(items.delete().where(items.c.id.in_([row.id for row in rows])))
+        bump_inspection_versions(conn, {row.inspection_id for row in rows})
+    print(f"{len(rows)} itens de checklist repetidos removidos (mantido o mais recente de cada)")
+
 # Criar tabelas
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _backfill_inspection_created_at()
+    _dedupe_checklist_items()
+    # create_all não cria índices novos em tabelas que já existem
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # Sem o índice único o upsert em lote (ON CONFLICT) falha, então a
+                # inicialização para aqui
+                raise RuntimeError(f"Não foi possível criar o índice {index.name}: {e}") from e
 
 # Dependency para FastAPI
 def get_db():
@@ -152,15 +411,15 @@ DEFAULT_REPAIR_COSTS = [
     {"region": "RJ", "item_type": "janela", "repair_type": "reparo", "unit": "unidade", "cost_per_unit": 180.0, "description": "Reparo de janela"},
 ]
 
-def init_default_data():
-    """Inicializa dados padrão no banco"""
+def init_default_data() -> bool:
+    """Inicializa dados padrão no banco; retorna False se a gravação falhou"""
     db = SessionLocal()
     
     try:
-        # Inserir templates padrão se não existirem
+        # Inserir templates padrão se não existirem (uma consulta para todos)
+        existing_types = {row.type for row in db.query(Template.type).filter(Template.type.in_(DEFAULT_TEMPLATES))}
         for template_key, template_data in DEFAULT_TEMPLATES.items():
-            existing = db.query(Template).filter(Template.type == template_key).first()
-            if not existing:
+            if template_key not in existing_types:
                 template = Template(**template_data, is_default=True)
                 db.add(template)
         
@@ -172,8 +431,84 @@ def init_default_data():
                 db.add(cost)
         
         db.commit()
+        return True
     except Exception as e:
         db.rollback()
         print(f"Erro ao inserir dados padrão: {e}")
+        return False
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# ==================== INICIALIZAÇÃO ====================
+# Inicialização do esquema e dos dados padrão: feita uma vez (python -m app.init_db
+# ou na subida da API, DB_INIT_ON_STARTUP), não a cada import. Com o banco já na
+# versão atual, a subida de um worker custa uma consulta.
+DB_INIT_LOCK_FILE = os.getenv("DB_INIT_LOCK_FILE", os.path.join(tempfile.gettempdir(), "vistoria-db-init.lock"))
+_PG_INIT_LOCK_KEY = 0x56697374  # chave do pg_advisory_lock
+
+def schema_version() -> str:
+    """Hash do esquema declarado e dos dados padrão (muda quando um modelo ou seed muda)"""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(
+            f"{column.name}:{column.type.compile(dialect=engine.dialect)}:{column.nullable}:{column.server_default is not None}"
+            for column in table.columns
+        )
+        parts.extend(sorted(index.name for index in table.indexes))
+    parts.append(json.dumps([DEFAULT_TEMPLATES, DEFAULT_REPAIR_COSTS], sort_keys=True))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+def _stored_schema_version() -> Optional[str]:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(AppMeta.value).where(AppMeta.key == "schema_version")).scalar()
+    except (OperationalError, ProgrammingError):
+        # Banco novo: app_meta ainda não existe
+        return None
+
+@contextmanager
+def _init_lock():
+    """Impede que vários workers criem o esquema ao mesmo tempo"""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _PG_INIT_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _PG_INIT_LOCK_KEY})
+        return
+    try:
+        import fcntl
+    except ImportError:
+        # Windows: sem lock entre processos (desenvolvimento com um worker)
+        yield
+        return
+    with open(DB_INIT_LOCK_FILE, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_database(force: bool = False) -> bool:
+    """Cria/atualiza o esquema e os dados padrão se a versão gravada estiver desatualizada.
+
+    Retorna True se a inicialização rodou; False se o banco já estava na versão atual.
+    Levanta exceção (sem gravar a versão) se o esquema ou os dados padrão falharem.
+    """
+    version = schema_version()
+    if not force and _stored_schema_version() == version:
+        return False
+    with _init_lock():
+        # Outro worker pode ter inicializado enquanto este esperava o lock
+        if not force and _stored_schema_version() == version:
+            return False
+        create_tables()
+        # Só grava a versão se tudo deu certo; senão a próxima subida tenta de novo
+        if not init_default_data():
+            raise RuntimeError("Dados padrão não inseridos; versão do esquema não gravada")
+        with engine.begin() as conn:
+            conn.execute(delete(AppMeta).where(AppMeta.key == "schema_version"))
+            conn.execute(insert(AppMeta).values(key="schema_version", value=version))
+    return True
@@ -0,0 +1,36 @@
+import hashlib
+import json
+from typing import Any, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+def make_etag(content: bytes) -> str:
+    """ETag forte a partir do conteúdo serializado"""
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Verifica se algum valor de If-None-Match corresponde ao ETag"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    return '*' in candidates or etag in [c[2:] if c.startswith('W/') else c for c in candidates]
+
+def encode_json(payload: Any) -> bytes:
+    """JSON compacto em UTF-8, como enviado nas respostas com ETag"""
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_body_response(request: Request, body: bytes, etag: str,
+                       cache_control: str = 'no-cache') -> Response:
+    """Resposta com corpo JSON já serializado; 304 quando o cliente já tem a versão atual"""
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+def json_with_etag(request: Request, payload: Any, etag: Optional[str] = None,
+                   cache_control: str = 'no-cache') -> Response:
+    """Resposta JSON com ETag; devolve 304 quando o cliente já tem a versão atual"""
+    body = encode_json(payload)
+    return json_body_response(request, body, etag or make_etag(body), cache_control)
@@ -0,0 +1,26 @@
+"""Cria/atualiza o esquema do banco e os dados padrão (templates e custos).
+
+Rode uma vez por deploy, antes de subir os workers; com DB_INIT_ON_STARTUP=false
+a API só abre o pool de conexões e atende.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python -m app.init_db [--force]
+"""
+import argparse
+import time
+
+from .database import DATABASE_URL, init_database, schema_version
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria/atualiza o esquema do banco e os dados padrão")
+    parser.add_argument('--force', action='store_true', help='roda mesmo se o banco já estiver na versão atual')
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    ran = init_database(force=args.force)
+    elapsed = time.perf_counter() - start
+    status = "inicializado" if ran else "já estava na versão atual"
+    print(f"Banco {DATABASE_URL.split('@')[-1]} {status} (esquema {schema_version()}, {elapsed:.2f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
+from contextlib import asynccontextmanager
 import os
+import re
+import shutil
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, load_only, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 # Imports locais
 from .openai_client import transcribe_audio, analyze_image, summarize_text
@@ -17,28 +23,69 @@ from .ai_services import (
     auto_generate_checklist
 )
 from .pdf import build_report_pdf
-from .schemas import ReportRequest
+from .schemas import (
+    ReportRequest, InspectionSummary, InspectionListResponse,
+    InspectionDetail, InspectionFileDetail,
+    ChecklistBulkRequest, ChecklistBulkResponse, ResumableUploadCreate
+)
+from .pagination import apply_keyset, encode_cursor, estimate_row_count, InvalidCursor
+from .http_cache import json_with_etag
+from .reference_cache import ALL_TEMPLATES, repair_costs_cache, templates_cache
+from .media import (
+    MEDIA_ROOT, MEDIA_URL_RENEW_SECONDS, MEDIA_URL_TTL, MediaNotFound, media_response, sign_media_url,
+    verify_media_signature
+)
+from .phash import register_photo
+from .uploads import UploadError, abort_upload, append_chunk, complete_upload, create_upload, get_upload
+from .static_assets import GZIP_MIN_SIZE, CachedPage, CachedStaticFiles, CompressibleGZipMiddleware
+from .crud import upsert_checklist_items
+from .comparison import compare_inspections, get_cached_comparison, get_inspection_versions
 from .database import (
-    get_db, create_tables, init_default_data, 
-    Inspection, Template, ChecklistItem, InspectionFile, RepairCostTable
+    get_db, init_database, engine,
+    Inspection, Template, ChecklistItem, InspectionFile
 )
-from .background_tasks import start_batch_processing, get_task_status
+from .background_tasks import start_batch_processing, get_task_status, get_pipeline_status
+from .progress import subscribe_progress, format_sse
+from .metrics import install_http_metrics, instrument_engine, render_metrics
+from .usage import BudgetExceeded, budget_status, install_usage_scope, usage_summary
 
 load_dotenv()
 
-# Criar tabelas e dados iniciais
-create_tables()
-init_default_data()
+# Esquema e dados padrão na subida (desligue em produção e rode python -m app.init_db no deploy)
+DB_INIT_ON_STARTUP = os.getenv('DB_INIT_ON_STARTUP', 'true').lower() != 'false'
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Com o banco na versão atual, a inicialização é só uma consulta"""
+    if DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_database)
+    yield
 
 app = FastAPI(
     title=os.getenv('APP_NAME', 'VistorIA'),
     description="Sistema de Vistoria Imobiliária com IA - Versão Completa",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
+# Comparações até este total de itens (entrada + saída) rodam na própria requisição
+COMPARE_SYNC_MAX_ITEMS = int(os.getenv('COMPARE_SYNC_MAX_ITEMS', '2000'))
+
 # Configurar templates
 templates = Jinja2Templates(directory="VistorIA/templates")
 
+# Métricas do Prometheus (latência por rota e consultas ao banco por requisição)
+install_http_metrics(app)
+instrument_engine(engine)
+
+# Consumo da OpenAI atribuído à vistoria (inspection_id ou X-Inspection-Id) e à rota
+install_usage_scope(app)
+
+@app.exception_handler(BudgetExceeded)
+async def budget_exceeded_handler(request: Request, exc: BudgetExceeded):
+    """Orçamento da OpenAI esgotado: 429 em vez de gastar além do limite"""
+    return JSONResponse(status_code=429, content={'detail': str(exc)})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -47,20 +94,22 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Respostas JSON/HTML comprimidas; mídia e PDFs passam sem recompressão
+app.add_middleware(CompressibleGZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=6)
+
 # Servir arquivos estáticos (React build)
 static_dir = "VistorIA/static"
 if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    # Uploads antigos (static/uploads) só pelos links assinados de /api/media
+    app.mount("/static", CachedStaticFiles(directory=static_dir, exclude=("uploads",)), name="static")
     
 # Servir assets do React (JS, CSS)
 dist_dir = "VistorIA/static/dist"
 if os.path.exists(dist_dir):
-    app.mount("/assets", StaticFiles(directory=f"{dist_dir}/assets"), name="assets")
+    # Assets do build têm hash no nome: cache imutável
+    app.mount("/assets", CachedStaticFiles(directory=f"{dist_dir}/assets", immutable=True), name="assets")
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    """Página inicial do VistorIA"""
-    return """
+ROOT_PAGE = CachedPage(content="""
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -127,40 +176,55 @@ async def root():
         </div>
     </body>
     </html>
-    """
+    """)
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request):
+    """Página inicial do VistorIA"""
+    return ROOT_PAGE.response(request)
+
+# Aplicação React buildada; HTML antigo se o React não estiver buildado
+VISTORIA_PAGE = CachedPage('VistorIA/static/dist/index.html', 'VistorIA/templates/vistoria.html')
 
 @app.get('/vistoria')
-async def vistoria_interface():
+async def vistoria_interface(request: Request):
     """Interface web completa para vistoria - React App"""
-    # Servir a aplicação React buildada
-    react_index_path = 'VistorIA/static/dist/index.html'
-    if os.path.exists(react_index_path):
-        with open(react_index_path, 'r', encoding='utf-8') as f:
-            return HTMLResponse(content=f.read())
-    else:
-        # Fallback para HTML antigo se React não estiver buildado
-        with open('VistorIA/templates/vistoria.html', 'r', encoding='utf-8') as f:
-            return HTMLResponse(content=f.read())
+    return VISTORIA_PAGE.response(request)
 
 @app.get('/api/health')
 async def health():
     """Health check endpoint"""
     return {'status': 'ok', 'service': 'VistorIA API'}
 
+@app.get('/metrics')
+async def metrics():
+    """Métricas no formato do Prometheus"""
+    body, content_type = render_metrics()
+    if body is None:
+        raise HTTPException(status_code=503, detail="prometheus_client não instalado")
+    return Response(content=body, media_type=content_type)
+
+@app.get('/api/usage')
+async def openai_usage(inspection_id: Optional[int] = None, days: Optional[int] = Query(None, ge=1),
+                       db: Session = Depends(get_db)):
+    """Consumo da OpenAI (tokens e custo estimado) por vistoria, endpoint e modelo, com os orçamentos"""
+    summary = usage_summary(db, inspection_id, days)
+    summary['budget'] = budget_status(inspection_id)
+    return summary
+
 # ==================== ENDPOINTS DE TEMPLATES ====================
 @app.get('/api/templates')
-async def get_templates(db: Session = Depends(get_db)):
-    """Lista todos os templates disponíveis"""
-    templates = db.query(Template).all()
-    return {'templates': [{'id': t.id, 'name': t.name, 'type': t.type, 'rooms_items': t.rooms_items} for t in templates]}
+async def get_templates(request: Request):
+    """Lista todos os templates disponíveis (cache em memória, com ETag)"""
+    return await run_in_threadpool(templates_cache.json_response, request, ALL_TEMPLATES)
 
 @app.get('/api/templates/{template_id}')
-async def get_template(template_id: int, db: Session = Depends(get_db)):
+async def get_template(template_id: int, request: Request):
     """Obter template específico"""
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
+    response = await run_in_threadpool(templates_cache.json_response, request, template_id)
+    if response is None:
         raise HTTPException(status_code=404, detail="Template não encontrado")
-    return template
+    return response
 
 @app.post('/api/templates')
 async def create_template(template_data: dict, db: Session = Depends(get_db)):
@@ -189,11 +253,109 @@ async def get_inspection(inspection_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Vistoria não encontrada")
     return inspection
 
-@app.get('/api/inspections')
-async def list_inspections(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Listar vistorias"""
-    inspections = db.query(Inspection).offset(skip).limit(limit).all()
-    return {'inspections': inspections}
+@app.get('/api/inspections/{inspection_id}/full', response_model=InspectionDetail)
+async def get_inspection_full(inspection_id: int, request: Request, db: Session = Depends(get_db)):
+    """Vistoria completa com itens e arquivos em número fixo de consultas.
+
+    Carrega vistoria, itens e arquivos com selectinload (3 consultas, qualquer que
+    seja o tamanho da vistoria) e agrupa os arquivos por item em memória, evitando
+    o lazy load de ChecklistItem.files. Suporta If-None-Match (304).
+    """
+    inspection = db.query(Inspection).options(
+        selectinload(Inspection.checklist_items),
+        selectinload(Inspection.files)
+    ).filter(Inspection.id == inspection_id).first()
+    if not inspection:
+        raise HTTPException(status_code=404, detail="Vistoria não encontrada")
+    
+    files_by_item = {}
+    for f in inspection.files:
+        files_by_item.setdefault(f.checklist_item_id, []).append(f)
+    # Preenche ChecklistItem.files sem consultar o banco
+    for item in inspection.checklist_items:
+        set_committed_value(item, 'files', files_by_item.get(item.id, []))
+    
+    detail = InspectionDetail.model_validate(inspection).model_copy(update={
+        'files': [InspectionFileDetail.model_validate(f) for f in files_by_item.get(None, [])]
+    })
+    return json_with_etag(request, detail)
+
+@app.get('/api/inspections', response_model=InspectionListResponse)
+async def list_inspections(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    status: Optional[str] = None,
+    inspection_type: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    count: str = Query('none', pattern='^(none|estimate|exact)$'),
+    db: Session = Depends(get_db)
+):
+    """Listar vistorias com paginação por cursor (created_at, id), mais recentes primeiro.
+
+    Retorna apenas a projeção resumida; as assinaturas em base64 não são carregadas.
+    O total só é calculado quando solicitado: `estimate` não varre a tabela,
+    `exact` faz COUNT(*) com os filtros aplicados.
+    """
+    query = db.query(Inspection).options(load_only(*[
+        getattr(Inspection, field) for field in InspectionSummary.model_fields
+    ]))
+    if status:
+        query = query.filter(Inspection.status == status)
+    if inspection_type:
+        query = query.filter(Inspection.inspection_type == inspection_type)
+    if date_from:
+        query = query.filter(Inspection.created_at >= date_from)
+    if date_to:
+        query = query.filter(Inspection.created_at < date_to)
+    
+    total = None
+    if count == 'exact':
+        total = query.with_entities(func.count(Inspection.id)).scalar()
+    elif count == 'estimate':
+        total = estimate_row_count(db, Inspection)
+    
+    try:
+        page_query = apply_keyset(query, Inspection, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Busca um registro extra para saber se existe próxima página
+    rows = page_query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return InspectionListResponse(
+        inspections=[InspectionSummary.model_validate(row) for row in rows],
+        next_cursor=next_cursor,
+        total=total,
+        total_is_estimate=count == 'estimate'
+    )
+
+# ==================== ENDPOINTS DE CHECKLIST ====================
+@app.post('/api/inspections/{inspection_id}/items/bulk', response_model=ChecklistBulkResponse)
+async def bulk_upsert_checklist_items(inspection_id: int, payload: ChecklistBulkRequest, db: Session = Depends(get_db)):
+    """Cria ou atualiza itens do checklist em lote (chave: cômodo + item).
+
+    Cada item é validado individualmente; os válidos são gravados em uma única
+    transação e o resultado é informado item a item.
+    """
+    if not db.query(Inspection.id).filter(Inspection.id == inspection_id).first():
+        raise HTTPException(status_code=404, detail="Vistoria não encontrada")
+    try:
+        results = upsert_checklist_items(db, inspection_id, payload.items)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na gravação em lote: {str(e)}")
+    
+    return ChecklistBulkResponse(
+        inspection_id=inspection_id,
+        created=sum(1 for r in results if r.status == 'created'),
+        updated=sum(1 for r in results if r.status == 'updated'),
+        invalid=sum(1 for r in results if r.status == 'invalid'),
+        results=results
+    )
 
 # ==================== ENDPOINTS DE IA APRIMORADA ====================
 @app.post('/api/vision/enhanced')
@@ -202,6 +364,8 @@ async def enhanced_vision_analysis(file: UploadFile = File(...), item_type: str
     try:
         result = await enhanced_image_analysis(file, item_type)
         return result
+    except BudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na análise aprimorada: {str(e)}")
 
@@ -223,7 +387,7 @@ async def auto_create_checklist(files: List[UploadFile] = File(...)):
         
         result = await auto_generate_checklist(files)
         return result
-    except HTTPException:
+    except (HTTPException, BudgetExceeded):
         raise
     except Exception as e:
         import traceback
@@ -249,19 +413,55 @@ async def enhanced_transcription(file: UploadFile = File(...)):
     try:
         result = await transcribe_audio_enhanced(file)
         return result
+    except BudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na transcrição aprimorada: {str(e)}")
 
 # ==================== ENDPOINTS DE COMPARAÇÃO ====================
 @app.get('/api/compare/{entrada_id}/{saida_id}')
-async def compare_inspections(entrada_id: int, saida_id: int, db: Session = Depends(get_db)):
-    """Compara vistoria de entrada com saída"""
-    from .background_tasks import generate_comparison_report
+async def compare_inspections_endpoint(
+    entrada_id: int,
+    saida_id: int,
+    region: str = "RJ",
+    mode: str = Query('auto', pattern='^(auto|sync|async)$'),
+    db: Session = Depends(get_db)
+):
+    """Compara vistoria de entrada com saída.
+
+    Resultado em cache (nenhuma das vistorias mudou) volta na hora. No modo
+    `auto`, comparações pequenas (até COMPARE_SYNC_MAX_ITEMS itens somando as
+    duas vistorias) são calculadas na própria requisição e as maiores vão para
+    a fila; se a fila estiver indisponível, calcula na requisição.
+    """
+    from .background_tasks import generate_comparison_report, enqueue, PRIORITY_INTERACTIVE
+    versions = get_inspection_versions(db, entrada_id, saida_id)
+    for inspection_id in (entrada_id, saida_id):
+        if inspection_id not in versions:
+            raise HTTPException(status_code=404, detail=f"Vistoria {inspection_id} não encontrada")
+    
+    cached = get_cached_comparison(db, entrada_id, saida_id, region, versions)
+    if cached is not None:
+        return {'status': 'completed', 'cached': True, 'result': cached}
+    
+    if mode == 'auto':
+        item_count = db.query(func.count(ChecklistItem.id)).filter(
+            ChecklistItem.inspection_id.in_([entrada_id, saida_id])
+        ).scalar()
+        mode = 'sync' if item_count <= COMPARE_SYNC_MAX_ITEMS else 'async'
+    
+    if mode == 'async':
+        try:
+            result = enqueue(generate_comparison_report, entrada_id, saida_id, region, priority=PRIORITY_INTERACTIVE)
+            return {'task_id': result.id, 'status': 'processing'}
+        except Exception as e:
+            print(f"Fila indisponível, comparando na requisição: {e}")
+    
     try:
-        result = generate_comparison_report.delay(entrada_id, saida_id)
-        return {'task_id': result.id, 'status': 'processing'}
+        result = await run_in_threadpool(compare_inspections, db, entrada_id, saida_id, region)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na comparação: {str(e)}")
+    return {'status': 'completed', 'cached': result.pop('cached', False), 'result': result}
 
 # ==================== ENDPOINTS DE CUSTOS ====================
 @app.post('/api/estimate-costs')
@@ -281,10 +481,9 @@ async def estimate_repair_costs(inspection_id: int, region: str = "RJ", db: Sess
         raise HTTPException(status_code=500, detail=f"Erro no cálculo de custos: {str(e)}")
 
 @app.get('/api/repair-costs/{region}')
-async def get_repair_costs_table(region: str, db: Session = Depends(get_db)):
-    """Obter tabela de custos por região"""
-    costs = db.query(RepairCostTable).filter(RepairCostTable.region == region).all()
-    return {'costs': costs}
+async def get_repair_costs_table(region: str, request: Request):
+    """Obter tabela de custos por região (cache em memória, com ETag)"""
+    return await run_in_threadpool(repair_costs_cache.json_response, request, region, {'costs': []})
 
 # ==================== ENDPOINTS DE BACKGROUND TASKS ====================
 @app.post('/api/batch-process')
@@ -292,20 +491,70 @@ async def start_batch_processing_endpoint(
     inspection_id: int,
     image_files: List[str] = [],
     audio_files: List[str] = [],
-    document_files: List[str] = []
+    document_files: List[str] = [],
+    region: str = "RJ"
 ):
-    """Inicia processamento em batch"""
+    """Inicia processamento em batch (mídia em paralelo -> custos -> relatório)"""
     try:
-        task_results = start_batch_processing(inspection_id, image_files, audio_files, document_files)
-        return {'task_results': task_results}
+        pipeline = start_batch_processing(inspection_id, image_files, audio_files, document_files, region)
+        return {'pipeline_id': pipeline['pipeline_id'], 'task_results': pipeline['stages']}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no processamento em batch: {str(e)}")
 
+@app.get('/api/batch-process/{pipeline_id}')
+async def check_pipeline_status(pipeline_id: str):
+    """Status agregado do processamento em batch de uma vistoria"""
+    try:
+        status = get_pipeline_status(pipeline_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao verificar status: {str(e)}")
+    if status is None:
+        raise HTTPException(status_code=404, detail="Processamento não encontrado")
+    return status
+
+@app.post('/api/checklist/reprioritize')
+async def reprioritize_checklist(inspection_id: Optional[int] = None, dry_run: bool = False):
+    """Recalcula em background a prioridade dos itens a partir das análises guardadas.
+
+    Só as linhas cuja prioridade mudou são gravadas; o resultado (itens lidos,
+    alterados, transições e itens/s) fica em /api/task-status/{task_id}.
+    """
+    from .background_tasks import reprioritize_checklist_items_task, enqueue, PRIORITY_BATCH
+    try:
+        result = enqueue(reprioritize_checklist_items_task, inspection_id, dry_run, priority=PRIORITY_BATCH)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao iniciar a repriorização: {str(e)}")
+    return {'task_id': result.id, 'status': 'processing'}
+
+@app.get('/api/inspections/{inspection_id}/events')
+async def inspection_events(inspection_id: int, request: Request, pipeline_id: Optional[str] = None):
+    """Stream (Server-Sent Events) com o progresso das tasks da vistoria.
+
+    Substitui o polling de /api/task-status: cada cliente mantém uma conexão e
+    recebe mudanças de estado das tasks (`type: task`) e o progresso por
+    arquivo (`type: file`). Com `pipeline_id`, o primeiro evento é o status
+    agregado atual do pipeline.
+    """
+    async def stream():
+        if pipeline_id:
+            status = await run_in_threadpool(get_pipeline_status, pipeline_id)
+            if status is not None:
+                yield format_sse(status, name='pipeline')
+        async for event in subscribe_progress(inspection_id):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
+    
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # desativa o buffer do nginx
+    })
+
 @app.get('/api/task-status/{task_id}')
-async def check_task_status(task_id: str):
-    """Verifica status de task em background"""
+async def check_task_status(task_id: str, expand: bool = False):
+    """Verifica status de task em background (expand=true inclui o resultado completo)"""
     try:
-        status = get_task_status(task_id)
+        status = get_task_status(task_id, expand=expand)
         return status
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao verificar status: {str(e)}")
@@ -322,14 +571,16 @@ async def upload_file(
     """Upload de arquivo com salvamento no banco"""
     try:
         # Criar diretório se não existe
-        upload_dir = "VistorIA/static/uploads"
+        upload_dir = MEDIA_ROOT
         os.makedirs(upload_dir, exist_ok=True)
         
-        # Salvar arquivo
-        file_path = os.path.join(upload_dir, f"{inspection_id}_{file.filename}")
+        # Só o nome: "../" no nome enviado não pode gravar fora de MEDIA_ROOT
+        filename = os.path.basename((file.filename or '').replace('\\', '/')) or 'arquivo'
+        
+        # Salvar arquivo (cópia em blocos, sem carregar o arquivo inteiro na memória)
+        file_path = os.path.join(upload_dir, f"{inspection_id}_{filename}")
         with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
         
         # Salvar no banco
         file_record = InspectionFile(
@@ -337,21 +588,156 @@ async def upload_file(
             checklist_item_id=checklist_item_id,
             file_type=file_type,
             file_path=file_path,
-            original_filename=file.filename
+            original_filename=filename
         )
         db.add(file_record)
+        if file_type == 'photo':
+            # Quase-duplicata de uma foto anterior reaproveita a análise dela
+            await run_in_threadpool(register_photo, db, file_record)
         db.commit()
         
-        return {'file_id': file_record.id, 'file_path': file_path}
+        return {
+            'file_id': file_record.id, 'file_path': file_path,
+            'media_url': sign_media_url(f"/api/media/files/{file_record.id}"),
+            'duplicate_of': file_record.duplicate_of_id
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
 
+# ==================== MÍDIA (RANGE E URL ASSINADA) ====================
+REPORT_NAME = re.compile(r'^vistoria_[0-9a-f]{8}\.pdf$')
+
+def _check_media_signature(request: Request, expires: Optional[int], sig: Optional[str]) -> None:
+    if not verify_media_signature(request.url.path, expires, sig):
+        raise HTTPException(status_code=403, detail="Link de mídia inválido ou expirado")
+
+@app.api_route('/api/media/files/{file_id}', methods=['GET', 'HEAD'])
+async def media_file(file_id: int, request: Request, expires: Optional[int] = None, sig: Optional[str] = None,
+                     db: Session = Depends(get_db)):
+    """Arquivo da vistoria (foto, áudio, vídeo) com Range; exige o link assinado"""
+    _check_media_signature(request, expires, sig)
+    file_record = db.query(InspectionFile).filter(InspectionFile.id == file_id).first()
+    try:
+        if not file_record:
+            raise MediaNotFound(file_id)
+        return media_response(request, file_record.file_path, filename=file_record.original_filename)
+    except MediaNotFound:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+@app.get('/api/media/files/{file_id}/url')
+async def media_file_url(file_id: int, expires: Optional[int] = None, sig: Optional[str] = None,
+                         db: Session = Depends(get_db)):
+    """Renova o link assinado (válido por MEDIA_URL_TTL segundos) do arquivo.
+
+    Exige expires/sig de um link já emitido para o mesmo arquivo (no upload ou
+    numa renovação), mesmo vencido há até MEDIA_URL_RENEW_SECONDS.
+    """
+    path = f"/api/media/files/{file_id}"
+    if not verify_media_signature(path, expires, sig, grace=MEDIA_URL_RENEW_SECONDS):
+        raise HTTPException(status_code=403, detail="Link de mídia inválido ou expirado")
+    if not db.query(InspectionFile.id).filter(InspectionFile.id == file_id).first():
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return {'url': sign_media_url(path), 'expires_in': MEDIA_URL_TTL}
+
+@app.api_route('/api/media/reports/{report_name}', methods=['GET', 'HEAD'])
+async def media_report(report_name: str, request: Request, expires: Optional[int] = None, sig: Optional[str] = None):
+    """PDF de relatório já gerado (retomada de download com Range); exige o link assinado"""
+    _check_media_signature(request, expires, sig)
+    try:
+        if not REPORT_NAME.match(report_name):
+            raise MediaNotFound(report_name)
+        return media_response(request, os.path.join(MEDIA_ROOT, report_name), media_type='application/pdf', attachment=True)
+    except MediaNotFound:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+
+# ==================== UPLOADS RETOMÁVEIS ====================
+def _upload_headers(upload) -> dict:
+    return {'Upload-Offset': str(upload.received), 'Upload-Length': str(upload.total_size), 'Cache-Control': 'no-store'}
+
+@app.post('/api/uploads', status_code=201)
+async def create_resumable_upload(payload: ResumableUploadCreate, db: Session = Depends(get_db)):
+    """Inicia um upload retomável; os bytes são enviados com PATCH /api/uploads/{upload_id}"""
+    try:
+        upload = create_upload(
+            db, payload.inspection_id, payload.file_type, payload.filename, payload.size,
+            checklist_item_id=payload.checklist_item_id, sha256=payload.sha256
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    location = f"/api/uploads/{upload.id}"
+    return JSONResponse(
+        status_code=201,
+        content={'upload_id': upload.id, 'offset': 0, 'size': upload.total_size, 'location': location},
+        headers=dict(_upload_headers(upload), Location=location)
+    )
+
+@app.head('/api/uploads/{upload_id}')
+async def resumable_upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    """Offset atual do upload (de onde o cliente deve retomar)"""
+    try:
+        upload = get_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(status_code=200, headers=_upload_headers(upload))
+
+@app.get('/api/uploads/{upload_id}')
+async def resumable_upload_status(upload_id: str, db: Session = Depends(get_db)):
+    """Status do upload retomável"""
+    try:
+        upload = get_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return JSONResponse(
+        content={
+            'upload_id': upload.id, 'offset': upload.received, 'size': upload.total_size,
+            'completed': upload.file_id is not None, 'file_id': upload.file_id
+        },
+        headers=_upload_headers(upload)
+    )
+
+@app.patch('/api/uploads/{upload_id}')
+async def resumable_upload_chunk(upload_id: str, request: Request, db: Session = Depends(get_db)):
+    """Envia um trecho do arquivo (corpo bruto) a partir do cabeçalho Upload-Offset"""
+    try:
+        offset = int(request.headers['upload-offset'])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Cabeçalho Upload-Offset ausente ou inválido")
+    try:
+        new_offset = await append_chunk(db, upload_id, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(status_code=204, headers={'Upload-Offset': str(new_offset), 'Cache-Control': 'no-store'})
+
+@app.post('/api/uploads/{upload_id}/complete')
+async def complete_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Finaliza o upload: confere o sha256 e registra o arquivo na vistoria"""
+    try:
+        file_record = await complete_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {
+        'file_id': file_record.id, 'file_path': file_record.file_path, 'sha256': file_record.sha256,
+        'media_url': sign_media_url(f"/api/media/files/{file_record.id}"),
+        'duplicate_of': file_record.duplicate_of_id
+    }
+
+@app.delete('/api/uploads/{upload_id}', status_code=204)
+async def abort_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Cancela o upload e descarta os bytes recebidos"""
+    try:
+        abort_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(status_code=204)
+
 @app.post('/api/transcribe')
 async def api_transcribe(file: UploadFile = File(...)):
     """Transcreve áudio para texto usando Whisper"""
     try:
         text = await transcribe_audio(file)
         return {'text': text}
+    except BudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na transcrição: {str(e)}")
 
@@ -401,13 +787,16 @@ async def api_vision(file: UploadFile = File(...), prompt: str = Form('Descreva
         # Análise principal do item
         try:
             description = await analyze_image(file1, prompt)
+        except BudgetExceeded:
+            raise
         except Exception as e:
             print(f"Erro na análise principal: {e}")
             description = f"Erro ao analisar imagem: {str(e)}"
         
-        # Detecção automática de outros itens na foto (não bloquear se falhar)
+        # Detecção automática de outros itens na foto (não bloquear se falhar;
+        # pulada quando o orçamento da OpenAI está no fim)
         try:
-            detected_items = await detect_items_in_single_image(file2)
+            detected_items = await detect_items_in_single_image(file2, optional=True)
         except Exception as e:
             print(f"Erro na detecção de itens: {e}")
             detected_items = []
@@ -417,7 +806,7 @@ async def api_vision(file: UploadFile = File(...), prompt: str = Form('Descreva
             'detected_items': detected_items or [],
             'has_other_items': len(detected_items or []) > 0
         }
-    except HTTPException:
+    except (HTTPException, BudgetExceeded):
         raise
     except Exception as e:
         import traceback
@@ -432,18 +821,24 @@ async def api_summarize(text: str = Form(...)):
     try:
         summary = await summarize_text(text)
         return {'summary': summary}
+    except BudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no resumo: {str(e)}")
 
 @app.post('/api/report')
-async def api_report(payload: ReportRequest):
+async def api_report(payload: ReportRequest, request: Request):
     """Gera relatório PDF da vistoria"""
     try:
         pdf_path = await build_report_pdf(payload)
-        return FileResponse(
-            pdf_path, 
-            media_type='application/pdf', 
-            filename=f"vistoria_{payload.propertyAddress.replace(' ', '_')}.pdf"
+        response = media_response(
+            request, pdf_path,
+            media_type='application/pdf',
+            filename=f"vistoria_{payload.propertyAddress.replace(' ', '_')}.pdf",
+            attachment=True
         )
+        # Link para retomar o download (Range) sem gerar o PDF de novo
+        response.headers['X-Report-Url'] = sign_media_url(f"/api/media/reports/{os.path.basename(pdf_path)}")
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na geração do PDF: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Download de mídia e relatórios com URL assinada, Range e requisições condicionais.
+
+Uploads e PDFs ficam em MEDIA_ROOT, fora do diretório servido em /static: o
+único acesso é pelos links (/api/media/...), que levam expires e sig
+(HMAC-SHA256 com MEDIA_SIGNING_KEY) e funcionam direto em <audio>/<video>, sem
+cabeçalhos extras. Os links saem nas respostas que listam arquivos (upload,
+vistoria completa, status expandido das tasks) ou na renovação, que exige um
+link do mesmo arquivo vencido há no máximo MEDIA_URL_RENEW_SECONDS. A resposta
+suporta Range (avançar no player, retomar download), If-Range, If-None-Match e
+If-Modified-Since. Com MEDIA_ACCEL_REDIRECT, o envio do arquivo fica com o
+nginx (X-Accel-Redirect, sendfile); sem ele, o arquivo sai em blocos de
+MEDIA_CHUNK_SIZE, ou via pathsend nos servidores ASGI que o suportam.
+"""
+import hashlib
+import hmac
+import mimetypes
+import os
+import secrets
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from .http_cache import etag_matches
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "VistorIA/media")
+# Diretório público das versões anteriores: os arquivos gravados ali continuam
+# acessíveis, só pelos links assinados (/static/uploads não é mais servido)
+LEGACY_MEDIA_ROOT = "VistorIA/static/uploads"
+MEDIA_URL_TTL = int(os.getenv("MEDIA_URL_TTL", "3600"))
+MEDIA_URL_RENEW_SECONDS = int(os.getenv("MEDIA_URL_RENEW_SECONDS", str(7 * 24 * 3600)))
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+# Prefixo de uma location internal do nginx apontando para MEDIA_ROOT (ex.: /_media/)
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "")
+
+_signing_key = os.getenv("MEDIA_SIGNING_KEY") or os.getenv("SECRET_KEY")
+if not _signing_key:
+    # Links só valem neste processo; com vários workers configure MEDIA_SIGNING_KEY
+    print("MEDIA_SIGNING_KEY não configurada - usando chave temporária")
+    _signing_key = secrets.token_hex(32)
+_signing_key = _signing_key.encode()
+
+class MediaNotFound(Exception):
+    """Arquivo inexistente ou fora do diretório de mídia"""
+
+def _signature(path: str, expires: int) -> str:
+    return hmac.new(_signing_key, f"{path}\n{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def sign_media_url(path: str, ttl: Optional[int] = None, aligned: bool = False) -> str:
+    """URL de path (/api/media/...) válida por ttl segundos.
+
+    aligned arredonda a expiração para o fim da janela de ttl seguinte (validade
+    entre ttl e 2*ttl): a URL não muda dentro da janela, e respostas com ETag
+    que a incluem continuam dando 304.
+    """
+    ttl = ttl or MEDIA_URL_TTL
+    now = int(time.time())
+    expires = (now // ttl + 2) * ttl if aligned else now + ttl
+    return f"{path}?expires={expires}&sig={_signature(path, expires)}"
+
+def file_media_url(file_id: int) -> str:
+    """Link assinado (estável dentro da janela de MEDIA_URL_TTL) de um arquivo da vistoria"""
+    return sign_media_url(f"/api/media/files/{file_id}", aligned=True)
+
+def verify_media_signature(path: str, expires: Optional[int], sig: Optional[str], grace: int = 0) -> bool:
+    """Confere a assinatura; grace aceita links vencidos há até grace segundos (renovação)"""
+    if expires is None or not sig or expires + grace < time.time():
+        return False
+    return hmac.compare_digest(_signature(path, expires), sig)
+
+def _inside(root: str, path: str) -> bool:
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, path]) == root
+
+def resolve_media_path(file_path: str) -> str:
+    """Caminho real do arquivo, desde que esteja dentro de MEDIA_ROOT (ou do diretório antigo)"""
+    path = os.path.realpath(file_path)
+    if not (_inside(MEDIA_ROOT, path) or _inside(LEGACY_MEDIA_ROOT, path)) or not os.path.isfile(path):
+        raise MediaNotFound(file_path)
+    return path
+
+class MediaFileResponse(FileResponse):
+    """FileResponse com blocos maiores (menos idas ao thread pool por arquivo)"""
+    chunk_size = MEDIA_CHUNK_SIZE
+
+def _not_modified(request: Request, response: Response) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(request, response.headers["etag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(response.headers["last-modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def media_response(request: Request, file_path: str, filename: Optional[str] = None,
+                   media_type: Optional[str] = None, attachment: bool = False) -> Response:
+    """Resposta do arquivo com Range, ETag/Last-Modified e 304"""
+    path = resolve_media_path(file_path)
+    stat_result = os.stat(path)
+    media_type = media_type or mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+    response = MediaFileResponse(
+        path, stat_result=stat_result, media_type=media_type, filename=filename,
+        content_disposition_type="attachment" if attachment else "inline"
+    )
+    # Link assinado: cache só no navegador, pelo tempo de validade do link
+    response.headers["Cache-Control"] = f"private, max-age={MEDIA_URL_TTL}"
+    if _not_modified(request, response):
+        return NotModifiedResponse(response.headers)
+    if MEDIA_ACCEL_REDIRECT and _inside(MEDIA_ROOT, path):
+        # O nginx envia o arquivo (sendfile) e trata Range a partir daqui
+        relative = os.path.relpath(path, os.path.realpath(MEDIA_ROOT)).replace(os.sep, "/")
+        headers = {
+            key: response.headers[key]
+            for key in ("content-type", "content-disposition", "etag", "last-modified", "cache-control")
+            if key in response.headers
+        }
+        headers["X-Accel-Redirect"] = MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + quote(relative)
+        return Response(status_code=200, headers=headers)
+    return response
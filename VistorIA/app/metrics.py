@@ -0,0 +1,243 @@
+"""Métricas no formato do Prometheus (endpoint /metrics).
+
+- Latência das requisições por rota (template da rota, não a URL) e número de
+  consultas ao banco por requisição;
+- Chamadas à OpenAI: latência, tokens, novas tentativas e chamadas coalescidas por função;
+- Etapas pesadas (YOLO, OCR, PDF): duração;
+- Profundidade das filas do Celery (LLEN no Redis) ou das tasks locais.
+
+As métricas ficam na memória de cada processo: o /metrics da API mostra o que
+roda na API (inclusive o backend local de tasks). Sem o pacote
+prometheus_client, os registros viram no-ops e /metrics responde 503.
+"""
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily
+    METRICS_ENABLED = True
+except ImportError:
+    METRICS_ENABLED = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    print("prometheus_client não disponível - métricas desativadas")
+
+class _NoopMetric:
+    """Substituto das métricas quando o prometheus_client não está instalado"""
+    
+    def labels(self, *args, **kwargs):
+        return self
+    
+    def observe(self, amount):
+        pass
+    
+    def inc(self, amount=1):
+        pass
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+if METRICS_ENABLED:
+    HTTP_REQUEST_DURATION = Histogram(
+        "vistoria_http_request_duration_seconds", "Latência das requisições HTTP",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS
+    )
+    HTTP_REQUEST_DB_QUERIES = Histogram(
+        "vistoria_http_request_db_queries", "Consultas ao banco por requisição HTTP",
+        ["method", "route"], buckets=QUERY_COUNT_BUCKETS
+    )
+    OPENAI_REQUEST_DURATION = Histogram(
+        "vistoria_openai_request_duration_seconds", "Latência das chamadas à OpenAI (incluindo novas tentativas)",
+        ["function", "model", "outcome"], buckets=LATENCY_BUCKETS
+    )
+    OPENAI_TOKENS = Counter(
+        "vistoria_openai_tokens", "Tokens consumidos na OpenAI", ["function", "model", "kind"]
+    )
+    OPENAI_RETRIES = Counter(
+        "vistoria_openai_retries", "Novas tentativas feitas pelo cliente da OpenAI", ["function", "model"]
+    )
+    OPENAI_COALESCED = Counter(
+        "vistoria_openai_coalesced", "Requisições que aguardaram uma chamada idêntica já em andamento", ["function"]
+    )
+    STAGE_DURATION = Histogram(
+        "vistoria_stage_duration_seconds", "Duração das etapas de processamento (yolo, ocr, pdf)",
+        ["stage"], buckets=LATENCY_BUCKETS
+    )
+else:
+    HTTP_REQUEST_DURATION = HTTP_REQUEST_DB_QUERIES = _NoopMetric()
+    OPENAI_REQUEST_DURATION = OPENAI_TOKENS = OPENAI_RETRIES = OPENAI_COALESCED = STAGE_DURATION = _NoopMetric()
+
+# ==================== ETAPAS ====================
+@contextmanager
+def observe_stage(stage: str):
+    """Mede a duração de uma etapa (with observe_stage('yolo'): ...)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+
+def timed_stage(stage: str):
+    """Decorator equivalente a observe_stage para funções (síncronas ou async)"""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with observe_stage(stage):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with observe_stage(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ==================== BANCO DE DADOS ====================
+# Contador da requisição atual; lista para ser compartilhada com as threads do
+# threadpool (que recebem uma cópia do contexto, não do valor)
+_db_queries: ContextVar[Optional[List[int]]] = ContextVar("vistoria_db_queries", default=None)
+
+def instrument_engine(engine) -> None:
+    """Conta as consultas executadas durante cada requisição"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = _db_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+# ==================== HTTP ====================
+def install_http_metrics(app) -> None:
+    """Middleware que mede latência e consultas ao banco por rota"""
+    @app.middleware("http")
+    async def _http_metrics(request, call_next):
+        counter = [0]
+        token = _db_queries.set(counter)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            _db_queries.reset(token)
+            # Template da rota (/api/inspections/{inspection_id}) mantém a cardinalidade baixa
+            route = request.scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+            HTTP_REQUEST_DB_QUERIES.labels(request.method, route).observe(counter[0])
+
+# ==================== OPENAI ====================
+# Tentativas HTTP da chamada atual (o cliente da OpenAI refaz a requisição sozinho)
+_openai_attempts: ContextVar[Optional[List[int]]] = ContextVar("vistoria_openai_attempts", default=None)
+
+async def _count_attempt(request) -> None:
+    attempts = _openai_attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+def openai_http_client():
+    """Cliente HTTP da OpenAI (padrões da biblioteca) que conta as tentativas"""
+    from openai import DefaultAsyncHttpxClient
+    return DefaultAsyncHttpxClient(event_hooks={"request": [_count_attempt]})
+
+class track_openai:
+    """Mede uma chamada à OpenAI: latência, tokens (response.usage) e novas tentativas.
+    
+    async with track_openai('analyze_image', model) as call:
+        response = await _client.chat.completions.create(...)
+        call.record(response)
+    """
+    
+    def __init__(self, function: str, model: str):
+        self.function = function
+        self.model = model
+    
+    async def __aenter__(self):
+        self._attempts = [0]
+        self._token = _openai_attempts.set(self._attempts)
+        self._start = time.perf_counter()
+        # Consumo da chamada (tokens de entrada/saída e segundos de áudio), preenchido por record()
+        self.usage = {"prompt": 0, "completion": 0, "seconds": 0.0}
+        return self
+    
+    def record(self, response) -> None:
+        usage = getattr(response, "usage", None)
+        for kind in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens"):
+            value = getattr(usage, kind, None)
+            if isinstance(value, int) and value:
+                label = kind.split("_")[0]
+                OPENAI_TOKENS.labels(self.function, self.model, label).inc(value)
+                self.usage["prompt" if label in ("prompt", "input") else "completion"] += value
+        # Whisper informa a duração do áudio em vez de tokens
+        seconds = getattr(usage, "seconds", None)
+        if isinstance(seconds, (int, float)):
+            self.usage["seconds"] += seconds
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        _openai_attempts.reset(self._token)
+        outcome = "error" if exc_type else "ok"
+        OPENAI_REQUEST_DURATION.labels(self.function, self.model, outcome).observe(time.perf_counter() - self._start)
+        if self._attempts[0] > 1:
+            OPENAI_RETRIES.labels(self.function, self.model).inc(self._attempts[0] - 1)
+        return False
+
+# ==================== FILAS ====================
+# Separador usado pelo kombu nas listas de prioridade do Redis (fila\x06\x16N)
+_PRIORITY_SEP = "\x06\x16"
+_QUEUES = ("cpu", "io", "quick")
+
+class _QueueDepthCollector:
+    """Profundidade das filas, lida a cada coleta do /metrics"""
+    
+    def _gauge(self):
+        return GaugeMetricFamily(
+            "vistoria_task_queue_depth", "Tasks aguardando na fila (backend local: pendentes ou em execução)",
+            labels=["queue", "backend"]
+        )
+    
+    def describe(self):
+        # Sem describe o registro chamaria collect() já no import (ciclo com background_tasks)
+        yield self._gauge()
+    
+    def collect(self):
+        from .background_tasks import celery_app
+        from .task_backend import local_queue_depth, use_celery
+        
+        gauge = self._gauge()
+        if use_celery(celery_app):
+            try:
+                with celery_app.connection_for_read() as conn:
+                    client = conn.default_channel.client
+                    pipe = client.pipeline()
+                    for queue in _QUEUES:
+                        pipe.llen(queue)
+                        for step in range(1, 10):
+                            pipe.llen(f"{queue}{_PRIORITY_SEP}{step}")
+                    lengths = pipe.execute()
+                for index, queue in enumerate(_QUEUES):
+                    gauge.add_metric([queue, "celery"], sum(lengths[index * 10:(index + 1) * 10]))
+            except Exception as e:
+                print(f"Erro ao ler profundidade das filas: {e}")
+        else:
+            depths = local_queue_depth()
+            for queue in _QUEUES:
+                gauge.add_metric([queue, "local"], depths.get(queue, 0))
+        yield gauge
+
+if METRICS_ENABLED and os.getenv("METRICS_QUEUE_DEPTH", "true").lower() != "false":
+    REGISTRY.register(_QueueDepthCollector())
+
+def render_metrics():
+    """Corpo e content-type da resposta do /metrics (None se desativado)"""
+    if not METRICS_ENABLED:
+        return None, CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,258 @@
+"""Pipeline de OCR: divisão em páginas, pré-processamento e Tesseract em paralelo.
+
+PDFs (via PyMuPDF) e TIFFs multipágina são divididos em páginas; cada página é
+pré-processada e reconhecida em um pool de processos, e o texto fica em cache
+por hash do conteúdo (tabela ocr_page_cache), então reenviar o mesmo documento
+ou a mesma página não roda o Tesseract de novo.
+
+O pré-processamento (redução para ~300 DPI, limiarização adaptativa ou Otsu,
+remoção de bordas, correção de inclinação e recorte) usa só OpenCV/NumPy;
+benchmarks/bench_ocr_preprocess.py mede latência e acurácia.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image, ImageSequence
+from sqlalchemy.exc import IntegrityError
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+    print("PyMuPDF não disponível - OCR de PDF desativado")
+
+from .database import SessionLocal, OcrPageCache
+from .metrics import timed_stage
+
+if os.getenv("TESSERACT_CMD"):
+    pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD")
+# As páginas já rodam em paralelo; threads internas do Tesseract só disputariam CPU
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+OCR_LANG = os.getenv("OCR_LANG", "por")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+PDF_RENDER_DPI = int(os.getenv("OCR_PDF_DPI", "300"))
+# Pré-processamento: etapas habilitadas, em ordem fixa (scale, threshold, deskew, crop)
+OCR_PREPROCESS = {step.strip() for step in os.getenv("OCR_PREPROCESS", "scale,threshold,deskew,crop").split(",") if step.strip()}
+OCR_THRESHOLD = os.getenv("OCR_THRESHOLD", "adaptive")  # adaptive | otsu
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "4000"))  # limite para fotos sem DPI informado (A4 a 300 DPI: 3508)
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "15"))  # graus; acima disso a estimativa não é confiável
+# Mudanças no pré-processamento devem incrementar a versão para invalidar o cache
+PREPROCESS_VERSION = "2:" + ",".join(sorted(OCR_PREPROCESS)) + f":{OCR_THRESHOLD}:{OCR_TARGET_DPI}:{OCR_MAX_SIDE}"
+
+_executor = None
+
+def _scale_factor(image: Image.Image, shape) -> float:
+    """Fator para levar a imagem à resolução ideal do Tesseract (~300 DPI)"""
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0] and dpi[0] > OCR_TARGET_DPI:
+        return OCR_TARGET_DPI / float(dpi[0])
+    longest = max(shape)
+    if longest > OCR_MAX_SIDE:
+        return OCR_MAX_SIDE / float(longest)
+    return 1.0
+
+def _binarize(gray: np.ndarray) -> np.ndarray:
+    """Texto preto em fundo branco; adaptativo tolera iluminação irregular de fotos"""
+    if OCR_THRESHOLD == 'otsu':
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+    # Média local (filtro de caixa, custo independente da janela); janela ímpar ~1/40 do menor lado
+    block = max(15, (min(gray.shape) // 40) | 1)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, block, 15)
+    # Remover ruído (pontos isolados)
+    return cv2.medianBlur(binary, 3)
+
+def _remove_borders(binary: np.ndarray) -> np.ndarray:
+    """Apaga componentes que tocam a borda (sombra do scanner, beirada da folha)"""
+    # Rotulagem numa versão reduzida (4x): só interessa a forma grosseira das bordas
+    ink = cv2.bitwise_not(binary)
+    small = cv2.resize(ink, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats((small > 0).astype(np.uint8), connectivity=8)
+    rows, cols = small.shape
+    x, y, w, h = (stats[:, i] for i in range(4))
+    touches = (x == 0) | (y == 0) | (x + w >= cols) | (y + h >= rows)
+    touches[0] = False  # rótulo 0 é o fundo
+    if not touches.any():
+        return binary
+    mask = cv2.resize(touches[labels].astype(np.uint8), (binary.shape[1], binary.shape[0]), interpolation=cv2.INTER_NEAREST)
+    cleaned = binary.copy()
+    cleaned[mask.astype(bool)] = 255
+    return cleaned
+
+def _skew_score(ink: np.ndarray, angle: float) -> float:
+    """Nitidez do perfil horizontal: máxima quando as linhas de texto estão na horizontal"""
+    rows, cols = ink.shape
+    matrix = cv2.getRotationMatrix2D((cols / 2, rows / 2), angle, 1.0)
+    profile = cv2.warpAffine(ink, matrix, (cols, rows), flags=cv2.INTER_NEAREST).sum(axis=1, dtype=np.float64)
+    return float(np.square(np.diff(profile)).sum())
+
+def _deskew(binary: np.ndarray) -> np.ndarray:
+    """Corrige a inclinação buscando o ângulo com o perfil de projeção mais nítido"""
+    ink = cv2.bitwise_not(binary)
+    # O ângulo não depende da escala; a busca roda numa versão reduzida
+    factor = min(1.0, 600.0 / max(ink.shape))
+    small = cv2.resize(ink, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    if not small.any():
+        return binary
+    # Busca grossa (1°) e refinamento (0.2°) em torno do melhor ângulo
+    coarse = np.arange(-OCR_MAX_SKEW, OCR_MAX_SKEW + 0.5, 1.0)
+    best = coarse[int(np.argmax([_skew_score(small, angle) for angle in coarse]))]
+    fine = np.arange(best - 1.0, best + 1.1, 0.2)
+    angle = float(fine[int(np.argmax([_skew_score(small, angle) for angle in fine]))])
+    if abs(angle) < 0.3:
+        return binary
+    rows, cols = binary.shape
+    matrix = cv2.getRotationMatrix2D((cols / 2, rows / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (cols, rows), flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+def _crop_to_text(binary: np.ndarray, margin: int = 10) -> np.ndarray:
+    """Recorta a margem em branco, deixando uma borda fixa ao redor do texto"""
+    x, y, w, h = cv2.boundingRect(cv2.bitwise_not(binary))
+    if w == 0 or h == 0:
+        return binary
+    cropped = binary[y:y + h, x:x + w]
+    # O Tesseract reconhece melhor com uma margem branca ao redor do texto
+    return cv2.copyMakeBorder(cropped, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255)
+
+def enhance_image_for_ocr(image: Image.Image) -> Image.Image:
+    """Melhora qualidade da imagem para OCR (etapas configuradas em OCR_PREPROCESS)"""
+    try:
+        # Converter para escala de cinza
+        gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+        
+        if 'scale' in OCR_PREPROCESS:
+            factor = _scale_factor(image, gray.shape)
+            if factor < 1.0:
+                gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        
+        if 'threshold' not in OCR_PREPROCESS:
+            return Image.fromarray(gray)
+        binary = _binarize(gray)
+        
+        if 'crop' in OCR_PREPROCESS:
+            binary = _remove_borders(binary)
+        if 'deskew' in OCR_PREPROCESS:
+            binary = _deskew(binary)
+        if 'crop' in OCR_PREPROCESS:
+            binary = _crop_to_text(binary)
+        
+        return Image.fromarray(binary)
+        
+    except Exception as e:
+        print(f"Erro no enhancement da imagem: {e}")
+        return image
+
+@timed_stage('ocr_split')
+def split_pages(data: bytes) -> List[bytes]:
+    """Divide o documento em páginas, cada uma como imagem PNG (bytes).
+
+    Aceita PDF, TIFF multipágina e imagens comuns (uma página).
+    """
+    if data[:5] == b'%PDF-':
+        if pymupdf is None:
+            raise RuntimeError("OCR de PDF requer o pacote PyMuPDF")
+        pages = []
+        with pymupdf.open(stream=data, filetype='pdf') as document:
+            for page in document:
+                pixmap = page.get_pixmap(dpi=PDF_RENDER_DPI, colorspace=pymupdf.csGRAY)
+                pages.append(pixmap.tobytes('png'))
+        return pages
+    
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, 'n_frames', 1) == 1:
+        return [data]
+    pages = []
+    for frame in ImageSequence.Iterator(image):
+        buffer = io.BytesIO()
+        frame.convert('L').save(buffer, format='PNG')
+        pages.append(buffer.getvalue())
+    return pages
+
+def page_hash(page: bytes, lang: str = OCR_LANG) -> str:
+    """Chave do cache: conteúdo da página + idioma + versão do pré-processamento"""
+    digest = hashlib.sha256(page)
+    digest.update(f"|{lang}|{PREPROCESS_VERSION}".encode())
+    return digest.hexdigest()
+
+def ocr_page(page: bytes, lang: str = OCR_LANG) -> str:
+    """Pré-processa e reconhece uma página (executado nos processos do pool)"""
+    image = enhance_image_for_ocr(Image.open(io.BytesIO(page)))
+    return pytesseract.image_to_string(image, lang=lang)
+
+def _page_executor():
+    """Pool de processos; dentro de um worker Celery (processo daemon) usa threads.
+
+    Processos daemon não podem criar filhos. Threads ainda paralelizam o OCR,
+    pois o Tesseract roda como subprocesso e o OpenCV libera o GIL.
+    """
+    global _executor
+    if _executor is None:
+        if multiprocessing.current_process().daemon:
+            _executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="vistoria-ocr")
+        else:
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def _load_cached(hashes: List[str]) -> Dict[str, str]:
+    db = SessionLocal()
+    try:
+        rows = db.query(OcrPageCache.content_hash, OcrPageCache.text).filter(
+            OcrPageCache.content_hash.in_(set(hashes))
+        ).all()
+        return {content_hash: text for content_hash, text in rows}
+    finally:
+        db.close()
+
+def _store_cached(texts: Dict[str, str]) -> None:
+    if not texts:
+        return
+    db = SessionLocal()
+    try:
+        db.add_all(OcrPageCache(content_hash=h, text=t) for h, t in texts.items())
+        db.commit()
+    except IntegrityError:
+        # Outro processo gravou as mesmas páginas; o texto é o mesmo
+        db.rollback()
+    finally:
+        db.close()
+
+@timed_stage('ocr_pages')
+def ocr_pages(pages: List[bytes], lang: str = OCR_LANG) -> Dict:
+    """Reconhece as páginas em paralelo, usando o cache quando possível"""
+    hashes = [page_hash(page, lang) for page in pages]
+    cached = _load_cached(hashes)
+    
+    pending = {}
+    for content_hash, page in zip(hashes, pages):
+        if content_hash not in cached and content_hash not in pending:
+            pending[content_hash] = page
+    
+    recognized = {}
+    if pending:
+        executor = _page_executor()
+        futures = {h: executor.submit(ocr_page, page, lang) for h, page in pending.items()}
+        recognized = {h: future.result() for h, future in futures.items()}
+        _store_cached(recognized)
+    
+    texts = [cached.get(h, recognized.get(h, '')) for h in hashes]
+    return {
+        'pages': texts,
+        'page_count': len(pages),
+        'cached_pages': sum(1 for h in hashes if h in cached)
+    }
+
+@timed_stage('ocr_document')
+def ocr_document(data: bytes, lang: str = OCR_LANG) -> Dict:
+    """OCR completo de um documento; o texto das páginas é separado por form feed"""
+    result = ocr_pages(split_pages(data), lang)
+    result['text'] = '\f'.join(result['pages'])
+    return result
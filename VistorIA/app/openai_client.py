@@ -2,9 +2,11 @@ import os
 from fastapi import UploadFile
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from .metrics import openai_http_client
+from .usage import BUDGET_ECONOMY, BudgetExceeded, budgeted_call, economy_image, track_usage
 
 load_dotenv()
-_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
 
 async def transcribe_audio(file: UploadFile) -> str:
     """Transcreve áudio para texto usando Whisper"""
@@ -15,14 +17,19 @@ async def transcribe_audio(file: UploadFile) -> str:
         tmp.write(data)
         tmp_path = tmp.name
     
-    try:
+    async def call(mode: str) -> str:
         with open(tmp_path, 'rb') as f:
-            transcription = await _client.audio.transcriptions.create(
-                model='whisper-1', 
-                file=f,
-                language='pt'
-            )
+            async with track_usage('transcribe_audio', 'whisper-1', mode) as tracked:
+                transcription = await _client.audio.transcriptions.create(
+                    model='whisper-1', 
+                    file=f,
+                    language='pt'
+                )
+                tracked.record(transcription)
         return transcription.text or ''
+    
+    try:
+        return await budgeted_call('transcribe_audio', 'whisper-1', data, call) or ''
     finally:
         os.unlink(tmp_path)
 
@@ -53,36 +60,47 @@ async def analyze_image(file: UploadFile, prompt: str) -> str:
             data = bytes(data)
         
         import base64
-        b64 = base64.b64encode(data).decode('utf-8')
         
         # Verificar se API key está configurada
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key or api_key == "sua_chave_openai_aqui" or api_key.strip() == "":
             raise ValueError("OPENAI_API_KEY não configurada. Configure sua chave no arquivo .env")
         
-        # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
-        response = await _client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": f"Você é um especialista em vistoria imobiliária. {prompt} Seja detalhado sobre o estado de conservação."
-                        },
+        text = f"Você é um especialista em vistoria imobiliária. {prompt} Seja detalhado sobre o estado de conservação."
+        
+        async def call(mode: str) -> str:
+            # Modo econômico (orçamento quase no fim): imagem reduzida e detalhe baixo
+            image, mime = economy_image(data, content_type) if mode == BUDGET_ECONOMY else (data, content_type)
+            image_url = {"url": f"data:{mime};base64,{base64.b64encode(image).decode('utf-8')}"}
+            if mode == BUDGET_ECONOMY:
+                image_url["detail"] = "low"
+            # Usar gpt-4o-mini-2024-07-18 que é o snapshot específico do modelo
+            async with track_usage('analyze_image', "gpt-4o-mini-2024-07-18", mode) as tracked:
+                response = await _client.chat.completions.create(
+                    model="gpt-4o-mini-2024-07-18",
+                    messages=[
                         {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{content_type};base64,{b64}"
-                            }
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text", 
+                                    "text": text
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": image_url
+                                }
+                            ]
                         }
-                    ]
-                }
-            ],
-            max_tokens=300
-        )
-        return response.choices[0].message.content or ""
+                    ],
+                    max_tokens=300
+                )
+                tracked.record(response)
+            return response.choices[0].message.content or ""
+        
+        return await budgeted_call('analyze_image', "gpt-4o-mini-2024-07-18", text.encode() + data, call) or ""
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"Erro em analyze_image: {e}")
         import traceback
@@ -91,18 +109,23 @@ async def analyze_image(file: UploadFile, prompt: str) -> str:
 
 async def summarize_text(text: str) -> str:
     """Resume texto de observações de vistoria"""
-    response = await _client.chat.completions.create(
-        model="gpt-4o-mini-2024-07-18",
-        messages=[
-            {
-                "role": "system", 
-                "content": "Você é um assistente especializado em resumir observações de vistoria imobiliária. Seja conciso, objetivo e mantenha informações importantes sobre o estado dos itens."
-            },
-            {
-                "role": "user", 
-                "content": f"Resuma esta observação de vistoria de forma clara e profissional: {text}"
-            }
-        ],
-        max_tokens=150
-    )
-    return response.choices[0].message.content or ""
\ No newline at end of file
+    async def call(mode: str) -> str:
+        async with track_usage('summarize_text', "gpt-4o-mini-2024-07-18", mode) as tracked:
+            response = await _client.chat.completions.create(
+                model="gpt-4o-mini-2024-07-18",
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": "Você é um assistente especializado em resumir observações de vistoria imobiliária. Seja conciso, objetivo e mantenha informações importantes sobre o estado dos itens."
+                    },
+                    {
+                        "role": "user", 
+                        "content": f"Resuma esta observação de vistoria de forma clara e profissional: {text}"
+                    }
+                ],
+                max_tokens=150
+            )
+            tracked.record(response)
+        return response.choices[0].message.content or ""
+    
+    return await budgeted_call('summarize_text', "gpt-4o-mini-2024-07-18", text.encode(), call) or ""
\ No newline at end of file
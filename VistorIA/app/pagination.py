@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_, func, text
+from sqlalchemy.orm import Query, Session
+
+class InvalidCursor(ValueError):
+    """Cursor de paginação malformado"""
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Codifica a posição (created_at, id) em um cursor opaco"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodifica um cursor gerado por encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise InvalidCursor(f"Cursor inválido: {cursor}") from e
+
+def apply_keyset(query: Query, model, cursor: Optional[str]) -> Query:
+    """Ordena por (created_at, id) decrescente e posiciona após o cursor.
+
+    Usa o índice composto (created_at, id), então o custo de cada página
+    não depende da profundidade, ao contrário de OFFSET. Linhas com created_at
+    NULL (antigas) ficam de fora: a posição delas na ordem muda conforme o banco
+    e não cabem no cursor. create_tables preenche essas datas.
+    """
+    query = query.filter(model.created_at.isnot(None))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    return query.order_by(model.created_at.desc(), model.id.desc())
+
+def estimate_row_count(db: Session, model) -> int:
+    """Estimativa do total de linhas sem varrer a tabela.
+
+    No PostgreSQL usa as estatísticas do planner (pg_class.reltuples); nos
+    demais bancos usa MAX(id), resolvido direto pelo índice da chave primária.
+    """
+    if db.bind.dialect.name == 'postgresql':
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {'table': model.__tablename__}
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    return int(db.query(func.max(model.id)).scalar() or 0)
@@ -12,10 +12,13 @@ import uuid
 from datetime import datetime
 from typing import List
 from .schemas import ReportRequest
+from .metrics import timed_stage
+from .media import MEDIA_ROOT
 
+@timed_stage('pdf')
 async def build_report_pdf(payload: ReportRequest) -> str:
     """Gera relatório PDF da vistoria"""
-    out_dir = 'VistorIA/static/uploads'
+    out_dir = MEDIA_ROOT
     os.makedirs(out_dir, exist_ok=True)
     
     filename = f'vistoria_{uuid.uuid4().hex[:8]}.pdf'
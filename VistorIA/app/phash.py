@@ -0,0 +1,108 @@
+"""Hash perceptual (dHash) das fotos, para achar quase-duplicatas na vistoria.
+
+Fotos em sequência do mesmo item diferem em poucos bits do dHash de 64 bits.
+A busca usa multi-index hashing: o hash é dividido em 8 faixas de 8 bits,
+gravadas em inspection_file_hash_bands (indexada por vistoria, faixa e valor).
+Duas fotos a até 7 bits de distância têm pelo menos uma faixa idêntica, então
+a consulta pelas faixas iguais traz todos os candidatos e a distância de
+Hamming exata é conferida em memória.
+
+A quase-duplicata aponta para a foto original (duplicate_of_id), devolvido no
+upload e nos detalhes do arquivo para o cliente não pedir outra análise dela, e
+o processamento em batch a pula. As rotas de análise (/api/vision,
+/api/auto-checklist) recebem a imagem direto e não consultam o hash.
+"""
+import io
+import os
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from .database import InspectionFile, InspectionFileHashBand
+
+# Distância de Hamming máxima (em 64 bits) para considerar duas fotos quase idênticas
+PHASH_MAX_DISTANCE = min(int(os.getenv("PHASH_MAX_DISTANCE", "6")), 7)
+BANDS = 8
+BAND_BITS = 8
+
+def dhash(image_data: bytes) -> int:
+    """dHash de 64 bits: cada bit diz se o pixel é mais claro que o vizinho da direita (9x8 em cinza)"""
+    image = Image.open(io.BytesIO(image_data))
+    # JPEG: decodifica já reduzido (bem mais rápido que a foto inteira)
+    image.draft('L', (64, 64))
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def to_signed(value: int) -> int:
+    """Hash sem sinal -> BIGINT com sinal (o banco não tem inteiro de 64 bits sem sinal)"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+def bands(value: int) -> List[int]:
+    return [(value >> (band * BAND_BITS)) & 0xFF for band in range(BANDS)]
+
+def find_near_duplicate(db: Session, inspection_id: int, value: int,
+                        exclude_id: Optional[int] = None) -> Optional[InspectionFile]:
+    """Foto da vistoria mais próxima de value (até PHASH_MAX_DISTANCE bits), ou None"""
+    query = db.query(InspectionFile).join(
+        InspectionFileHashBand, InspectionFileHashBand.file_id == InspectionFile.id
+    ).filter(
+        InspectionFileHashBand.inspection_id == inspection_id,
+        or_(*[
+            and_(InspectionFileHashBand.band == band, InspectionFileHashBand.value == band_value)
+            for band, band_value in enumerate(bands(value))
+        ])
+    )
+    if exclude_id is not None:
+        query = query.filter(InspectionFile.id != exclude_id)
+    
+    # Menor distância; no empate, a foto mais antiga (menor id)
+    best, best_key = None, (PHASH_MAX_DISTANCE + 1, 0)
+    for candidate in query.distinct():
+        key = (hamming(candidate.phash, value), candidate.id)
+        if key < best_key:
+            best, best_key = candidate, key
+    return best
+
+def register_photo(db: Session, file_record: InspectionFile, image_data: Optional[bytes] = None) -> Optional[InspectionFile]:
+    """Calcula o dHash da foto, indexa as faixas e marca a quase-duplicata já registrada.
+
+    Devolve a foto original quando houver (sem commit; o chamador confirma).
+    """
+    db.flush()
+    try:
+        if image_data is None:
+            with open(file_record.file_path, 'rb') as f:
+                image_data = f.read()
+        value = dhash(image_data)
+    except Exception as e:
+        print(f"Erro ao calcular hash perceptual da foto {file_record.id}: {e}")
+        return None
+    
+    try:
+        # Savepoint: no PostgreSQL um erro aborta a transação inteira, e o
+        # rollback até aqui mantém o upload gravável
+        with db.begin_nested():
+            original = find_near_duplicate(db, file_record.inspection_id, value, exclude_id=file_record.id)
+            if original is not None and original.duplicate_of_id is not None:
+                # Aponta sempre para a primeira foto do grupo
+                original = db.get(InspectionFile, original.duplicate_of_id) or original
+    except Exception as e:
+        # A busca de duplicatas é só uma economia: o upload segue sem ela
+        print(f"Erro ao buscar quase-duplicata da foto {file_record.id}: {e}")
+        original = None
+    
+    file_record.phash = to_signed(value)
+    file_record.duplicate_of_id = original.id if original is not None else None
+    db.query(InspectionFileHashBand).filter(InspectionFileHashBand.file_id == file_record.id).delete()
+    db.add_all([
+        InspectionFileHashBand(file_id=file_record.id, band=band, inspection_id=file_record.inspection_id, value=band_value)
+        for band, band_value in enumerate(bands(value))
+    ])
+    return original
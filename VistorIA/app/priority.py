@@ -0,0 +1,132 @@
+"""Prioridade de reparo a partir do texto da análise da IA.
+
+As palavras-chave viram uma única expressão em forma de trie (prefixos comuns
+fatorados), compilada uma vez: cada texto é percorrido uma só vez, com limite
+de palavra no início, aceitando flexões (plural, feminino, conjugação) e sem
+diferenciar acentos ou maiúsculas. Além da prioridade, a análise devolve os
+trechos que a justificam (posições no texto original).
+"""
+import re
+import unicodedata
+from typing import Dict, List
+
+PRIORITY_LEVELS = ('critical', 'high', 'medium', 'low')
+
+REPAIR_PRIORITY_KEYWORDS = {
+    'critical': ['vazamento', 'infiltração', 'rachadura estrutural', 'perigo', 'risco', 'quebrado', 'não funciona'],
+    'high': ['danificado', 'substituição', 'troca necessária', 'reparo urgente', 'deteriorado'],
+    'medium': ['desgaste', 'manchas', 'riscos', 'ajuste necessário', 'limpeza profunda'],
+}
+
+def _accent_table() -> Dict[int, str]:
+    """Mapeia letras acentuadas para a letra base, um caractere por um caractere.
+
+    Manter o comprimento do texto faz as posições encontradas no texto
+    normalizado valerem também para o texto original.
+    """
+    table = {}
+    for code in range(0xC0, 0x250):
+        base = unicodedata.normalize('NFD', chr(code))[0]
+        if base != chr(code) and base.isascii():
+            table[code] = base
+    return table
+
+_ACCENTS = _accent_table()
+_ACCENT_CHARS = {chr(code): base for code, base in _ACCENTS.items()}
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7f]')
+
+def _strip_accent(match) -> str:
+    char = match.group()
+    return _ACCENT_CHARS.get(char, char)
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos, preservando o comprimento"""
+    normalized = text.lower()
+    # lower() pode expandir alguns caracteres raros; nesse caso, caractere a caractere
+    if len(normalized) != len(text):
+        normalized = ''.join(char.lower()[0] for char in text)
+    if normalized.isascii():
+        return normalized
+    # Só os poucos caracteres acentuados passam pela tabela (translate é bem mais lento)
+    return _NON_ASCII_RE.sub(_strip_accent, normalized)
+
+def _word_units(word: str) -> List[str]:
+    """Fragmentos de regex da palavra, com variações de flexão.
+
+    Particípios aceitam o feminino (quebrado/quebrada), "-ção" aceita "-ções" e
+    "-l" aceita "-is" (estrutural/estruturais); o \\w* no fim de cada palavra
+    cobre plural e conjugação (vazamentos, danificados, funcionam).
+    """
+    if word.endswith('cao'):
+        units, last = list(word[:-3]), 'c(?:ao|oes)'
+    elif word.endswith(('ado', 'ido')):
+        units, last = list(word[:-1]), '[oa]'
+    elif word.endswith('l'):
+        units, last = list(word[:-1]), '(?:l|is)'
+    else:
+        units, last = list(word[:-1]), word[-1]
+    return [re.escape(unit) for unit in units] + [last if len(last) > 1 else re.escape(last), r'\w*']
+
+def _trie_pattern(phrases: List[str]) -> str:
+    """Expressão regular equivalente a uma trie das frases (prefixos fatorados).
+
+    O fim de cada frase ganha um grupo vazio nomeado k<posição>, que identifica
+    a palavra-chave encontrada (match.lastgroup).
+    """
+    trie = {}
+    for position, phrase in enumerate(phrases):
+        node = trie
+        units = []
+        for word in phrase.split(' '):
+            if units:
+                units.append(r'\s+')
+            units.extend(_word_units(word))
+        for unit in units:
+            node = node.setdefault(unit, {})
+        node[''] = position
+
+    def build(node) -> str:
+        # Continuações literais antes do \w*: "riscos" vence "risco" + "s"
+        keys = sorted((key for key in node if key), key=lambda key: (key == r'\w*', key))
+        branches = [key + build(node[key]) for key in keys]
+        if '' in node:
+            branches.append(f'(?P<k{node[""]}>)')
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    # Limite de palavra só à esquerda: o fim da palavra pode ter flexão
+    return r'\b' + build(trie)
+
+_KEYWORD_PRIORITY = {
+    normalize_text(keyword): level
+    for level, keywords in REPAIR_PRIORITY_KEYWORDS.items() for keyword in keywords
+}
+_KEYWORDS = sorted(_KEYWORD_PRIORITY)
+_KEYWORDS_RE = re.compile(_trie_pattern(_KEYWORDS))
+_GROUP_PRIORITY = {f'k{position}': _KEYWORD_PRIORITY[keyword] for position, keyword in enumerate(_KEYWORDS)}
+
+def analyze_repair_priority(analysis: str) -> Dict:
+    """Prioridade de reparo e as evidências (palavras-chave e posições) encontradas"""
+    evidence = []
+    for match in _KEYWORDS_RE.finditer(normalize_text(analysis or '')):
+        keyword = _KEYWORDS[int(match.lastgroup[1:])]
+        evidence.append({
+            'keyword': keyword,
+            'priority': _KEYWORD_PRIORITY[keyword],
+            'start': match.start(),
+            'end': match.end(),
+            'text': analysis[match.start():match.end()]
+        })
+
+    levels = {item['priority'] for item in evidence}
+    priority = next((level for level in PRIORITY_LEVELS if level in levels), 'low')
+    return {'priority': priority, 'evidence': evidence}
+
+def determine_repair_priority(analysis: str) -> str:
+    """Determina prioridade de reparo baseado na análise"""
+    levels = set()
+    for match in _KEYWORDS_RE.finditer(normalize_text(analysis or '')):
+        level = _GROUP_PRIORITY[match.lastgroup]
+        if level == 'critical':
+            return level
+        levels.add(level)
+    return next((level for level in PRIORITY_LEVELS if level in levels), 'low')
@@ -0,0 +1,105 @@
+"""Eventos de progresso das tasks, publicados por vistoria.
+
+Com o Celery, os eventos (das tasks e do próprio processo da API) vão só para o
+Redis (canal vistoria:progress:<id>) e cada cliente SSE mantém uma única
+assinatura pub/sub. Com o backend local, os eventos vão para um hub em memória
+do próprio processo da API; eventos por arquivo de tasks que rodam no pool de
+processos (fila cpu) não chegam ao hub, só a mudança de estado da task.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CHANNEL_PREFIX = "vistoria:progress:"
+
+_redis = None
+_subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+_subscribers_lock = threading.Lock()
+
+def _channel(inspection_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{inspection_id}"
+
+def _celery_active() -> bool:
+    from .background_tasks import celery_app
+    from .task_backend import use_celery
+    return use_celery(celery_app)
+
+def _publish_local(inspection_id: int, event: Dict) -> None:
+    with _subscribers_lock:
+        targets = list(_subscribers.get(inspection_id, ()))
+    for loop, queue in targets:
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+def publish_progress(inspection_id: Optional[int], event: Dict) -> None:
+    """Publica um evento para os clientes que acompanham a vistoria (nunca levanta exceção)"""
+    global _redis
+    if inspection_id is None:
+        return
+    event = dict(event, inspection_id=inspection_id, ts=time.time())
+    try:
+        if _celery_active():
+            # Só no Redis: os clientes SSE deste processo também o assinam, e a
+            # entrega local duplicaria o evento
+            if _redis is None:
+                import redis
+                _redis = redis.Redis.from_url(redis_url, socket_timeout=2)
+            _redis.publish(_channel(inspection_id), json.dumps(event))
+            return
+    except Exception as e:
+        print(f"Erro ao publicar progresso: {e}")
+    _publish_local(inspection_id, event)
+
+async def _forward_redis(inspection_id: int, queue: asyncio.Queue) -> None:
+    """Repassa para a fila do cliente os eventos do canal Redis da vistoria"""
+    import redis.asyncio as aioredis
+    client = aioredis.Redis.from_url(redis_url)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(_channel(inspection_id))
+        async for message in pubsub.listen():
+            if message.get('type') == 'message':
+                queue.put_nowait(json.loads(message['data']))
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.close()
+        await client.close()
+
+async def subscribe_progress(inspection_id: int, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+    """Gera os eventos da vistoria; gera None a cada `heartbeat` segundos sem eventos"""
+    queue: asyncio.Queue = asyncio.Queue()
+    entry = (asyncio.get_running_loop(), queue)
+    with _subscribers_lock:
+        _subscribers.setdefault(inspection_id, set()).add(entry)
+    
+    forwarder = None
+    # O primeiro teste do broker é síncrono; fora do event loop
+    if await run_in_threadpool(_celery_active):
+        forwarder = asyncio.create_task(_forward_redis(inspection_id, queue))
+    
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+    finally:
+        if forwarder:
+            forwarder.cancel()
+        with _subscribers_lock:
+            subscribers = _subscribers.get(inspection_id)
+            if subscribers:
+                subscribers.discard(entry)
+                if not subscribers:
+                    del _subscribers[inspection_id]
+
+def format_sse(event: Optional[Dict], name: str = 'progress') -> str:
+    """Formata um evento no protocolo Server-Sent Events (None vira heartbeat)"""
+    if event is None:
+        return ': heartbeat\n\n'
+    return f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,190 @@
+"""Cache em memória dos dados de referência: templates e tabela de custos de reparo.
+
+Essas tabelas mudam poucas vezes por ano, mas o frontend as pede a cada tela.
+Cada processo guarda a versão carregada do banco, com o JSON já serializado e o
+ETag de cada resposta. Gravações nessas tabelas por uma sessão do SessionLocal
+(create_template, dados padrão, scripts) descartam o cache no commit.
+
+REFERENCE_CACHE_BACKEND:
+    local (padrão): invalidação só no processo que gravou; os demais recarregam
+        em até REFERENCE_CACHE_TTL segundos.
+    redis: a versão de cada cache fica no Redis; os outros workers percebem a
+        invalidação em até REFERENCE_CACHE_CHECK_INTERVAL segundos.
+    off: sempre lê do banco.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, Template, RepairCostTable
+from .http_cache import encode_json, json_body_response, json_with_etag, make_etag
+
+REFERENCE_CACHE_BACKEND = os.getenv("REFERENCE_CACHE_BACKEND", "local").lower()
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_CHECK_INTERVAL = float(os.getenv("REFERENCE_CACHE_CHECK_INTERVAL", "2"))
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+VERSION_PREFIX = "vistoria:refcache:"
+
+_redis = None
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+    return _redis
+
+class _Snapshot:
+    """Dados carregados numa versão, com as respostas já serializadas"""
+    
+    def __init__(self, data: Dict[Any, Any]):
+        self.data = data
+        self.loaded_at = time.monotonic()
+        self.responses: Dict[Any, tuple] = {}
+
+class VersionedCache:
+    """Dados de uma tabela de referência mantidos em memória até a próxima invalidação.
+
+    loader(db) devolve um dicionário chave -> payload JSON.
+    """
+    
+    def __init__(self, name: str, loader: Callable[[Session], Dict[Any, Any]]):
+        self.name = name
+        self.loader = loader
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._shared = None
+        self._checked_at = 0.0
+    
+    def invalidate(self, publish: bool = True) -> None:
+        """Descarta a versão em memória (e avisa os outros workers com o backend redis)"""
+        self._generation += 1
+        self._snapshot = None
+        if publish and REFERENCE_CACHE_BACKEND == "redis":
+            try:
+                _redis_client().incr(VERSION_PREFIX + self.name)
+            except Exception as e:
+                print(f"Erro ao publicar invalidação do cache {self.name}: {e}")
+    
+    def _check_shared(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < REFERENCE_CACHE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            version = _redis_client().get(VERSION_PREFIX + self.name)
+        except Exception as e:
+            # Redis fora: segue com a versão local até o TTL
+            print(f"Erro ao consultar versão do cache {self.name}: {e}")
+            return
+        if version != self._shared:
+            self._shared = version
+            self.invalidate(publish=False)
+    
+    def _load(self) -> Dict[Any, Any]:
+        db = SessionLocal()
+        try:
+            return self.loader(db)
+        finally:
+            db.close()
+    
+    def snapshot(self) -> _Snapshot:
+        if REFERENCE_CACHE_BACKEND == "off":
+            return _Snapshot(self._load())
+        if REFERENCE_CACHE_BACKEND == "redis":
+            self._check_shared()
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < REFERENCE_CACHE_TTL:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - snapshot.loaded_at >= REFERENCE_CACHE_TTL:
+                generation = self._generation
+                snapshot = _Snapshot(self._load())
+                # Invalidado durante a carga: usa o que leu, mas não guarda
+                if generation == self._generation:
+                    self._snapshot = snapshot
+        return snapshot
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.snapshot().data.get(key, default)
+    
+    def json_response(self, request: Request, key: Any, default: Any = None) -> Optional[Response]:
+        """Resposta JSON com ETag do payload da chave; sem a chave, usa default (ou None)"""
+        snapshot = self.snapshot()
+        if key not in snapshot.data:
+            return None if default is None else json_with_etag(request, default)
+        cached = snapshot.responses.get(key)
+        if cached is None:
+            body = encode_json(snapshot.data[key])
+            cached = snapshot.responses[key] = (body, make_etag(body))
+        return json_body_response(request, *cached)
+
+# ==================== CACHES ====================
+ALL_TEMPLATES = "all"
+
+def _template_payload(template: Template) -> Dict:
+    return {column.name: getattr(template, column.name) for column in Template.__table__.columns}
+
+def _load_templates(db: Session) -> Dict[Any, Any]:
+    templates = db.query(Template).order_by(Template.id).all()
+    data = {template.id: _template_payload(template) for template in templates}
+    data[ALL_TEMPLATES] = {'templates': [
+        {'id': t.id, 'name': t.name, 'type': t.type, 'rooms_items': t.rooms_items} for t in templates
+    ]}
+    return data
+
+def _load_repair_costs(db: Session) -> Dict[Any, Any]:
+    data = {}
+    for cost in db.query(RepairCostTable).order_by(RepairCostTable.id):
+        row = {column.name: getattr(cost, column.name) for column in RepairCostTable.__table__.columns}
+        data.setdefault(cost.region, {'costs': []})['costs'].append(row)
+    return data
+
+templates_cache = VersionedCache("templates", _load_templates)
+repair_costs_cache = VersionedCache("repair_costs", _load_repair_costs)
+
+_CACHES_BY_TABLE = {
+    Template.__tablename__: templates_cache,
+    RepairCostTable.__tablename__: repair_costs_cache,
+}
+
+def repair_cost_lookup(region: str) -> Dict[str, Dict]:
+    """Custo por item_type da região (primeira entrada por item, como a consulta com .first())"""
+    lookup = {}
+    for row in repair_costs_cache.get(region, {'costs': []})['costs']:
+        lookup.setdefault(row['item_type'], row)
+    return lookup
+
+# ==================== INVALIDAÇÃO ====================
+def _touch(session: Session, table: str) -> None:
+    if table in _CACHES_BY_TABLE:
+        session.info.setdefault("reference_tables", set()).add(table)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_flush(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        _touch(session, getattr(instance, "__tablename__", None))
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_bulk(orm_execute_state):
+    # insert()/update()/delete() em lote não passam pelo flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _touch(orm_execute_state.session, mapper.local_table.name)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_on_commit(session):
+    for table in session.info.pop("reference_tables", ()):
+        _CACHES_BY_TABLE[table].invalidate()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("reference_tables", None)
@@ -0,0 +1,125 @@
+"""Recalcula a prioridade dos itens do checklist com as regras atuais.
+
+A prioridade é gravada uma vez, na análise; quando as palavras-chave de
+app/priority.py mudam, este job relê as análises guardadas (do item e dos
+arquivos ligados a ele) e atualiza só as linhas cuja prioridade mudou.
+
+A leitura é feita em blocos por chave primária (id > último id visto), em vez
+de um cursor aberto durante todo o job: cada bloco é uma consulta curta, a
+memória fica constante e as atualizações são gravadas bloco a bloco sem manter
+uma transação de leitura aberta (o que travaria escritas no SQLite).
+
+Depois de mudar as regras, rode antes com --dry-run e confira as transições
+(ex.: critical->low) antes de gravar.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python -m app.reprioritize [--chunk-size 5000] [--inspection-id N] [--dry-run]
+"""
+import argparse
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import bindparam, select, update
+
+from .database import engine, ChecklistItem, InspectionFile, bump_inspection_versions
+from .priority import PRIORITY_LEVELS, determine_repair_priority
+
+REPRIORITIZE_CHUNK_SIZE = int(os.getenv("REPRIORITIZE_CHUNK_SIZE", "5000"))
+
+def _recompute(item_analysis: Optional[str], file_analyses) -> Optional[str]:
+    """Prioridade mais alta entre as análises; None se não há texto para avaliar"""
+    texts = [text for text in [item_analysis, *file_analyses] if text]
+    if not texts:
+        return None
+    priorities = {determine_repair_priority(text) for text in texts}
+    return next(level for level in PRIORITY_LEVELS if level in priorities)
+
+def reprioritize_checklist_items(chunk_size: int = REPRIORITIZE_CHUNK_SIZE, inspection_id: Optional[int] = None,
+                                 dry_run: bool = False, on_chunk: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Percorre os itens em blocos e grava só as prioridades que mudaram"""
+    items = ChecklistItem.__table__
+    files = InspectionFile.__table__
+    update_priority = (
+        update(items).where(items.c.id == bindparam('_id')).values(priority=bindparam('_priority'))
+    )
+    stats = {'scanned': 0, 'changed': 0, 'skipped': 0, 'transitions': {}, 'dry_run': dry_run}
+    start = time.perf_counter()
+    last_id = 0
+
+    while True:
+        with engine.begin() as connection:
+            query = (
+                select(items.c.id, items.c.inspection_id, items.c.ai_analysis, items.c.priority)
+                .where(items.c.id > last_id)
+                .order_by(items.c.id)
+                .limit(chunk_size)
+            )
+            if inspection_id is not None:
+                query = query.where(items.c.inspection_id == inspection_id)
+            rows = connection.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Análises dos arquivos do bloco, numa consulta só. IN com os ids do
+            # bloco (não a faixa): com --inspection-id os ids são esparsos e a faixa
+            # traria arquivos de itens de outras vistorias
+            file_analyses = {}
+            file_rows = connection.execute(
+                select(files.c.checklist_item_id, files.c.ai_analysis).where(
+                    files.c.checklist_item_id.in_([row.id for row in rows]),
+                    files.c.ai_analysis.isnot(None)
+                )
+            )
+            for item_id, analysis in file_rows:
+                file_analyses.setdefault(item_id, []).append(analysis)
+
+            changes = []
+            touched = set()
+            for row in rows:
+                priority = _recompute(row.ai_analysis, file_analyses.get(row.id, ()))
+                if priority is None:
+                    # Sem análise guardada: a prioridade veio do usuário, não mexer
+                    stats['skipped'] += 1
+                elif priority != (row.priority or 'low'):
+                    changes.append({'_id': row.id, '_priority': priority})
+                    touched.add(row.inspection_id)
+                    transition = f"{row.priority or 'low'}->{priority}"
+                    stats['transitions'][transition] = stats['transitions'].get(transition, 0) + 1
+
+            if changes and not dry_run:
+                connection.execute(update_priority, changes)
+                # Update em Core não passa pelo before_flush da sessão
+                bump_inspection_versions(connection, touched)
+
+        stats['scanned'] += len(rows)
+        stats['changed'] += len(changes)
+        if on_chunk:
+            on_chunk(dict(stats, elapsed=time.perf_counter() - start))
+
+    elapsed = time.perf_counter() - start
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['scanned'] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula a prioridade dos itens do checklist")
+    parser.add_argument('--chunk-size', type=int, default=REPRIORITIZE_CHUNK_SIZE)
+    parser.add_argument('--inspection-id', type=int)
+    parser.add_argument('--dry-run', action='store_true', help='só conta as mudanças, sem gravar')
+    args = parser.parse_args()
+
+    def report(progress: Dict) -> None:
+        rate = progress['scanned'] / progress['elapsed'] if progress['elapsed'] else 0
+        print(f"{progress['scanned']:>10,} itens  {progress['changed']:>8,} alterados  {rate:>10,.0f} itens/s")
+
+    stats = reprioritize_checklist_items(args.chunk_size, args.inspection_id, args.dry_run, on_chunk=report)
+    print(f"Concluído: {stats['scanned']:,} itens em {stats['elapsed_seconds']}s "
+          f"({stats['rows_per_second']:,.0f} itens/s), {stats['changed']:,} alterados, "
+          f"{stats['skipped']:,} sem análise")
+    for transition, count in sorted(stats['transitions'].items()):
+        print(f"  {transition}: {count:,}")
+
+if __name__ == '__main__':
+    main()
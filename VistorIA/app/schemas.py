@@ -1,6 +1,7 @@
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, computed_field, field_validator
 from datetime import datetime
+from .media import file_media_url
 
 class ChecklistItem(BaseModel):
     """Item do checklist de vistoria"""
@@ -11,6 +12,66 @@ class ChecklistItem(BaseModel):
     photos: List[str] = Field(default=[], description="Caminhos das fotos")
     audioTranscripts: List[str] = Field(default=[], description="Transcrições de áudio")
 
+CHECKLIST_STATUSES = ('ok', 'danificado', 'sujo', 'ausente')
+REPAIR_PRIORITIES = ('low', 'medium', 'high', 'critical')
+
+class ChecklistItemWrite(ChecklistItem):
+    """Item do checklist para gravação em lote (chave: cômodo + item)"""
+    ai_analysis: Optional[str] = Field(None, description="Análise da IA")
+    repair_cost_estimate: Optional[float] = Field(None, ge=0, description="Custo estimado de reparo")
+    priority: Optional[str] = Field(None, description="Prioridade: 'low', 'medium', 'high', 'critical'")
+
+    @field_validator('room', 'item')
+    @classmethod
+    def _strip_required(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError('não pode ser vazio')
+        return value
+
+    @field_validator('status')
+    @classmethod
+    def _check_status(cls, value: str) -> str:
+        value = value.strip().lower()
+        if value not in CHECKLIST_STATUSES:
+            raise ValueError(f"status deve ser um de {', '.join(CHECKLIST_STATUSES)}")
+        return value
+
+    @field_validator('priority')
+    @classmethod
+    def _check_priority(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and value not in REPAIR_PRIORITIES:
+            raise ValueError(f"priority deve ser um de {', '.join(REPAIR_PRIORITIES)}")
+        return value
+
+class ChecklistBulkRequest(BaseModel):
+    """Lote de itens do checklist (sincronização de cômodos inteiros)"""
+    items: List[dict] = Field(..., max_length=2000, description="Itens no formato de ChecklistItemWrite")
+
+class ChecklistBulkItemResult(BaseModel):
+    """Resultado da gravação de um item do lote"""
+    index: int = Field(..., description="Posição do item no lote")
+    status: str = Field(..., description="'created', 'updated' ou 'invalid'")
+    id: Optional[int] = Field(None, description="ID do item gravado")
+    errors: Optional[List[str]] = Field(None, description="Erros de validação")
+
+class ChecklistBulkResponse(BaseModel):
+    """Resposta da gravação em lote"""
+    inspection_id: int
+    created: int
+    updated: int
+    invalid: int
+    results: List[ChecklistBulkItemResult]
+
+class ResumableUploadCreate(BaseModel):
+    """Início de um upload retomável (os bytes vêm depois, em PATCHs)"""
+    inspection_id: int
+    checklist_item_id: Optional[int] = None
+    file_type: str = Field(..., description="Tipo: 'photo', 'audio', 'video', 'document'")
+    filename: str = Field(..., min_length=1, description="Nome original do arquivo")
+    size: int = Field(..., gt=0, description="Tamanho total em bytes")
+    sha256: Optional[str] = Field(None, pattern=r'^[0-9a-fA-F]{64}$', description="Hash do arquivo, conferido ao finalizar")
+
 class ReportRequest(BaseModel):
     """Dados para geração do relatório de vistoria"""
     propertyAddress: str = Field(..., description="Endereço do imóvel")
@@ -33,4 +94,72 @@ class VisionResponse(BaseModel):
 
 class SummaryResponse(BaseModel):
     """Resposta do resumo de texto"""
-    summary: str = Field(..., description="Texto resumido")
\ No newline at end of file
+    summary: str = Field(..., description="Texto resumido")
+
+class InspectionSummary(BaseModel):
+    """Projeção resumida da vistoria para listagens (sem assinaturas base64)"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    property_address: str = Field(..., description="Endereço do imóvel")
+    landlord_name: str = Field(..., description="Nome do locador")
+    tenant_name: str = Field(..., description="Nome do locatário")
+    inspection_type: Optional[str] = Field(None, description="Tipo: 'entrada' ou 'saida'")
+    inspection_date: Optional[datetime] = Field(None, description="Data da vistoria")
+    status: Optional[str] = Field(None, description="Status: 'draft', 'in_progress', 'completed'")
+    template_type: Optional[str] = Field(None, description="Tipo de template usado")
+    total_cost_estimate: Optional[float] = Field(None, description="Custo total estimado")
+    created_at: Optional[datetime] = Field(None, description="Data de criação")
+
+class InspectionFileDetail(BaseModel):
+    """Arquivo da vistoria com os resultados de IA"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    checklist_item_id: Optional[int] = None
+    file_type: str = Field(..., description="Tipo: 'photo', 'audio', 'document'")
+    file_path: str = Field(..., description="Caminho do arquivo no servidor")
+    original_filename: Optional[str] = None
+    ai_analysis: Optional[str] = None
+    transcription: Optional[str] = None
+    ocr_text: Optional[str] = None
+    detected_objects: Optional[list] = None
+    sha256: Optional[str] = None
+    size_bytes: Optional[int] = None
+    duplicate_of_id: Optional[int] = Field(None, description="Foto quase idêntica anterior (não precisa de nova análise)")
+    uploaded_at: Optional[datetime] = None
+
+    @computed_field(description="Link assinado para baixar o arquivo (/api/media)")
+    @property
+    def media_url(self) -> str:
+        return file_media_url(self.id)
+
+class ChecklistItemDetail(BaseModel):
+    """Item do checklist persistido, com seus arquivos"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    room: str
+    item: str
+    status: str
+    notes: Optional[str] = None
+    ai_analysis: Optional[str] = None
+    repair_cost_estimate: Optional[float] = None
+    priority: Optional[str] = None
+    created_at: Optional[datetime] = None
+    files: List[InspectionFileDetail] = Field(default=[], description="Arquivos vinculados ao item")
+
+class InspectionDetail(InspectionSummary):
+    """Vistoria completa com itens do checklist e arquivos"""
+    landlord_signature: Optional[str] = Field(None, description="Assinatura do locador (base64)")
+    tenant_signature: Optional[str] = Field(None, description="Assinatura do locatário (base64)")
+    logo_path: Optional[str] = None
+    checklist_items: List[ChecklistItemDetail] = Field(default=[], description="Itens do checklist")
+    files: List[InspectionFileDetail] = Field(default=[], description="Arquivos não vinculados a itens")
+
+class InspectionListResponse(BaseModel):
+    """Página da listagem de vistorias"""
+    inspections: List[InspectionSummary] = Field(..., description="Vistorias da página")
+    next_cursor: Optional[str] = Field(None, description="Cursor para a próxima página (null na última)")
+    total: Optional[int] = Field(None, description="Total de vistorias, quando solicitado")
+    total_is_estimate: bool = Field(default=False, description="Indica se o total é uma estimativa")
@@ -0,0 +1,198 @@
+"""Coalescência de chamadas idênticas em andamento (single-flight).
+
+Requisições iguais que chegam juntas (reenvio do app, a mesma foto enviada por
+dois vistoriadores) compartilham uma única chamada à OpenAI: no mesmo processo,
+todas aguardam o mesmo future. Entre workers, com SINGLEFLIGHT_BACKEND=redis ou
+db, quem obtém o lease da chave faz a chamada e publica a resposta no próprio
+lease (por SINGLEFLIGHT_RESULT_SECONDS); os demais aguardam a resposta aparecer
+ali ou no cache de respostas (app/usage.py). Assim a coalescência vale também
+sem cache e para respostas vazias. Se o dono do lease falhar ou morrer, o lease
+é liberado ou expira e outro worker assume.
+
+SINGLEFLIGHT_BACKEND: local (padrão, só no processo), redis, db ou off.
+"""
+import asyncio
+import os
+import uuid
+import weakref
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal, OpenAICallLease
+from .metrics import OPENAI_COALESCED
+
+SINGLEFLIGHT_BACKEND = os.getenv("SINGLEFLIGHT_BACKEND", "local").lower()
+SINGLEFLIGHT_LEASE_SECONDS = float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "120"))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.25"))
+# Tempo em que a resposta publicada pelo dono fica disponível para quem aguardava
+SINGLEFLIGHT_RESULT_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_SECONDS", "30"))
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+LEASE_PREFIX = "vistoria:singleflight:"
+RESULT_PREFIX = "vistoria:singleflight-result:"
+
+T = TypeVar("T")
+
+# Chamadas em andamento por (event loop, chave)
+_inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+# Um cliente Redis por event loop (o cliente assíncrono fica preso ao loop que o criou)
+_redis_clients = weakref.WeakKeyDictionary()
+
+# ==================== LEASES ENTRE WORKERS ====================
+def _redis():
+    loop = asyncio.get_running_loop()
+    client = _redis_clients.get(loop)
+    if client is None:
+        import redis.asyncio as aioredis
+        client = _redis_clients[loop] = aioredis.Redis.from_url(redis_url, socket_timeout=2)
+    return client
+
+def _db_acquire(key: str, owner: str) -> bool:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # Lease vencido: o dono morreu sem liberar
+        db.query(OpenAICallLease).filter(OpenAICallLease.key == key, OpenAICallLease.expires_at < now).delete()
+        db.add(OpenAICallLease(key=key, owner=owner, expires_at=now + timedelta(seconds=SINGLEFLIGHT_LEASE_SECONDS)))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def _db_publish(key: str, owner: str, result: str) -> None:
+    db = SessionLocal()
+    try:
+        # O lease vira o resultado: novas tentativas de lease falham e leem a resposta
+        db.query(OpenAICallLease).filter(OpenAICallLease.key == key, OpenAICallLease.owner == owner).update({
+            'result': result, 'expires_at': datetime.utcnow() + timedelta(seconds=SINGLEFLIGHT_RESULT_SECONDS)
+        })
+        db.commit()
+    finally:
+        db.close()
+
+def _db_published(key: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        row = db.query(OpenAICallLease.result).filter(
+            OpenAICallLease.key == key, OpenAICallLease.result.isnot(None),
+            OpenAICallLease.expires_at >= datetime.utcnow()
+        ).first()
+        return row.result if row else None
+    finally:
+        db.close()
+
+def _db_release(key: str, owner: str) -> None:
+    db = SessionLocal()
+    try:
+        db.query(OpenAICallLease).filter(OpenAICallLease.key == key, OpenAICallLease.owner == owner).delete()
+        db.commit()
+    finally:
+        db.close()
+
+async def _acquire(key: str, owner: str) -> bool:
+    if SINGLEFLIGHT_BACKEND == "redis":
+        return bool(await _redis().set(LEASE_PREFIX + key, owner, nx=True, px=int(SINGLEFLIGHT_LEASE_SECONDS * 1000)))
+    return await asyncio.to_thread(_db_acquire, key, owner)
+
+async def _release(key: str, owner: str) -> None:
+    if SINGLEFLIGHT_BACKEND == "redis":
+        client = _redis()
+        # Só apaga se ainda for o dono (o lease pode ter expirado e sido assumido)
+        if (await client.get(LEASE_PREFIX + key) or b"").decode() == owner:
+            await client.delete(LEASE_PREFIX + key)
+    else:
+        await asyncio.to_thread(_db_release, key, owner)
+
+async def _publish(key: str, owner: str, result: str) -> None:
+    if SINGLEFLIGHT_BACKEND == "redis":
+        client = _redis()
+        await client.set(RESULT_PREFIX + key, result, px=int(SINGLEFLIGHT_RESULT_SECONDS * 1000))
+        await _release(key, owner)
+    else:
+        await asyncio.to_thread(_db_publish, key, owner, result)
+
+async def _published(key: str) -> Optional[str]:
+    """Resposta publicada por outro worker para a chave, se houver"""
+    try:
+        if SINGLEFLIGHT_BACKEND == "redis":
+            value = await _redis().get(RESULT_PREFIX + key)
+            return value.decode() if value is not None else None
+        return await asyncio.to_thread(_db_published, key)
+    except Exception as e:
+        print(f"Erro ao ler resposta publicada de single-flight: {e}")
+        return None
+
+async def _run_with_lease(key: str, produce: Callable[[], Awaitable[T]],
+                          load_result: Callable[[], Awaitable[Optional[T]]]) -> T:
+    """Executa produce() com o lease da chave, ou espera o resultado de quem o tem"""
+    owner = uuid.uuid4().hex
+    while True:
+        try:
+            acquired = await _acquire(key, owner)
+        except Exception as e:
+            # Redis/banco indisponível: melhor uma chamada duplicada do que nenhuma
+            print(f"Erro ao obter lease de single-flight: {e}")
+            return await produce()
+        if acquired:
+            published = False
+            try:
+                # Outro worker pode ter terminado entre a consulta ao cache e o lease
+                result = await _published(key)
+                if result is None:
+                    result = await load_result()
+                if result is not None:
+                    return result
+                result = await produce()
+                if isinstance(result, str):
+                    try:
+                        await _publish(key, owner, result)
+                        published = True
+                    except Exception as e:
+                        print(f"Erro ao publicar resposta de single-flight: {e}")
+                return result
+            finally:
+                if not published:
+                    try:
+                        await _release(key, owner)
+                    except Exception as e:
+                        print(f"Erro ao liberar lease de single-flight: {e}")
+        result = await _published(key)
+        if result is None:
+            result = await load_result()
+        if result is not None:
+            return result
+        await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+
+# ==================== SINGLE-FLIGHT ====================
+def _forget(slot: Tuple[asyncio.AbstractEventLoop, str], future: asyncio.Future) -> None:
+    if _inflight.get(slot) is future:
+        del _inflight[slot]
+    # Evita o aviso de exceção não lida quando todos os interessados já desistiram
+    if not future.cancelled():
+        future.exception()
+
+async def single_flight(key: str, function: str, produce: Callable[[], Awaitable[T]],
+                        load_result: Callable[[], Awaitable[Optional[T]]]) -> T:
+    """Resultado de produce() compartilhado entre as chamadas simultâneas com a mesma chave.
+
+    load_result() lê o resultado já gravado por outro worker (cache), usado
+    enquanto outro processo detém o lease, junto com a resposta publicada no lease.
+    """
+    if SINGLEFLIGHT_BACKEND == "off":
+        return await produce()
+    
+    slot = (asyncio.get_running_loop(), key)
+    future = _inflight.get(slot)
+    if future is None:
+        work = produce() if SINGLEFLIGHT_BACKEND == "local" else _run_with_lease(key, produce, load_result)
+        # Task própria: se o cliente que iniciou a chamada desconectar, os demais continuam esperando
+        future = asyncio.ensure_future(work)
+        _inflight[slot] = future
+        future.add_done_callback(lambda done: _forget(slot, done))
+    else:
+        OPENAI_COALESCED.labels(function).inc()
+    return await asyncio.shield(future)
@@ -0,0 +1,221 @@
+"""Páginas e arquivos estáticos servidos da memória, pré-comprimidos e com cache HTTP.
+
+As páginas HTML (interface /vistoria e página inicial) são lidas uma vez e
+mantidas em memória com as versões gzip/brotli já prontas; o arquivo é relido
+quando muda no disco. Os arquivos estáticos usam a versão .br/.gz gerada por
+`python -m app.static_assets` quando existe, e assets com hash no nome recebem
+Cache-Control imutável. Respostas JSON da API passam pelo GZip.
+"""
+import argparse
+import gzip
+import mimetypes
+import os
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .http_cache import etag_matches, make_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Intervalo mínimo entre verificações de mudança das páginas no disco
+STATIC_RELOAD_INTERVAL = float(os.getenv("STATIC_RELOAD_INTERVAL", "1"))
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Hash de conteúdo no nome (app.3f2a9c1b.js, index-3f2a9c1b.css)
+HASHED_NAME = re.compile(r"[.-][0-9a-f]{8,}\.\w+$")
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml", "text/")
+COMPRESSIBLE_SUFFIXES = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml")
+
+def accepted_encodings(request_headers) -> set:
+    """Codificações aceitas pelo cliente (Accept-Encoding, ignorando q=0)"""
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+# ==================== PÁGINAS EM MEMÓRIA ====================
+class CachedPage:
+    """HTML mantido em memória, com ETag e variantes gzip/brotli pré-calculadas.
+
+    Com paths, usa o primeiro arquivo existente e o relê quando muda; com
+    content, serve o texto fixo.
+    """
+    
+    def __init__(self, *paths: str, content: Optional[str] = None):
+        self.paths = paths
+        self._signature = None
+        self._checked_at = 0.0
+        self._variants: Dict[str, Tuple[bytes, str]] = {}
+        if content is not None:
+            self._build(content.encode("utf-8"))
+    
+    def _build(self, body: bytes) -> None:
+        etag = make_etag(body)
+        variants = {"identity": (body, etag)}
+        variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), etag[:-1] + '-gzip"')
+        if brotli is not None:
+            variants["br"] = (brotli.compress(body), etag[:-1] + '-br"')
+        self._variants = variants
+    
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if not self.paths or (self._variants and now - self._checked_at < STATIC_RELOAD_INTERVAL):
+            return
+        self._checked_at = now
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (path, stat.st_mtime_ns, stat.st_size)
+            if signature != self._signature:
+                with open(path, "rb") as f:
+                    self._build(f.read())
+                self._signature = signature
+            return
+        raise FileNotFoundError(f"Nenhuma das páginas existe: {', '.join(self.paths)}")
+    
+    def response(self, request: Request) -> Response:
+        self._refresh()
+        accepted = accepted_encodings(request.headers)
+        encoding = next((name for name in ("br", "gzip") if name in accepted and name in self._variants), "identity")
+        body, etag = self._variants[encoding]
+        # HTML sempre revalidado: aponta para os assets da versão atual
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+# ==================== ARQUIVOS ESTÁTICOS ====================
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles com variantes .br/.gz pré-comprimidas e Cache-Control.
+
+    immutable=True marca todos os arquivos como imutáveis (diretório de
+    assets do build, sempre com hash no nome). Subdiretórios em exclude
+    respondem 404 (ex.: uploads antigos, acessíveis só por link assinado).
+    """
+    
+    def __init__(self, *args, immutable: bool = False, exclude: Tuple[str, ...] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+        self.exclude = exclude
+    
+    def lookup_path(self, path: str):
+        if path.replace("\\", "/").lstrip("/").split("/", 1)[0] in self.exclude:
+            return "", None
+        return super().lookup_path(path)
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers)
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            try:
+                encoded_stat = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            # Variante desatualizada (arquivo original mudou depois da compressão)
+            if encoded_stat.st_mtime < stat_result.st_mtime:
+                continue
+            response = FileResponse(
+                f"{full_path}{suffix}", status_code=status_code, stat_result=encoded_stat,
+                media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+                headers={"Content-Encoding": encoding},
+            )
+            break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        
+        response.headers["Vary"] = "Accept-Encoding"
+        immutable = self.immutable or HASHED_NAME.search(os.path.basename(full_path))
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE if immutable else "no-cache"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+# ==================== GZIP DAS RESPOSTAS DA API ====================
+class _CompressibleGZipResponder(GZipResponder):
+    """GZip só para conteúdo textual (JSON, HTML, JS...); mídia, PDFs e SSE passam direto"""
+    
+    async def send_with_compression(self, message) -> None:
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            # Mantém a exclusão do Starlette (text/event-stream: o SSE sairia só no fim)
+            self.content_type_is_excluded = (
+                self.content_type_is_excluded or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+
+class CompressibleGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware restrito a respostas textuais"""
+    
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if "gzip" in accepted_encodings(Headers(scope=scope)):
+            responder = _CompressibleGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
+
+# ==================== PRÉ-COMPRESSÃO ====================
+def precompress(directory: str, min_size: int = 1024) -> Dict[str, int]:
+    """Gera .gz (e .br, com brotli instalado) ao lado dos arquivos textuais do diretório"""
+    counts = {"files": 0, "written": 0}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            counts["files"] += 1
+            with open(path, "rb") as f:
+                data = f.read()
+            encoders = [(".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                encoders.append((".br", brotli.compress))
+            for suffix, encode in encoders:
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                encoded = encode(data)
+                # Não compensa guardar uma variante que quase não reduz
+                if len(encoded) >= stat.st_size * 0.9:
+                    continue
+                with open(target, "wb") as f:
+                    f.write(encoded)
+                counts["written"] += 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-comprime (gzip/brotli) os assets do build")
+    parser.add_argument("directory", nargs="?", default="VistorIA/static/dist")
+    parser.add_argument("--min-size", type=int, default=1024, help="ignora arquivos menores (bytes)")
+    args = parser.parse_args()
+    
+    counts = precompress(args.directory, args.min_size)
+    formats = "gzip e brotli" if brotli is not None else "gzip (instale brotli para .br)"
+    print(f"{counts['files']} arquivos comprimíveis, {counts['written']} variantes geradas ({formats})")
+
+if __name__ == "__main__":
+    main()
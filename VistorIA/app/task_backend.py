@@ -0,0 +1,220 @@
+"""Backend de execução das tasks: Celery quando disponível, senão local.
+
+TASK_BACKEND=celery usa sempre o Celery/Redis; TASK_BACKEND=local executa as
+tasks no próprio processo da API (threads para I/O, processos para a fila
+cpu), com status gravado na tabela task_results; TASK_BACKEND=auto (padrão)
+usa o Celery se o broker responder e cai para o local caso contrário.
+A interface é a mesma nos dois casos: enqueue(...).id e get_result(id).
+"""
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from typing import List, Optional, Sequence, Tuple
+
+from .database import SessionLocal, TaskResult
+
+TASK_BACKEND = os.getenv("TASK_BACKEND", "auto").lower()
+LOCAL_TASK_WORKERS = int(os.getenv("LOCAL_TASK_WORKERS", str(os.cpu_count() or 2)))
+LOCAL_RESULT_EXPIRES = int(os.getenv("CELERY_RESULT_EXPIRES", "86400"))
+
+_broker_available: Optional[bool] = None
+_executors = {}
+_executors_lock = threading.Lock()
+_local_pending = {}  # fila -> tasks locais na fila ou em execução
+
+def broker_available(celery_app) -> bool:
+    """Testa uma vez se o broker do Celery responde (timeout curto)"""
+    global _broker_available
+    if _broker_available is None:
+        try:
+            with celery_app.connection_for_write() as conn:
+                conn.ensure_connection(max_retries=1, timeout=1)
+            _broker_available = True
+        except Exception as e:
+            print(f"Broker do Celery indisponível, usando execução local: {e}")
+            _broker_available = False
+    return _broker_available
+
+def mark_broker_unavailable() -> None:
+    """Passa a usar o backend local (modo auto) após uma falha ao enfileirar"""
+    global _broker_available
+    _broker_available = False
+
+def use_celery(celery_app) -> bool:
+    """Define se as tasks vão para o Celery ou para o executor local"""
+    if TASK_BACKEND == "celery":
+        return True
+    if TASK_BACKEND == "local":
+        return False
+    return broker_available(celery_app)
+
+# ==================== EXECUÇÃO LOCAL ====================
+def _executor(cpu_bound: bool):
+    """Pool de processos para tasks de CPU e de threads para as demais"""
+    kind = "cpu" if cpu_bound else "io"
+    with _executors_lock:
+        if kind not in _executors:
+            if cpu_bound:
+                _executors[kind] = ProcessPoolExecutor(max_workers=LOCAL_TASK_WORKERS, mp_context=get_context("spawn"))
+            else:
+                _executors[kind] = ThreadPoolExecutor(max_workers=LOCAL_TASK_WORKERS * 4, thread_name_prefix="vistoria-task")
+        return _executors[kind]
+
+def _queue_name(task) -> str:
+    return task.app.amqp.router.route({}, task.name)["queue"].name
+
+def _track_pending(queue: str, delta: int) -> None:
+    with _executors_lock:
+        _local_pending[queue] = _local_pending.get(queue, 0) + delta
+
+def local_queue_depth() -> dict:
+    """Tasks locais pendentes (na fila ou em execução) por fila"""
+    with _executors_lock:
+        return dict(_local_pending)
+
+def _set_state(task_id: str, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.query(TaskResult).filter(TaskResult.id == task_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+def _run_local_task(task_name: str, args: tuple, task_id: str) -> None:
+    """Executa a task e grava o resultado (roda na thread ou no processo filho)"""
+    global _broker_available
+    from .background_tasks import celery_app
+    # Execução local implica broker indisponível; evita testá-lo de novo no processo filho
+    _broker_available = False
+    _set_state(task_id, state="STARTED")
+    try:
+        result = celery_app.tasks[task_name](*args)
+        _set_state(task_id, state="SUCCESS", result=result, finished_at=datetime.utcnow())
+    except Exception as e:
+        traceback.print_exc()
+        _set_state(task_id, state="FAILURE", error=str(e), finished_at=datetime.utcnow())
+
+def _register(task_ids: Sequence[Tuple[str, str]]) -> None:
+    """Grava as tasks como PENDING e remove resultados expirados"""
+    db = SessionLocal()
+    try:
+        db.query(TaskResult).filter(
+            TaskResult.created_at < datetime.utcnow() - timedelta(seconds=LOCAL_RESULT_EXPIRES)
+        ).delete(synchronize_session=False)
+        db.add_all(TaskResult(id=task_id, name=name, state="PENDING") for task_id, name in task_ids)
+        db.commit()
+    finally:
+        db.close()
+
+def _submit_local(task, args: tuple, task_id: str):
+    """Envia a task ao executor e publica as mudanças de estado a partir deste processo"""
+    from .progress import publish_progress
+    inspection_id = args[0] if args and isinstance(args[0], int) else None
+    event = {'type': 'task', 'task_id': task_id, 'task': task.name.rsplit('.', 1)[-1]}
+    
+    queue = _queue_name(task)
+    
+    def done(_):
+        _track_pending(queue, -1)
+        publish_progress(inspection_id, dict(event, state=LocalAsyncResult(task_id).state))
+    
+    publish_progress(inspection_id, dict(event, state='PENDING'))
+    _track_pending(queue, 1)
+    future = _executor(queue == "cpu").submit(_run_local_task, task.name, tuple(args), task_id)
+    future.add_done_callback(done)
+    return future
+
+class LocalAsyncResult:
+    """Equivalente ao AsyncResult do Celery para tasks locais"""
+    
+    def __init__(self, task_id: str):
+        self.id = task_id
+    
+    def _record(self) -> Optional[TaskResult]:
+        db = SessionLocal()
+        try:
+            return db.query(TaskResult).filter(TaskResult.id == self.id).first()
+        finally:
+            db.close()
+    
+    @property
+    def state(self) -> str:
+        record = self._record()
+        return record.state if record else "PENDING"
+    
+    status = state
+    
+    @property
+    def result(self):
+        record = self._record()
+        if not record:
+            return None
+        return record.error if record.state == "FAILURE" else record.result
+    
+    def ready(self) -> bool:
+        return self.state in ("SUCCESS", "FAILURE")
+    
+    def successful(self) -> bool:
+        return self.state == "SUCCESS"
+
+def _fail_skipped(stages: List[List[Tuple[object, tuple, str]]], error: str) -> None:
+    """Marca como FAILURE, sem executar, as tasks das etapas que não vão rodar"""
+    from .progress import publish_progress
+    for stage in stages:
+        for task, args, task_id in stage:
+            _set_state(task_id, state="FAILURE", error=error, finished_at=datetime.utcnow())
+            inspection_id = args[0] if args and isinstance(args[0], int) else None
+            publish_progress(inspection_id, {
+                'type': 'task', 'task_id': task_id, 'task': task.name.rsplit('.', 1)[-1], 'state': 'FAILURE'
+            })
+
+def run_local_pipeline(stages: List[List[Tuple[object, tuple, str]]]) -> None:
+    """Executa etapas em sequência; as tasks de cada etapa rodam em paralelo.
+
+    Cada task é (task, args, task_id). Equivale ao chord/chain do Celery usado
+    em start_batch_processing: se uma task de uma etapa falha, as etapas
+    seguintes não rodam e suas tasks ficam como FAILURE.
+    """
+    _register([(task_id, task.name) for stage in stages for task, _, task_id in stage])
+    
+    def run():
+        for position, stage in enumerate(stages):
+            futures = [_submit_local(task, args, task_id) for task, args, task_id in stage]
+            wait(futures)
+            failed = [
+                task_id for future, (_, _, task_id) in zip(futures, stage)
+                if future.exception() is not None or LocalAsyncResult(task_id).state != "SUCCESS"
+            ]
+            if failed:
+                _fail_skipped(stages[position + 1:], f"Etapa anterior falhou (tasks {', '.join(failed)})")
+                return
+    
+    threading.Thread(target=run, name="vistoria-pipeline", daemon=True).start()
+
+# ==================== INTERFACE COMUM ====================
+def enqueue(task, *args, priority: Optional[int] = None, task_id: Optional[str] = None):
+    """Enfileira a task no backend ativo; retorna objeto com .id"""
+    task_id = task_id or str(uuid.uuid4())
+    if use_celery(task.app):
+        try:
+            return task.apply_async(args, priority=priority, task_id=task_id)
+        except Exception as e:
+            if TASK_BACKEND == "celery":
+                raise
+            print(f"Falha ao enfileirar no Celery, executando localmente: {e}")
+            mark_broker_unavailable()
+    _register([(task_id, task.name)])
+    _submit_local(task, args, task_id)
+    return LocalAsyncResult(task_id)
+
+def get_result(celery_app, task_id: str):
+    """AsyncResult da task, seja do Celery ou do backend local"""
+    if TASK_BACKEND != "celery":
+        local = LocalAsyncResult(task_id)
+        if local._record() is not None:
+            return local
+    return celery_app.AsyncResult(task_id)
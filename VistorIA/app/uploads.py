@@ -0,0 +1,261 @@
+"""Uploads retomáveis (no estilo tus) para vídeos e áudios longos.
+
+POST /api/uploads cria a sessão com o tamanho total. Cada PATCH envia um trecho
+a partir de Upload-Offset, gravado direto no arquivo parcial à medida que chega
+(memória constante). Se a conexão cair, o que já foi gravado conta; HEAD
+devolve o offset para o cliente retomar. POST /api/uploads/{id}/complete
+confere o sha256 e cria o InspectionFile.
+
+Antes de gravar, a requisição reserva o upload no banco (claimed_by, com
+UPDATE condicional): entre workers, só uma escreve no arquivo parcial por vez
+e as demais recebem 409. A reserva é renovada durante o envio e, se o worker
+morrer, vence em RESUMABLE_UPLOAD_CLAIM_SECONDS. Nenhuma transação fica aberta
+enquanto os bytes chegam.
+"""
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from .database import Inspection, InspectionFile, UploadSession
+from .media import MEDIA_ROOT
+from .phash import register_photo
+
+UPLOAD_DIR = MEDIA_ROOT
+# Arquivos parciais ficam fora de /static (não são servidos)
+RESUMABLE_UPLOAD_DIR = os.getenv("RESUMABLE_UPLOAD_DIR", "VistorIA/uploads_partial")
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.getenv("RESUMABLE_UPLOAD_MAX_SIZE", str(2 * 1024 ** 3)))
+RESUMABLE_UPLOAD_EXPIRE_HOURS = float(os.getenv("RESUMABLE_UPLOAD_EXPIRE_HOURS", "24"))
+RESUMABLE_UPLOAD_CLAIM_SECONDS = float(os.getenv("RESUMABLE_UPLOAD_CLAIM_SECONDS", "120"))
+HASH_BLOCK_SIZE = 1024 * 1024
+
+class UploadError(Exception):
+    """Erro do protocolo de upload, com o status HTTP correspondente"""
+    
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+def partial_path(upload_id: str) -> str:
+    return os.path.join(RESUMABLE_UPLOAD_DIR, f"{upload_id}.part")
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def purge_expired_uploads(db: Session) -> int:
+    """Remove sessões paradas há mais de RESUMABLE_UPLOAD_EXPIRE_HOURS e seus arquivos parciais"""
+    cutoff = datetime.utcnow() - timedelta(hours=RESUMABLE_UPLOAD_EXPIRE_HOURS)
+    expired = db.query(UploadSession).filter(UploadSession.updated_at < cutoff).all()
+    for upload in expired:
+        if upload.file_id is None:
+            _remove(partial_path(upload.id))
+        db.delete(upload)
+    db.commit()
+    return len(expired)
+
+def create_upload(db: Session, inspection_id: int, file_type: str, filename: str, size: int,
+                  checklist_item_id=None, sha256=None) -> UploadSession:
+    """Cria a sessão e o arquivo parcial vazio"""
+    if size > RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError(413, f"Arquivo maior que o limite de {RESUMABLE_UPLOAD_MAX_SIZE} bytes")
+    if not db.query(Inspection.id).filter(Inspection.id == inspection_id).first():
+        raise UploadError(404, "Vistoria não encontrada")
+    purge_expired_uploads(db)
+    
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        inspection_id=inspection_id,
+        checklist_item_id=checklist_item_id,
+        file_type=file_type,
+        # Só o nome: o cliente não escolhe o diretório
+        original_filename=os.path.basename(filename.replace('\\', '/')) or 'arquivo',
+        total_size=size,
+        received=0,
+        sha256=sha256.lower() if sha256 else None,
+        updated_at=datetime.utcnow()
+    )
+    os.makedirs(RESUMABLE_UPLOAD_DIR, exist_ok=True)
+    open(partial_path(upload.id), 'wb').close()
+    db.add(upload)
+    db.commit()
+    return upload
+
+def get_upload(db: Session, upload_id: str) -> UploadSession:
+    upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+    if not upload:
+        raise UploadError(404, "Upload não encontrado ou expirado")
+    return upload
+
+def _claim(db: Session, upload_id: str, offset: int) -> str:
+    """Reserva o upload para esta requisição (entre workers) e encerra a transação.
+
+    Só reserva se o upload não foi finalizado, está no offset esperado e não há
+    outra reserva válida. Devolve o token da reserva.
+    """
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimed = db.query(UploadSession).filter(
+        UploadSession.id == upload_id,
+        UploadSession.file_id.is_(None),
+        UploadSession.received == offset,
+        or_(UploadSession.claimed_by.is_(None),
+            UploadSession.claimed_at < now - timedelta(seconds=RESUMABLE_UPLOAD_CLAIM_SECONDS))
+    ).update({'claimed_by': token, 'claimed_at': now, 'updated_at': now}, synchronize_session=False)
+    db.commit()
+    if claimed:
+        return token
+    
+    upload = get_upload(db, upload_id)
+    received, finished = upload.received, upload.file_id is not None
+    db.commit()
+    if finished:
+        raise UploadError(409, "Upload já finalizado")
+    if offset != received:
+        raise UploadError(409, f"Upload-Offset {offset} diferente do recebido ({received})")
+    raise UploadError(409, "Outro envio em andamento para este upload; tente de novo em instantes")
+
+def _renew_claim(db: Session, upload_id: str, token: str) -> bool:
+    now = datetime.utcnow()
+    renewed = db.query(UploadSession).filter(
+        UploadSession.id == upload_id, UploadSession.claimed_by == token
+    ).update({'claimed_at': now, 'updated_at': now}, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+def _release_claim(db: Session, upload_id: str, token: str) -> None:
+    db.rollback()
+    db.query(UploadSession).filter(
+        UploadSession.id == upload_id, UploadSession.claimed_by == token
+    ).update({'claimed_by': None, 'claimed_at': None}, synchronize_session=False)
+    db.commit()
+
+async def append_chunk(db: Session, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """Grava os bytes recebidos a partir de offset e devolve o novo offset.
+
+    Se o cliente desconectar no meio, os bytes já gravados são mantidos.
+    """
+    upload = get_upload(db, upload_id)
+    total_size = upload.total_size
+    token = _claim(db, upload_id, offset)
+    
+    written = 0
+    too_large = False
+    confirmed = False
+    try:
+        renew_every = RESUMABLE_UPLOAD_CLAIM_SECONDS / 3
+        renewed_at = time.monotonic()
+        f = await run_in_threadpool(open, partial_path(upload_id), 'r+b')
+        try:
+            await run_in_threadpool(f.seek, offset)
+            try:
+                async for chunk in chunks:
+                    room = total_size - offset - written
+                    if len(chunk) > room:
+                        chunk, too_large = chunk[:room], True
+                    if chunk:
+                        await run_in_threadpool(f.write, chunk)
+                        written += len(chunk)
+                    if too_large:
+                        break
+                    if time.monotonic() - renewed_at > renew_every:
+                        # Envio longo: mantém a reserva (transação curta, só para renovar)
+                        if not _renew_claim(db, upload_id, token):
+                            raise UploadError(409, "Reserva do upload perdida; consulte o offset com HEAD")
+                        renewed_at = time.monotonic()
+            except ClientDisconnect:
+                pass
+            # Durável antes de confirmar o offset: o cliente retoma a partir dele
+            await run_in_threadpool(lambda: (f.flush(), os.fsync(f.fileno())))
+        finally:
+            await run_in_threadpool(f.close)
+        
+        updated = db.query(UploadSession).filter(
+            UploadSession.id == upload_id, UploadSession.claimed_by == token, UploadSession.received == offset
+        ).update({
+            'received': offset + written, 'claimed_by': None, 'claimed_at': None, 'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        confirmed = True
+        if not updated:
+            raise UploadError(409, "Upload alterado por outra requisição; consulte o offset com HEAD")
+    finally:
+        if not confirmed:
+            _release_claim(db, upload_id, token)
+    if too_large:
+        raise UploadError(413, f"Dados além do tamanho declarado ({total_size} bytes)")
+    return offset + written
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def complete_upload(db: Session, upload_id: str) -> InspectionFile:
+    """Confere tamanho e hash, move o arquivo para o diretório de uploads e cria o InspectionFile"""
+    upload = get_upload(db, upload_id)
+    if upload.file_id is not None:
+        # Finalização repetida (resposta perdida): devolve o mesmo arquivo
+        return db.query(InspectionFile).filter(InspectionFile.id == upload.file_id).first()
+    if upload.received != upload.total_size:
+        raise UploadError(409, f"Upload incompleto: {upload.received} de {upload.total_size} bytes")
+    token = _claim(db, upload_id, upload.total_size)
+    
+    try:
+        upload = get_upload(db, upload_id)
+        source = partial_path(upload_id)
+        db.commit()
+        digest = await run_in_threadpool(_file_sha256, source)
+        if upload.sha256 and digest != upload.sha256:
+            # Conteúdo corrompido: descarta para o cliente reenviar do zero
+            _remove(source)
+            db.delete(upload)
+            db.commit()
+            raise UploadError(422, "sha256 do arquivo não confere; reenvie o arquivo")
+        
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        file_path = os.path.join(UPLOAD_DIR, f"{upload.inspection_id}_{upload_id[:8]}_{upload.original_filename}")
+        await run_in_threadpool(shutil.move, source, file_path)
+        
+        file_record = InspectionFile(
+            inspection_id=upload.inspection_id,
+            checklist_item_id=upload.checklist_item_id,
+            file_type=upload.file_type,
+            file_path=file_path,
+            original_filename=upload.original_filename,
+            sha256=digest,
+            size_bytes=upload.total_size
+        )
+        db.add(file_record)
+        db.flush()
+        if file_record.file_type == 'photo':
+            await run_in_threadpool(register_photo, db, file_record)
+        upload.file_id = file_record.id
+        upload.claimed_by = None
+        upload.claimed_at = None
+        upload.updated_at = datetime.utcnow()
+        db.commit()
+        return file_record
+    except BaseException:
+        _release_claim(db, upload_id, token)
+        raise
+
+def abort_upload(db: Session, upload_id: str) -> None:
+    """Cancela o upload e apaga o arquivo parcial"""
+    upload = get_upload(db, upload_id)
+    if upload.file_id is None:
+        _remove(partial_path(upload_id))
+    db.delete(upload)
+    db.commit()
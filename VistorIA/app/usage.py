@@ -0,0 +1,287 @@
+"""Consumo da OpenAI (tokens e custo) por vistoria, endpoint e modelo, com orçamentos.
+
+Cada chamada grava uma linha em openai_usage, com os tokens devolvidos em
+response.usage e o custo estimado pela tabela de preços. A vistoria vem do
+inspection_id da rota/query ou do cabeçalho X-Inspection-Id; o endpoint, do
+template da rota.
+
+Orçamentos em USD (0 = sem limite): por vistoria e global por dia (UTC). Acima
+de OPENAI_BUDGET_ECONOMY_RATIO do orçamento as chamadas ficam mais baratas
+(imagens reduzidas, detecção secundária desligada); com o orçamento esgotado
+só respostas do cache são servidas e o resto falha com BudgetExceeded (HTTP 429).
+
+O cache de respostas serve só para degradar: as respostas são guardadas, mas
+lidas apenas fora do modo normal; com orçamento sobrando, cada entrada é
+analisada de novo. Respostas do modo econômico ficam sob outra chave, e entradas
+do cache expiram em OPENAI_RESPONSE_CACHE_TTL_HOURS.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal, OpenAIUsage, OpenAIResponseCache
+from .metrics import track_openai
+from .singleflight import single_flight
+
+OPENAI_BUDGET_PER_INSPECTION_USD = float(os.getenv("OPENAI_BUDGET_PER_INSPECTION_USD", "0"))
+OPENAI_BUDGET_DAILY_USD = float(os.getenv("OPENAI_BUDGET_DAILY_USD", "0"))
+OPENAI_BUDGET_ECONOMY_RATIO = float(os.getenv("OPENAI_BUDGET_ECONOMY_RATIO", "0.8"))
+OPENAI_ECONOMY_IMAGE_MAX_SIDE = int(os.getenv("OPENAI_ECONOMY_IMAGE_MAX_SIDE", "768"))
+OPENAI_RESPONSE_CACHE = os.getenv("OPENAI_RESPONSE_CACHE", "true").lower() != "false"
+OPENAI_RESPONSE_CACHE_TTL_HOURS = float(os.getenv("OPENAI_RESPONSE_CACHE_TTL_HOURS", "720"))
+
+# Preço por 1M tokens (entrada, saída) em USD; o nome mais longo que prefixa o modelo vence
+MODEL_PRICES_USD = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+WHISPER_PRICE_PER_MINUTE_USD = 0.006
+
+BUDGET_NORMAL = "normal"
+BUDGET_ECONOMY = "economy"
+BUDGET_EXHAUSTED = "exhausted"
+
+class BudgetExceeded(Exception):
+    """Orçamento da OpenAI esgotado e resposta fora do cache"""
+
+def estimate_cost(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, audio_seconds: float = 0.0) -> float:
+    """Custo estimado de uma chamada, em USD"""
+    if model.startswith("whisper"):
+        return audio_seconds / 60 * WHISPER_PRICE_PER_MINUTE_USD
+    for name in sorted(MODEL_PRICES_USD, key=len, reverse=True):
+        if model.startswith(name):
+            input_price, output_price = MODEL_PRICES_USD[name]
+            return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    return 0.0
+
+# ==================== ESCOPO (VISTORIA / ENDPOINT) ====================
+_request: ContextVar = ContextVar("vistoria_usage_request", default=None)
+
+def install_usage_scope(app) -> None:
+    """Guarda a requisição atual para atribuir o consumo à vistoria e ao endpoint"""
+    @app.middleware("http")
+    async def _usage_scope(request, call_next):
+        token = _request.set(request)
+        try:
+            return await call_next(request)
+        finally:
+            _request.reset(token)
+
+def current_scope() -> Tuple[Optional[int], Optional[str]]:
+    """(inspection_id, endpoint) da requisição atual"""
+    request = _request.get()
+    if request is None:
+        return None, None
+    # path_params e route só existem depois do roteamento; por isso a leitura é tardia
+    route = getattr(request.scope.get("route"), "path", None)
+    raw = (
+        request.scope.get("path_params", {}).get("inspection_id")
+        or request.query_params.get("inspection_id")
+        or request.headers.get("x-inspection-id")
+    )
+    try:
+        inspection_id = int(raw) if raw not in (None, "") else None
+    except ValueError:
+        inspection_id = None
+    return inspection_id, route
+
+# ==================== ORÇAMENTOS ====================
+def _day_start() -> datetime:
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+def budget_status(inspection_id: Optional[int] = None) -> Dict:
+    """Gasto da vistoria e do dia e o modo resultante (normal, economy, exhausted)"""
+    db = SessionLocal()
+    try:
+        total = func.coalesce(func.sum(OpenAIUsage.cost_usd), 0.0)
+        daily = db.query(total).filter(OpenAIUsage.created_at >= _day_start()).scalar()
+        inspection = (
+            db.query(total).filter(OpenAIUsage.inspection_id == inspection_id).scalar()
+            if inspection_id is not None else 0.0
+        )
+    finally:
+        db.close()
+    
+    ratios = [spent / budget for spent, budget in (
+        (inspection, OPENAI_BUDGET_PER_INSPECTION_USD), (daily, OPENAI_BUDGET_DAILY_USD)
+    ) if budget > 0]
+    ratio = max(ratios, default=0.0)
+    if ratio >= 1:
+        mode = BUDGET_EXHAUSTED
+    elif ratio >= OPENAI_BUDGET_ECONOMY_RATIO:
+        mode = BUDGET_ECONOMY
+    else:
+        mode = BUDGET_NORMAL
+    return {
+        'mode': mode,
+        'inspection_id': inspection_id,
+        'inspection_spent_usd': round(inspection, 6),
+        'inspection_budget_usd': OPENAI_BUDGET_PER_INSPECTION_USD or None,
+        'daily_spent_usd': round(daily, 6),
+        'daily_budget_usd': OPENAI_BUDGET_DAILY_USD or None,
+    }
+
+def _budget_mode(inspection_id: Optional[int]) -> str:
+    if not (OPENAI_BUDGET_PER_INSPECTION_USD or OPENAI_BUDGET_DAILY_USD):
+        return BUDGET_NORMAL
+    return budget_status(inspection_id)['mode']
+
+def economy_image(data: bytes, content_type: str) -> Tuple[bytes, str]:
+    """Imagem reduzida (maior lado OPENAI_ECONOMY_IMAGE_MAX_SIDE) para o modo econômico"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) <= OPENAI_ECONOMY_IMAGE_MAX_SIDE and content_type == 'image/jpeg':
+            return data, content_type
+        image.thumbnail((OPENAI_ECONOMY_IMAGE_MAX_SIDE, OPENAI_ECONOMY_IMAGE_MAX_SIDE))
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, 'JPEG', quality=80)
+        return buffer.getvalue(), 'image/jpeg'
+    except Exception as e:
+        print(f"Erro ao reduzir imagem: {e}")
+        return data, content_type
+
+# ==================== REGISTRO E CACHE ====================
+def _store_usage(row: Dict) -> None:
+    db = SessionLocal()
+    try:
+        db.add(OpenAIUsage(**row))
+        db.commit()
+    except Exception as e:
+        # Falha no registro não pode derrubar a chamada que já foi paga
+        db.rollback()
+        print(f"Erro ao registrar consumo da OpenAI: {e}")
+    finally:
+        db.close()
+
+class track_usage(track_openai):
+    """track_openai que também grava o consumo da chamada em openai_usage"""
+    
+    def __init__(self, function: str, model: str, budget_mode: str = BUDGET_NORMAL):
+        super().__init__(function, model)
+        self.budget_mode = budget_mode
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await super().__aexit__(exc_type, exc, tb)
+        if exc_type is None:
+            inspection_id, endpoint = current_scope()
+            await asyncio.to_thread(_store_usage, {
+                'inspection_id': inspection_id, 'endpoint': endpoint,
+                'function': self.function, 'model': self.model,
+                'prompt_tokens': self.usage['prompt'], 'completion_tokens': self.usage['completion'],
+                'audio_seconds': self.usage['seconds'],
+                'cost_usd': estimate_cost(self.model, self.usage['prompt'], self.usage['completion'], self.usage['seconds']),
+                'budget_mode': self.budget_mode,
+            })
+        return False
+
+def response_key(function: str, model: str, content: bytes, mode: str = BUDGET_NORMAL) -> str:
+    """Chave do cache; respostas do modo econômico (entrada reduzida) têm chave própria"""
+    prefix = f"{function}\0{model}\0" if mode == BUDGET_NORMAL else f"{function}\0{model}\0{mode}\0"
+    return hashlib.sha256(prefix.encode() + content).hexdigest()
+
+def _cache_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(hours=OPENAI_RESPONSE_CACHE_TTL_HOURS)
+
+def _load_response(key: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        row = db.query(OpenAIResponseCache.response).filter(
+            OpenAIResponseCache.content_hash == key, OpenAIResponseCache.created_at >= _cache_cutoff()
+        ).first()
+        return row.response if row else None
+    finally:
+        db.close()
+
+def _store_response(key: str, function: str, response: str) -> None:
+    db = SessionLocal()
+    try:
+        # Remove as entradas expiradas e a anterior da mesma chave: fica a resposta mais recente
+        db.query(OpenAIResponseCache).filter(or_(
+            OpenAIResponseCache.created_at < _cache_cutoff(), OpenAIResponseCache.content_hash == key
+        )).delete(synchronize_session=False)
+        db.add(OpenAIResponseCache(content_hash=key, function=function, response=response, created_at=datetime.utcnow()))
+        db.commit()
+    except IntegrityError:
+        # Outra requisição gravou a mesma entrada
+        db.rollback()
+    finally:
+        db.close()
+
+async def budgeted_call(function: str, model: str, content: bytes,
+                        call: Callable[[str], Awaitable[str]], optional: bool = False) -> Optional[str]:
+    """Orçamento -> cache (fora do modo normal) -> chamada à OpenAI.
+    
+    content identifica a entrada (prompt + mídia) no cache. call(mode) faz a
+    requisição, reduzindo-a no modo econômico. Chamadas opcionais são puladas
+    (None) no modo econômico; sem orçamento, só o cache responde.
+    """
+    async def load_cached(key: str) -> Optional[str]:
+        return await asyncio.to_thread(_load_response, key) if OPENAI_RESPONSE_CACHE else None
+    
+    async def no_cache() -> None:
+        return None
+    
+    inspection_id, _ = current_scope()
+    mode = await asyncio.to_thread(_budget_mode, inspection_id)
+    economy_key = response_key(function, model, content, BUDGET_ECONOMY)
+    if mode != BUDGET_NORMAL:
+        # Orçamento apertado: uma resposta já guardada (normal ou econômica) serve
+        for cache_key in (response_key(function, model, content), economy_key):
+            cached = await load_cached(cache_key)
+            if cached is not None:
+                return cached
+        if optional:
+            return None
+    if mode == BUDGET_EXHAUSTED:
+        scope = f"da vistoria {inspection_id}" if inspection_id is not None else "diário"
+        raise BudgetExceeded(f"Orçamento {scope} da OpenAI esgotado")
+    
+    key = economy_key if mode == BUDGET_ECONOMY else response_key(function, model, content)
+    
+    async def produce() -> str:
+        response = await call(mode)
+        if OPENAI_RESPONSE_CACHE and response:
+            await asyncio.to_thread(_store_response, key, function, response)
+        return response
+    
+    # Requisições idênticas simultâneas compartilham a mesma chamada
+    return await single_flight(key, function, produce,
+                               no_cache if mode == BUDGET_NORMAL else lambda: load_cached(key))
+
+# ==================== RELATÓRIO ====================
+def usage_summary(db, inspection_id: Optional[int] = None, days: Optional[int] = None):
+    """Consumo agregado por vistoria, endpoint e modelo"""
+    query = db.query(
+        OpenAIUsage.inspection_id, OpenAIUsage.endpoint, OpenAIUsage.model,
+        func.count(OpenAIUsage.id).label('calls'),
+        func.coalesce(func.sum(OpenAIUsage.prompt_tokens), 0).label('prompt_tokens'),
+        func.coalesce(func.sum(OpenAIUsage.completion_tokens), 0).label('completion_tokens'),
+        func.coalesce(func.sum(OpenAIUsage.audio_seconds), 0.0).label('audio_seconds'),
+        func.coalesce(func.sum(OpenAIUsage.cost_usd), 0.0).label('cost_usd'),
+    ).group_by(OpenAIUsage.inspection_id, OpenAIUsage.endpoint, OpenAIUsage.model)
+    if inspection_id is not None:
+        query = query.filter(OpenAIUsage.inspection_id == inspection_id)
+    if days:
+        query = query.filter(OpenAIUsage.created_at >= _day_start() - timedelta(days=days - 1))
+    
+    rows = [
+        {
+            'inspection_id': row.inspection_id, 'endpoint': row.endpoint, 'model': row.model,
+            'calls': row.calls, 'prompt_tokens': row.prompt_tokens, 'completion_tokens': row.completion_tokens,
+            'audio_seconds': round(row.audio_seconds, 1), 'cost_usd': round(row.cost_usd, 6),
+        }
+        for row in query.order_by(func.sum(OpenAIUsage.cost_usd).desc())
+    ]
+    return {
+        'usage': rows,
+        'total_cost_usd': round(sum(row['cost_usd'] for row in rows), 6),
+        'total_calls': sum(row['calls'] for row in rows),
+    }
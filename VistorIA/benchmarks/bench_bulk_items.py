@@ -0,0 +1,70 @@
+"""Throughput da gravação de itens do checklist: um a um vs. upsert em lote.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python VistorIA/benchmarks/bench_bulk_items.py [--items 500] [--rounds 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix='vistoria_bench_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'bench.db')}")
+
+from app.database import SessionLocal, create_tables, Inspection, ChecklistItem  # noqa: E402
+from app.crud import upsert_checklist_items  # noqa: E402
+
+def _new_inspection(db) -> int:
+    inspection = Inspection(property_address='Rua Benchmark, 1', landlord_name='L', tenant_name='T')
+    db.add(inspection)
+    db.commit()
+    return inspection.id
+
+def _items(count: int, status: str):
+    return [{'room': f'comodo{i // 20}', 'item': f'item{i}', 'status': status} for i in range(count)]
+
+def bench_one_by_one(count: int) -> float:
+    db = SessionLocal()
+    try:
+        inspection_id = _new_inspection(db)
+        start = time.perf_counter()
+        for raw in _items(count, 'ok'):
+            db.add(ChecklistItem(inspection_id=inspection_id, **raw))
+            db.commit()
+        return time.perf_counter() - start
+    finally:
+        db.close()
+
+def bench_bulk(count: int) -> tuple:
+    db = SessionLocal()
+    try:
+        inspection_id = _new_inspection(db)
+        start = time.perf_counter()
+        upsert_checklist_items(db, inspection_id, _items(count, 'ok'))
+        insert_time = time.perf_counter() - start
+        start = time.perf_counter()
+        upsert_checklist_items(db, inspection_id, _items(count, 'danificado'))
+        return insert_time, time.perf_counter() - start
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    
+    create_tables()
+    print(f"Banco: {os.environ['DATABASE_URL']} | {args.items} itens por lote")
+    for round_number in range(1, args.rounds + 1):
+        single = bench_one_by_one(args.items)
+        bulk_insert, bulk_update = bench_bulk(args.items)
+        print(
+            f"rodada {round_number}: "
+            f"um a um {args.items / single:8.0f} itens/s | "
+            f"lote (insert) {args.items / bulk_insert:8.0f} itens/s | "
+            f"lote (update) {args.items / bulk_update:8.0f} itens/s"
+        )
+
+if __name__ == '__main__':
+    main()
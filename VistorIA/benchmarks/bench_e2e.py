@@ -0,0 +1,309 @@
+"""Benchmark ponta a ponta da API com a OpenAI simulada (benchmarks/fake_openai.py).
+
+Sobe o servidor falso da OpenAI e a API (uvicorn, banco SQLite temporário) em
+subprocessos, cria uma vistoria de teste e dispara cada cenário com
+concorrência controlada, medindo p50/p95/p99, throughput e erros:
+
+    vision         POST /api/vision (análise + detecção de itens: 2 chamadas à OpenAI)
+    auto-checklist POST /api/auto-checklist (3 fotos)
+    transcribe     POST /api/transcribe
+    report         POST /api/report (PDF com 30 itens)
+    estimate-costs POST /api/estimate-costs
+    tasks          POST /api/batch-process + consulta do status até terminar
+
+Com --save-baseline os resultados são gravados em --baseline; com --compare
+são comparados com ele e o script sai com código 1 se algum p95 ou throughput
+piorar além da --tolerance. A linha de base depende da máquina: grave uma
+antes da mudança e compare depois, na mesma máquina.
+
+Uso (a partir da raiz do repositório):
+    python VistorIA/benchmarks/bench_e2e.py [--scenarios vision,report] [--requests 50] [--concurrency 8]
+        [--latency-ms 800] [--jitter-ms 200] [--error-rate 0.0] [--celery] [--save-baseline | --compare]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+REPO_ROOT = os.path.dirname(APP_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'e2e.json')
+SCENARIOS = ('vision', 'auto-checklist', 'transcribe', 'report', 'estimate-costs', 'tasks')
+TASK_POLL_INTERVAL = 0.05
+TASK_TIMEOUT = 120
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo terminou ao iniciar (código {process.returncode}): {url}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Tempo esgotado esperando {url}")
+
+def _sample_image() -> bytes:
+    image = Image.new('RGB', (640, 480), (200, 190, 170))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class Scenarios:
+    """Requisições de cada cenário; cada método faz uma requisição completa"""
+    
+    def __init__(self, client: httpx.AsyncClient, inspection_id: int):
+        self.client = client
+        self.inspection_id = inspection_id
+        self.image = _sample_image()
+        self.audio = os.urandom(32 * 1024)
+        self.report = {
+            'propertyAddress': 'Rua Benchmark, 42', 'landlordName': 'Locador', 'tenantName': 'Locatário',
+            'checklist': [
+                {'room': f'Cômodo {i // 6}', 'item': f'Item {i}', 'status': ('ok', 'danificado', 'sujo')[i % 3],
+                 'notes': 'Pequenos riscos na superfície.'}
+                for i in range(30)
+            ]
+        }
+    
+    async def vision(self):
+        return await self.client.post('/api/vision', files={'file': ('foto.jpg', self.image, 'image/jpeg')})
+    
+    async def auto_checklist(self):
+        files = [('files', (f'foto{i}.jpg', self.image, 'image/jpeg')) for i in range(3)]
+        return await self.client.post('/api/auto-checklist', files=files)
+    
+    async def transcribe(self):
+        return await self.client.post('/api/transcribe', files={'file': ('audio.webm', self.audio, 'audio/webm')})
+    
+    async def report_pdf(self):
+        return await self.client.post('/api/report', json=self.report)
+    
+    async def estimate_costs(self):
+        return await self.client.post('/api/estimate-costs', params={'inspection_id': self.inspection_id})
+    
+    async def tasks(self):
+        response = await self.client.post('/api/batch-process', params={'inspection_id': self.inspection_id})
+        if response.status_code != 200:
+            return response
+        pipeline_id = response.json()['pipeline_id']
+        deadline = time.monotonic() + TASK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(TASK_POLL_INTERVAL)
+            response = await self.client.get(f'/api/batch-process/{pipeline_id}')
+            if response.status_code != 200 or response.json()['status'] in ('SUCCESS', 'FAILURE'):
+                return response
+        raise TimeoutError(f"Pipeline {pipeline_id} não terminou em {TASK_TIMEOUT}s")
+    
+    def get(self, name: str):
+        return {
+            'vision': self.vision, 'auto-checklist': self.auto_checklist, 'transcribe': self.transcribe,
+            'report': self.report_pdf, 'estimate-costs': self.estimate_costs, 'tasks': self.tasks,
+        }[name]
+
+def _failed(response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    # Pipelines e /api/vision respondem 200 mesmo quando a etapa/IA falhou
+    if response.headers.get('content-type', '').startswith('application/json'):
+        body = response.json()
+        if isinstance(body, dict):
+            return body.get('status') == 'FAILURE' or str(body.get('description', '')).startswith('Erro ao analisar')
+    return False
+
+async def run_scenario(request, requests: int, concurrency: int, warmup: int) -> dict:
+    """Executa `requests` requisições com no máximo `concurrency` simultâneas"""
+    for _ in range(warmup):
+        await request()
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                failed = _failed(await request())
+            except Exception as e:
+                print(f"  erro: {e}")
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+        'throughput_rps': round(requests / elapsed, 2),
+    }
+
+async def _seed(client: httpx.AsyncClient, image: bytes) -> int:
+    """Vistoria com itens (custos) e fotos (pipeline de tasks)"""
+    response = await client.post('/api/inspections', json={
+        'property_address': 'Rua Benchmark, 42', 'landlord_name': 'Locador', 'tenant_name': 'Locatário'
+    })
+    response.raise_for_status()
+    inspection_id = response.json()['id']
+    items = [
+        {'room': f'Cômodo {i // 6}', 'item': f'Item {i}', 'status': ('ok', 'danificado', 'sujo', 'ausente')[i % 4]}
+        for i in range(30)
+    ]
+    response = await client.post(f'/api/inspections/{inspection_id}/items/bulk', json={'items': items})
+    response.raise_for_status()
+    for i in range(4):
+        response = await client.post('/api/upload-file', files={'file': (f'bench_{i}.jpg', image, 'image/jpeg')},
+                                     data={'inspection_id': str(inspection_id), 'file_type': 'photo'})
+        response.raise_for_status()
+    return inspection_id
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressões em relação à linha de base (p95 maior ou throughput menor que a tolerância)"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: erros {previous['errors']} -> {current['errors']}")
+    return regressions
+
+async def bench(args, api_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=api_url, timeout=TASK_TIMEOUT) as client:
+        scenarios = Scenarios(client, await _seed(client, _sample_image()))
+        results = {}
+        print(f"{'cenário':<16}{'req':>6}{'conc':>6}{'erros':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+        for name in args.scenarios:
+            result = await run_scenario(scenarios.get(name), args.requests, args.concurrency, args.warmup)
+            results[name] = result
+            print(f"{name:<16}{result['requests']:>6}{result['concurrency']:>6}{result['errors']:>7}"
+                  f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result['throughput_rps']:>9}")
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"lista separada por vírgulas ({', '.join(SCENARIOS)})")
+    parser.add_argument('--requests', type=int, default=50, help='requisições por cenário')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=2, help='requisições de aquecimento (não medidas)')
+    parser.add_argument('--latency-ms', type=float, default=800, help='latência média da OpenAI simulada')
+    parser.add_argument('--jitter-ms', type=float, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--responses', help='JSON com respostas da OpenAI simulada')
+    parser.add_argument('--celery', action='store_true', help='usar o Celery/Redis do ambiente (padrão: backend local)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.2, help='piora aceita em relação à linha de base (0.2 = 20%%)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--save-baseline', action='store_true')
+    group.add_argument('--compare', action='store_true')
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+    
+    openai_port, api_port = _free_port(), _free_port()
+    workdir = tempfile.mkdtemp(prefix='vistoria_e2e_')
+    fake_cmd = [sys.executable, os.path.join(BENCH_DIR, 'fake_openai.py'), '--port', str(openai_port),
+                '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+                '--error-rate', str(args.error_rate), '--seed', '0']
+    if args.responses:
+        fake_cmd += ['--responses', os.path.abspath(args.responses)]
+    
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join(filter(None, [APP_DIR, os.environ.get('PYTHONPATH')])),
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{openai_port}/v1',
+        'OPENAI_API_KEY': 'bench',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        # Os cenários repetem a mesma mídia e payload: sem cache de respostas e sem
+        # coalescência, cada requisição chega à OpenAI simulada
+        'OPENAI_RESPONSE_CACHE': 'false',
+        'SINGLEFLIGHT_BACKEND': 'off',
+    })
+    if not args.celery:
+        env['TASK_BACKEND'] = 'local'
+    
+    # Saída da API num arquivo, para não misturar com a tabela; cada processo em
+    # sua própria sessão, para encerrar junto os workers do pool de tasks locais
+    log_path = os.path.join(workdir, 'api.log')
+    processes = []
+    with open(log_path, 'w') as log:
+        try:
+            processes.append(subprocess.Popen(fake_cmd, env=env, start_new_session=True))
+            _wait_until_up(f'http://127.0.0.1:{openai_port}/calls', processes[-1])
+            # cwd na raiz: a API grava uploads/PDFs em caminhos relativos (VistorIA/media)
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(api_port), '--log-level', 'warning'],
+                cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+            ))
+            api_url = f'http://127.0.0.1:{api_port}'
+            _wait_until_up(f'{api_url}/api/health', processes[-1])
+            
+            print(f"OpenAI simulada: {args.latency_ms:.0f}±{args.jitter_ms:.0f}ms, erro {args.error_rate:.0%}; "
+                  f"backend de tasks: {'celery' if args.celery else 'local'}; log da API: {log_path}")
+            results = asyncio.run(bench(args, api_url))
+            print(f"Chamadas à OpenAI simulada: {httpx.get(f'http://127.0.0.1:{openai_port}/calls').json()}")
+        finally:
+            for process in reversed(processes):
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                process.wait(timeout=10)
+    
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        settings = {key: getattr(args, key) for key in ('latency_ms', 'jitter_ms', 'error_rate', 'requests', 'concurrency')}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'scenarios': results}, f, indent=2)
+        print(f"Linha de base gravada em {args.baseline}")
+    elif args.compare:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressões (tolerância {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"Sem regressões em relação a {args.baseline} (tolerância {args.tolerance:.0%})")
+
+if __name__ == '__main__':
+    main()
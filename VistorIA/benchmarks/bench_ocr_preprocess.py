@@ -0,0 +1,126 @@
+"""Pré-processamento para OCR: latência por página e acurácia do Tesseract.
+
+Compara o pré-processamento anterior (limiar fixo 127 + morfologia 1x1) com o
+pipeline atual de app/ocr.py. As páginas de teste são geradas (texto conhecido,
+iluminação irregular, inclinação e borda escura de scanner) ou lidas de um
+diretório com pares imagem + .txt com o texto esperado.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python VistorIA/benchmarks/bench_ocr_preprocess.py [--pages 6] [--rounds 3] [--fixtures DIR]
+
+A acurácia (similaridade de caracteres com o texto esperado) só é medida se o
+binário do Tesseract estiver instalado.
+"""
+import argparse
+import difflib
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix='vistoria_bench_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'bench.db')}")
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import pytesseract  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.ocr import OCR_LANG, enhance_image_for_ocr  # noqa: E402
+
+LINES = [
+    'CONTRATO DE LOCACAO RESIDENCIAL',
+    'Locador: Maria Aparecida da Silva',
+    'Locatario: Joao Pedro Souza',
+    'CPF: 123.456.789-00  RG: 12.345.678-9',
+    'Endereco: Rua das Flores, 123 - Apto 45',
+    'Valor do aluguel: R$ 2.350,00 mensais',
+    'Vigencia de 30 meses a partir de 01/02/2025',
+    'Telefone: (21) 98765-4321',
+]
+
+def legacy_enhance(image: Image.Image) -> Image.Image:
+    """Versão anterior de enhance_image_for_ocr, como referência"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    _, thresh = cv2.threshold(np.array(image), 127, 255, cv2.THRESH_BINARY)
+    kernel = np.ones((1, 1), np.uint8)
+    cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    return Image.fromarray(cleaned)
+
+def synthetic_page(seed: int) -> tuple:
+    """Página A4 a 300 DPI com texto conhecido e defeitos típicos de fotos/scans"""
+    rng = np.random.default_rng(seed)
+    height, width = 3508, 2480
+    page = np.full((height, width), 235, np.uint8)
+    for index, line in enumerate(LINES):
+        cv2.putText(page, line, (200, 400 + index * 160), cv2.FONT_HERSHEY_SIMPLEX, 2.2, 40, 5, cv2.LINE_AA)
+
+    # Iluminação irregular: gradiente diagonal escurecendo até ~45%
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    shade = 1.0 - 0.45 * (xx / width + yy / height) / 2
+    page = (page.astype(np.float32) * shade + rng.normal(0, 6, page.shape)).clip(0, 255).astype(np.uint8)
+
+    # Inclinação e borda escura do scanner
+    angle = float(rng.uniform(-6, 6))
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    page = cv2.warpAffine(page, matrix, (width, height), borderValue=235)
+    page[:, :60] = 20
+    page[-50:, :] = 20
+
+    image = Image.fromarray(page)
+    image.info['dpi'] = (300, 300)
+    return image, '\n'.join(LINES)
+
+def load_fixtures(directory: str) -> list:
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        base, ext = os.path.splitext(path)
+        if ext.lower() in ('.png', '.jpg', '.jpeg', '.tif', '.tiff') and os.path.exists(base + '.txt'):
+            with open(base + '.txt', encoding='utf-8') as expected:
+                fixtures.append((Image.open(path), expected.read()))
+    return fixtures
+
+def tesseract_available() -> bool:
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def similarity(recognized: str, expected: str) -> float:
+    normalize = lambda text: ' '.join(text.split()).lower()
+    return difflib.SequenceMatcher(None, normalize(recognized), normalize(expected)).ratio()
+
+def bench(name: str, enhance, fixtures: list, rounds: int, with_ocr: bool) -> None:
+    timings = []
+    for _ in range(rounds):
+        for image, _ in fixtures:
+            start = time.perf_counter()
+            enhance(image)
+            timings.append((time.perf_counter() - start) * 1000)
+    line = f"{name:>10}: {statistics.median(timings):7.1f} ms/página (mediana), {max(timings):7.1f} ms (máx.)"
+
+    if with_ocr:
+        scores = [similarity(pytesseract.image_to_string(enhance(image), lang=OCR_LANG), expected) for image, expected in fixtures]
+        line += f", acurácia {statistics.mean(scores) * 100:5.1f}%"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--fixtures', help='diretório com imagens e .txt do texto esperado')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else [synthetic_page(seed) for seed in range(args.pages)]
+    with_ocr = tesseract_available()
+    print(f"{len(fixtures)} páginas, {args.rounds} rodadas" + ("" if with_ocr else " (Tesseract não encontrado: só latência)"))
+
+    bench('anterior', legacy_enhance, fixtures, args.rounds, with_ocr)
+    bench('atual', enhance_image_for_ocr, fixtures, args.rounds, with_ocr)
+
+if __name__ == '__main__':
+    main()
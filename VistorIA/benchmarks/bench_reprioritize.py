@@ -0,0 +1,100 @@
+"""Repriorização em lote: itens/s e memória em tabelas grandes.
+
+Popula um banco SQLite temporário com N itens de checklist (com análises da
+IA, parte com arquivos ligados) e roda app/reprioritize.py, mostrando a taxa
+por bloco e o pico de memória alocada (tracemalloc), que deve ficar estável
+independente de N.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python VistorIA/benchmarks/bench_reprioritize.py [--rows 1000000] [--chunk-size 5000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+_db_dir = tempfile.mkdtemp(prefix='vistoria_bench_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'bench.db')}")
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import engine, create_tables, Inspection, ChecklistItem, InspectionFile  # noqa: E402
+from app.reprioritize import reprioritize_checklist_items  # noqa: E402
+
+ANALYSES = [
+    'Item em bom estado, sem observações relevantes.',
+    'Pequenos riscos na superfície, desgaste natural de uso.',
+    'Há vazamento na base e sinais de infiltração na parede ao lado.',
+    'Peça danificada, substituição recomendada.',
+    'Manchas de umidade próximas ao rodapé.',
+    'Não funciona ao acionar o interruptor.',
+]
+PRIORITIES = ['low', 'medium', 'high', 'critical']
+
+def populate(rows: int, batch: int = 20000) -> None:
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        inspections = max(1, rows // 100)
+        connection.execute(insert(Inspection), [
+            {'property_address': f'Rua Benchmark, {i}', 'landlord_name': 'L', 'tenant_name': 'T'} for i in range(inspections)
+        ])
+    for offset in range(0, rows, batch):
+        with engine.begin() as connection:
+            size = min(batch, rows - offset)
+            connection.execute(insert(ChecklistItem), [
+                {
+                    'inspection_id': (offset + i) // 100 + 1, 'room': f'comodo{(offset + i) % 7}', 'item': f'item{offset + i}',
+                    'status': 'ok', 'ai_analysis': rng.choice(ANALYSES), 'priority': rng.choice(PRIORITIES)
+                }
+                for i in range(size)
+            ])
+            # Um arquivo com análise a cada dez itens
+            connection.execute(insert(InspectionFile), [
+                {
+                    'inspection_id': (offset + i) // 100 + 1, 'checklist_item_id': offset + i + 1, 'file_type': 'photo',
+                    'file_path': f'/tmp/{offset + i}.jpg', 'ai_analysis': rng.choice(ANALYSES)
+                }
+                for i in range(0, size, 10)
+            ])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    create_tables()
+    start = time.perf_counter()
+    populate(args.rows)
+    print(f"{args.rows:,} itens gravados em {time.perf_counter() - start:.1f}s")
+
+    reports = max(1, args.rows // args.chunk_size // 10)
+
+    def report(progress):
+        if (progress['scanned'] // args.chunk_size) % reports == 0:
+            rate = progress['scanned'] / progress['elapsed']
+            line = f"{progress['scanned']:>10,} itens  {rate:>10,.0f} itens/s"
+            if tracemalloc.is_tracing():
+                line += f"  pico {tracemalloc.get_traced_memory()[1] / 1024 / 1024:6.1f} MB"
+            print(line)
+
+    # Memória: passada sem gravar, com tracemalloc (que deixa o Python bem mais lento)
+    print("Memória (--dry-run, com tracemalloc):")
+    tracemalloc.start()
+    reprioritize_checklist_items(args.chunk_size, dry_run=True, on_chunk=report)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("Velocidade:")
+    stats = reprioritize_checklist_items(args.chunk_size, on_chunk=report)
+    print(f"Concluído: {stats['rows_per_second']:,.0f} itens/s, {stats['changed']:,} alterados, "
+          f"pico de memória {peak / 1024 / 1024:.1f} MB")
+
+    # Segunda passada: nada muda, mede só leitura + regras
+    stats = reprioritize_checklist_items(args.chunk_size)
+    print(f"Sem mudanças: {stats['rows_per_second']:,.0f} itens/s, {stats['changed']:,} alterados")
+
+if __name__ == '__main__':
+    main()
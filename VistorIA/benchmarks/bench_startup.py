@@ -0,0 +1,74 @@
+"""Tempo de subida de um worker da API: inicialização no import vs. verificação de versão.
+
+Cada amostra é um processo Python novo (como um worker do uvicorn) que importa
+app.main e executa o lifespan. "antigo" refaz create_tables() e
+init_default_data() como o import fazia; "atual" só confere a versão do
+esquema. Também sobe --workers processos ao mesmo tempo num banco vazio para
+conferir que só um deles inicializa.
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python VistorIA/benchmarks/bench_startup.py [--samples 5] [--workers 4]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Mede import + lifespan; "antigo" acrescenta o trabalho que o import fazia
+WORKER = """
+import os, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+if os.environ.get('BENCH_LEGACY'):
+    from app.database import create_tables, init_default_data
+    create_tables()
+    init_default_data()
+else:
+    from app.database import init_database
+    print('ran' if init_database() else 'skipped', flush=True)
+done = time.perf_counter()
+print(f"{imported - start:.4f} {done - imported:.4f}")
+"""
+
+def _spawn(env):
+    return subprocess.Popen([sys.executable, '-c', WORKER], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+
+def _timings(process):
+    output = process.communicate()[0].strip().splitlines()
+    if process.returncode != 0 or not output:
+        raise RuntimeError(f"Worker falhou (código {process.returncode})")
+    import_time, init_time = map(float, output[-1].split())
+    return import_time, init_time, output[:-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4, help='workers simultâneos num banco vazio')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='vistoria_startup_')
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'bench'),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               DB_INIT_LOCK_FILE=os.path.join(workdir, 'init.lock'))
+    
+    # Banco vazio, vários workers ao mesmo tempo: um inicializa, os outros esperam o lock
+    processes = [_spawn(env) for _ in range(args.workers)]
+    results = [_timings(process) for process in processes]
+    ran = sum(1 for _, _, flags in results if 'ran' in flags)
+    print(f"{args.workers} workers simultâneos num banco vazio: {ran} inicializou, "
+          f"{args.workers - ran} encontraram o banco pronto "
+          f"(maior inicialização {max(init for _, init, _ in results) * 1000:.0f} ms)")
+    
+    print(f"{'modo':<8}{'import ms':>12}{'inicialização ms':>20}{'total ms':>12}")
+    for name, extra in (('antigo', {'BENCH_LEGACY': '1'}), ('atual', {})):
+        samples = [_timings(_spawn(dict(env, **extra)))[:2] for _ in range(args.samples)]
+        import_ms = statistics.median(s[0] for s in samples) * 1000
+        init_ms = statistics.median(s[1] for s in samples) * 1000
+        print(f"{name:<8}{import_ms:>12.0f}{init_ms:>20.1f}{import_ms + init_ms:>12.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Detecção de comandos de voz, campos de documentos e prioridade de reparo.
+
+Compara as versões anteriores (dicionário de padrões montado e recompilado a
+cada chamada, uma varredura por padrão) com os matchers pré-compilados de
+app/ai_services.py e app/priority.py, numa transcrição sintética de ~30
+minutos de fala, num texto de OCR de várias páginas e em análises da IA.
+Antes de medir, confere a prioridade de frases com plural, feminino e
+conjugação das palavras-chave (sai com erro se alguma divergir).
+
+Uso (a partir da raiz do repositório):
+    PYTHONPATH=VistorIA python VistorIA/benchmarks/bench_text_matchers.py [--minutes 30] [--rounds 5]
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix='vistoria_bench_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'bench.db')}")
+
+from app.ai_services import detect_voice_commands, extract_document_info  # noqa: E402
+from app.priority import REPAIR_PRIORITY_KEYWORDS, determine_repair_priority  # noqa: E402
+
+WORDS_PER_MINUTE = 150
+
+SPEECH = [
+    'agora estamos na sala e vamos começar a vistoria',
+    'a parede tem algumas marcas de uso normal',
+    'marcar torneira da cozinha como danificado',
+    'o piso do banheiro está sujo',
+    'próximo cômodo',
+    'observação: verificar infiltração perto da janela',
+    'a janela abre e fecha sem problemas',
+    'o inquilino informou que o chuveiro foi trocado no ano passado',
+    'marca a porta como ok',
+    'a tomada ao lado da cama está ausente',
+    'vamos avançar para a área de serviço',
+    'nota: fotografar o rodapé descascado',
+]
+
+DOCUMENT = [
+    'CONTRATO DE LOCAÇÃO RESIDENCIAL',
+    'Nome: Maria Aparecida da Silva',
+    'CPF: 123.456.789-00 RG: 12.345.678-9',
+    'Telefone: (21) 98765-4321 e-mail: maria.silva@example.com',
+    'Endereço: Rua das Flores, 123 - Apto 45 - CEP 20040-020',
+    'Cláusula 4ª. O valor do aluguel será reajustado anualmente pelo IGP-M.',
+    'O locatário se obriga a devolver o imóvel nas mesmas condições em que o recebeu.',
+]
+
+# Frase -> prioridade esperada (flexões das palavras-chave)
+PRIORITY_CASES = {
+    'Há vazamentos na pia': 'critical',
+    'azulejos quebrados': 'critical',
+    'porta quebrada e janelas quebradas': 'critical',
+    'as tomadas não funcionam': 'critical',
+    'Infiltrações no teto': 'critical',
+    'rachaduras estruturais na viga': 'critical',
+    'situação perigosa': 'critical',
+    'piso danificados': 'high',
+    'parede danificada': 'high',
+    'peças deterioradas': 'high',
+    'trocas necessárias': 'high',
+    'reparos urgentes': 'high',
+    'riscos leves na bancada': 'medium',
+    'mancha de desgastes': 'medium',
+    'porta riscada': 'low',
+    'tudo em ordem': 'low',
+}
+
+ANALYSES = [
+    'Item em bom estado, sem observações relevantes, limpo e funcionando normalmente.',
+    'Pequenos riscos na superfície, desgaste natural de uso, sem necessidade de reparo.',
+    'Há vazamentos na base e sinais de infiltração na parede ao lado do armário.',
+    'Peça danificada, substituição recomendada pelo técnico responsável.',
+]
+
+def legacy_determine_repair_priority(analysis: str) -> str:
+    """Versão anterior de determine_repair_priority (substring por palavra-chave), como referência"""
+    analysis_lower = analysis.lower()
+    for level in ('critical', 'high', 'medium'):
+        if any(keyword in analysis_lower for keyword in REPAIR_PRIORITY_KEYWORDS[level]):
+            return level
+    return 'low'
+
+def check_priority_cases() -> None:
+    wrong = {
+        text: (expected, determine_repair_priority(text))
+        for text, expected in PRIORITY_CASES.items()
+        if determine_repair_priority(text) != expected
+    }
+    for text, (expected, got) in wrong.items():
+        print(f"  prioridade de {text!r}: esperado {expected}, obtido {got}")
+    if wrong:
+        raise SystemExit(f"{len(wrong)} de {len(PRIORITY_CASES)} frases com prioridade divergente")
+    print(f"Prioridade de reparo: {len(PRIORITY_CASES)} frases com flexões conferidas")
+
+def legacy_detect_voice_commands(text: str) -> list:
+    """Versão anterior de detect_voice_commands, como referência"""
+    commands = []
+    text_lower = text.lower()
+    command_patterns = {
+        'marcar_status': {
+            'patterns': [r'marcar?\s+(.+?)\s+como\s+(ok|danificado|sujo|ausente)',
+                         r'(.+?)\s+está\s+(ok|danificado|sujo|ausente)'],
+            'action': 'set_status'
+        },
+        'proximo_comodo': {
+            'patterns': [r'próximo\s+cômodo', r'próxima\s+sala', r'avançar'],
+            'action': 'next_room'
+        },
+        'adicionar_observacao': {
+            'patterns': [r'observação:\s*(.+)', r'anotar:\s*(.+)', r'nota:\s*(.+)'],
+            'action': 'add_note'
+        }
+    }
+    for command_type, config in command_patterns.items():
+        for pattern in config['patterns']:
+            matches = re.findall(pattern, text_lower)
+            if matches:
+                commands.append({'type': command_type, 'action': config['action'], 'matches': matches})
+    return commands
+
+def legacy_extract_document_info(text: str) -> dict:
+    """Versão anterior de extract_document_info, como referência"""
+    info = {}
+    patterns = {
+        'cpf': r'\d{3}\.?\d{3}\.?\d{3}-?\d{2}',
+        'rg': r'\d{1,2}\.?\d{3}\.?\d{3}-?[0-9X]',
+        'telefone': r'\(?(\d{2})\)?\s*\d{4,5}-?\d{4}',
+        'email': r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
+        'cep': r'\d{5}-?\d{3}',
+        'nome': r'(?:NOME|Nome):\s*([A-ZÁÊÂÔÇÕ][a-záêâôçõ\s]+)'
+    }
+    for field, pattern in patterns.items():
+        matches = re.findall(pattern, text)
+        if matches:
+            info[field] = matches
+    return info
+
+def transcript(minutes: int, seed: int = 0) -> str:
+    """Transcrição como a do Whisper: uma linha só, frases separadas por ponto"""
+    rng = random.Random(seed)
+    sentences, words = [], 0
+    while words < minutes * WORDS_PER_MINUTE:
+        sentence = rng.choice(SPEECH)
+        sentences.append(sentence.capitalize())
+        words += len(sentence.split())
+    return '. '.join(sentences) + '.'
+
+def timed(function, text: str, rounds: int) -> tuple:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+def compare(label: str, legacy, current, text: str, rounds: int, count) -> None:
+    legacy_ms, legacy_result = timed(legacy, text, rounds)
+    current_ms, current_result = timed(current, text, rounds)
+    print(f"{label} ({len(text):,} caracteres)")
+    print(f"  anterior: {legacy_ms:9.2f} ms  ({count(legacy_result)} ocorrências)")
+    print(f"     atual: {current_ms:9.2f} ms  ({count(current_result)} ocorrências)  {legacy_ms / current_ms:6.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=int, default=30)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    check_priority_cases()
+    count_commands = lambda commands: sum(len(command['matches']) for command in commands)
+    count_fields = lambda info: sum(len(values) for values in info.values())
+
+    # Numa linha só, a versão anterior termina cedo porque "nota: (.+)" consome o
+    # resto da transcrição (e perde os comandos seguintes); com uma frase por
+    # linha as duas encontram as mesmas ocorrências
+    text = transcript(args.minutes)
+    compare(f"Comandos de voz, transcrição de {args.minutes} min em uma linha", legacy_detect_voice_commands,
+            detect_voice_commands, text, args.rounds, count_commands)
+    compare(f"Comandos de voz, transcrição de {args.minutes} min, uma frase por linha", legacy_detect_voice_commands,
+            detect_voice_commands, text.replace('. ', '.\n'), args.rounds, count_commands)
+    compare("Campos de documento, 50 páginas de OCR", legacy_extract_document_info, extract_document_info,
+            '\f'.join('\n'.join(DOCUMENT * 6) for _ in range(50)), args.rounds, count_fields)
+    rng = random.Random(0)
+    analyses = '\n'.join(rng.choice(ANALYSES) for _ in range(20000))
+    compare("Prioridade de reparo, 20.000 análises (uma por linha)",
+            lambda text: [legacy_determine_repair_priority(line) for line in text.split('\n')],
+            lambda text: [determine_repair_priority(line) for line in text.split('\n')],
+            analyses, args.rounds, lambda priorities: sum(priority != 'low' for priority in priorities))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Servidor local que imita a API da OpenAI, para benchmarks e desenvolvimento sem chave.
+
+Atende /v1/chat/completions e /v1/audio/transcriptions com latência, taxa de
+erro e respostas configuráveis. Para apontar a API para ele:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake
+
+Uso (a partir da raiz do repositório):
+    python VistorIA/benchmarks/fake_openai.py [--port 8900] [--latency-ms 800] [--jitter-ms 200]
+        [--error-rate 0.0] [--error-status 500] [--responses respostas.json]
+
+O arquivo de respostas (opcional) é um JSON com as chaves "chat", "detection"
+(lista de itens, usada quando o prompt pede um array JSON) e "transcription".
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DEFAULT_RESPONSES = {
+    'chat': ('O item apresenta desgaste natural de uso, com pequenas manchas na superfície. '
+             'Não há sinais de vazamento ou infiltração. Estado geral: bom.'),
+    'detection': ['pia', 'torneira', 'azulejo', 'piso', 'armário', 'tomadas'],
+    'transcription': 'Marcar torneira da cozinha como danificado. Próximo cômodo.',
+}
+
+def create_app(latency_ms: float = 800, jitter_ms: float = 200, error_rate: float = 0.0,
+               error_status: int = 500, responses: dict = None, seed: int = None) -> FastAPI:
+    """App FastAPI do servidor falso (também usado em processo pelos benchmarks)"""
+    app = FastAPI(title="OpenAI falso")
+    canned = dict(DEFAULT_RESPONSES, **(responses or {}))
+    rng = random.Random(seed)
+    app.state.calls = {'chat': 0, 'transcription': 0, 'errors': 0}
+
+    async def simulate():
+        """Latência normal (média ± jitter) e erro com a probabilidade configurada"""
+        await asyncio.sleep(max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000)
+        if rng.random() < error_rate:
+            app.state.calls['errors'] += 1
+            return JSONResponse(
+                status_code=error_status,
+                content={'error': {'message': 'erro simulado', 'type': 'server_error', 'code': None}}
+            )
+        return None
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        app.state.calls['chat'] += 1
+        body = await request.json()
+        error = await simulate()
+        if error:
+            return error
+
+        prompt = json.dumps(body.get('messages', []), ensure_ascii=False)
+        content = json.dumps(canned['detection'], ensure_ascii=False) if 'array JSON' in prompt else canned['chat']
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o-mini'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+    @app.post('/v1/audio/transcriptions')
+    async def audio_transcriptions(request: Request):
+        app.state.calls['transcription'] += 1
+        await request.body()
+        error = await simulate()
+        if error:
+            return error
+        return {'text': canned['transcription']}
+
+    @app.get('/calls')
+    async def calls():
+        """Contadores de chamadas (para conferir o que o benchmark gerou)"""
+        return app.state.calls
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--jitter-ms', type=float, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--responses', help='JSON com respostas (chat, detection, transcription)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding='utf-8') as f:
+            responses = json.load(f)
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, responses, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
@@ -17,18 +17,26 @@ if pgrep -f "celery.*worker" > /dev/null; then
     sleep 2
 fi
 
-# Iniciar Celery worker em background
-echo "🔄 Iniciando Celery worker..."
-celery -A app.background_tasks worker --loglevel=info --detach
-
-# Aguardar um momento para o worker inicializar
+# Criar/atualizar o banco uma vez, antes de subir workers e API
+echo "💾 Preparando banco de dados..."
+python -m app.init_db
+
+# Iniciar Celery workers em background (um perfil por tipo de carga)
+echo "🔄 Iniciando Celery workers..."
+# OCR: pesado em CPU, um processo por núcleo
+celery -A app.background_tasks worker -Q cpu -n cpu@%h --pool prefork \
+    --concurrency "${CELERY_CPU_CONCURRENCY:-$(nproc)}" --loglevel=info --detach
+# Chamadas à API e consultas curtas: limitadas por I/O, muitas threads
+celery -A app.background_tasks worker -Q io,quick -n io@%h --pool threads \
+    --concurrency "${CELERY_IO_CONCURRENCY:-16}" --loglevel=info --detach
+
+# Aguardar um momento para os workers inicializarem
 sleep 3
 
 # Iniciar servidor FastAPI
 echo "🚀 Iniciando servidor VistorIA..."
 echo "📱 Interface: http://localhost:8000/vistoria"
 echo "📚 API Docs: http://localhost:8000/docs"
-echo "💾 Banco de dados será criado automaticamente"
 echo ""
 echo "Para parar o sistema, pressione Ctrl+C"
 echo ""